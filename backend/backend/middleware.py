@@ -1,7 +1,13 @@
 import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.conf import settings
+from django.http import JsonResponse
 from django.middleware.csrf import CsrfViewMiddleware
 
+from sweetapp.admission import CHAT, PRIORITY, AdmissionRejected, get_admission_controller
+
 
 class CSRFExemptMiddleware(CsrfViewMiddleware):
     """
@@ -17,4 +23,130 @@ class CSRFExemptMiddleware(CsrfViewMiddleware):
                     return None
         
         # For all other requests, use the default CSRF processing
-        return super().process_view(request, callback, callback_args, callback_kwargs)
\ No newline at end of file
+        return super().process_view(request, callback, callback_args, callback_kwargs)
+
+class AdmissionMiddleware:
+    """
+    Admission control by URL class (see sweetapp.admission)
+
+    Requests matching ADMISSION_CHAT_URLS take a chat slot or get a 503 with
+    Retry-After; requests matching ADMISSION_PRIORITY_URLS are counted so chat
+    yields to them. Streamed responses keep their slot until the stream ends.
+    Placed before the session middleware so shed requests cost almost nothing.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.chat_urls = [re.compile(p) for p in getattr(settings, 'ADMISSION_CHAT_URLS', [])]
+        self.priority_urls = [re.compile(p) for p in getattr(settings, 'ADMISSION_PRIORITY_URLS', [])]
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _classify(self, path):
+        if any(p.match(path) for p in self.chat_urls):
+            return CHAT
+        if any(p.match(path) for p in self.priority_urls):
+            return PRIORITY
+        return None
+
+    def _shed(self, rejected):
+        response = JsonResponse(
+            {
+                'error': 'The chat assistant is busy right now, please try again shortly',
+                'code': 'overloaded',
+                'reason': rejected.reason,
+                'retry_after': rejected.retry_after,
+            },
+            status=503,
+        )
+        response['Retry-After'] = str(rejected.retry_after)
+        return response
+
+    def _releaser(self, kind):
+        controller = get_admission_controller()
+        started = time.monotonic()
+        released = []
+
+        def release():
+            if released:
+                return
+            released.append(True)
+            if kind == CHAT:
+                controller.release_chat(time.monotonic() - started)
+            else:
+                controller.release_priority()
+
+        return release
+
+    def _hold_until_streamed(self, response, release):
+        """Release when the response is done: after the stream for streaming responses"""
+        if not response.streaming:
+            release()
+        elif response.is_async:
+            response.streaming_content = _arelease_after(response.streaming_content, release)
+        else:
+            response.streaming_content = _release_after(response.streaming_content, release)
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        kind = self._classify(request.path)
+        if kind is None:
+            return self.get_response(request)
+
+        controller = get_admission_controller()
+        if kind == CHAT:
+            try:
+                controller.acquire_chat()
+            except AdmissionRejected as rejected:
+                return self._shed(rejected)
+        else:
+            controller.acquire_priority()
+        release = self._releaser(kind)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            release()
+            raise
+        return self._hold_until_streamed(response, release)
+
+    async def __acall__(self, request):
+        kind = self._classify(request.path)
+        if kind is None:
+            return await self.get_response(request)
+
+        controller = get_admission_controller()
+        if kind == CHAT:
+            try:
+                # Queue waits block, so keep them off the event loop
+                await sync_to_async(controller.acquire_chat, thread_sensitive=False)()
+            except AdmissionRejected as rejected:
+                return self._shed(rejected)
+        else:
+            controller.acquire_priority()
+        release = self._releaser(kind)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            release()
+            raise
+        return self._hold_until_streamed(response, release)
+
+
+def _release_after(chunks, release):
+    try:
+        yield from chunks
+    finally:
+        release()
+
+
+async def _arelease_after(chunks, release):
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        release()
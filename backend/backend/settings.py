@@ -34,6 +34,65 @@ ALLOWED_HOSTS = ['localhost', '127.0.0.1', '0.0.0.0']
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
 
+# Chat assistant provider routing
+CHAT_PROVIDER_KEY_STRATEGY = config('CHAT_PROVIDER_KEY_STRATEGY', default='round_robin')  # round_robin or least_used across <PROVIDER>_API_KEYS
+CHAT_PROVIDER_RELOAD_SECONDS = config('CHAT_PROVIDER_RELOAD_SECONDS', default=5, cast=int)  # How often backend/.env is checked for changes
+CHAT_PROVIDER_FAILOVER = config('CHAT_PROVIDER_FAILOVER', default=True, cast=bool)  # Fail over on 429/5xx/timeouts
+CHAT_HEDGE_REQUESTS = config('CHAT_HEDGE_REQUESTS', default=False, cast=bool)  # Hedge slow streams with a second provider
+CHAT_HEDGE_DEFAULT_DELAY = config('CHAT_HEDGE_DEFAULT_DELAY', default=3.0, cast=float)  # Seconds, until p95 TTFT is known
+CHAT_PROVIDER_RATE_PER_MINUTE = config('CHAT_PROVIDER_RATE_PER_MINUTE', default=20, cast=int)  # Token bucket refill per provider/key
+CHAT_PROVIDER_BURST = config('CHAT_PROVIDER_BURST', default=5, cast=int)  # Token bucket capacity
+CHAT_PROVIDER_LIMITS_SHARED = config('CHAT_PROVIDER_LIMITS_SHARED', default=False, cast=bool)  # Share limits/breakers across workers via the cache
+CHAT_PROVIDER_LIMITS_CACHE = config('CHAT_PROVIDER_LIMITS_CACHE', default='sessions')  # Cache alias for shared limits; must not be locmem
+CHAT_BREAKER_THRESHOLD = config('CHAT_BREAKER_THRESHOLD', default=3, cast=int)  # Consecutive failures before the breaker opens
+CHAT_BREAKER_COOLDOWN = config('CHAT_BREAKER_COOLDOWN', default=30, cast=int)  # Seconds before a half-open probe
+CHAT_PROMPT_TOKEN_BUDGET = config('CHAT_PROMPT_TOKEN_BUDGET', default=3000, cast=int)  # Total prompt tokens (instructions + context + FAQ + history)
+CHAT_SSE_COALESCE_MS = config('CHAT_SSE_COALESCE_MS', default=0, cast=int)  # Merge token deltas into frames every N ms (0 = one frame per delta)
+CHAT_SSE_COALESCE_CHARS = config('CHAT_SSE_COALESCE_CHARS', default=64, cast=int)  # Flush a coalesced frame early at this many characters
+CHAT_STREAM_MAX_SECONDS = config('CHAT_STREAM_MAX_SECONDS', default=60, cast=int)  # Hard cap on one streamed answer
+CHAT_STREAM_RESUME = config('CHAT_STREAM_RESUME', default=True, cast=bool)  # Buffer replies of clients sending "resumable": true so they can resume with Last-Event-ID
+CHAT_STREAM_REPLAY_TTL = config('CHAT_STREAM_REPLAY_TTL', default=120, cast=int)  # Seconds a finished reply stays resumable
+CHAT_STREAM_REPLAY_MAX_FRAMES = config('CHAT_STREAM_REPLAY_MAX_FRAMES', default=4000, cast=int)  # Frames buffered per reply
+CHAT_STREAM_RESUME_GRACE = config('CHAT_STREAM_RESUME_GRACE', default=20, cast=int)  # Seconds a reply keeps generating with no client attached
+CHAT_SINGLE_FLIGHT = config('CHAT_SINGLE_FLIGHT', default=True, cast=bool)  # Identical in-flight searches, intent calls and replies are computed once per worker
+CHAT_REQUEST_DEADLINE_SECONDS = config('CHAT_REQUEST_DEADLINE_SECONDS', default=90, cast=int)  # Whole chat request, including the intent call and the stream
+CHAT_STREAM_MAX_TOKENS = config('CHAT_STREAM_MAX_TOKENS', default=400, cast=int)  # Stop streaming after this many completion tokens
+CHAT_TOKEN_BUDGET_DAILY = config('CHAT_TOKEN_BUDGET_DAILY', default=0, cast=int)  # Prompt + completion tokens per API key per day (0 = no budget)
+CHAT_TOKEN_BUDGET_ECONOMY_AT = config('CHAT_TOKEN_BUDGET_ECONOMY_AT', default=0.8, cast=float)  # Share of the budget after which a key runs in economy mode
+CHAT_ECONOMY_MAX_TOKENS = config('CHAT_ECONOMY_MAX_TOKENS', default=200, cast=int)  # Reply max_tokens in economy mode
+CHAT_ECONOMY_INTENT_THRESHOLD = config('CHAT_ECONOMY_INTENT_THRESHOLD', default=0.5, cast=float)  # Local intent probability accepted in economy mode (no AI intent call)
+CHAT_TOKEN_USAGE_MERGE_SECONDS = config('CHAT_TOKEN_USAGE_MERGE_SECONDS', default=60, cast=int)  # How often a worker merges its token counts into the table
+OPENROUTER_API_URL = config('OPENROUTER_API_URL', default='https://openrouter.ai/api/v1/chat/completions')  # Point at `manage.py mock_llm_server` for load tests
+CEREBRAS_API_URL = config('CEREBRAS_API_URL', default='https://api.cerebras.ai/v1/chat/completions')
+CHAT_LOG_ENABLED = config('CHAT_LOG_ENABLED', default=True, cast=bool)  # Record chat turns for analytics
+CHAT_LOG_BATCH_SIZE = config('CHAT_LOG_BATCH_SIZE', default=50, cast=int)  # Turns per bulk insert
+CHAT_LOG_FLUSH_SECONDS = config('CHAT_LOG_FLUSH_SECONDS', default=2.0, cast=float)  # Max delay before a partial batch is written
+CHAT_LOG_QUEUE_SIZE = config('CHAT_LOG_QUEUE_SIZE', default=5000, cast=int)  # Turns held in memory before new ones are dropped
+CHAT_LOG_RETENTION_DAYS = config('CHAT_LOG_RETENTION_DAYS', default=90, cast=int)  # Used by `manage.py prune_chat_turns`
+CHAT_LOG_MAX_ROWS = config('CHAT_LOG_MAX_ROWS', default=200000, cast=int)  # Newest turns kept by `manage.py prune_chat_turns`
+CHAT_SKETCH_CAPACITY = config('CHAT_SKETCH_CAPACITY', default=64, cast=int)  # Top-K candidates tracked per kind in each worker
+CHAT_SKETCH_MERGE_SECONDS = config('CHAT_SKETCH_MERGE_SECONDS', default=60, cast=int)  # How often a worker merges its counts into the table
+CHAT_SKETCH_TABLE_SIZE = config('CHAT_SKETCH_TABLE_SIZE', default=100, cast=int)  # Keys kept per kind and day in the table
+CHAT_CONVERSATION_MAX_TURNS = config('CHAT_CONVERSATION_MAX_TURNS', default=12, cast=int)  # Turns kept verbatim per conversation
+CHAT_CONVERSATION_TTL = config('CHAT_CONVERSATION_TTL', default=86400, cast=int)  # Seconds an idle conversation is kept in the cache
+CHAT_CONVERSATION_SUMMARY_TOKENS = config('CHAT_CONVERSATION_SUMMARY_TOKENS', default=250, cast=int)  # Size cap of the rolling summary of older turns
+CHAT_CONVERSATION_CACHE = config('CHAT_CONVERSATION_CACHE', default='sessions')  # Cache alias for conversations; shared by all workers
+CHAT_FAQ_INDEX_CHECK_SECONDS = config('CHAT_FAQ_INDEX_CHECK_SECONDS', default=30, cast=int)  # How often each worker checks for FAQ edits made elsewhere
+CHAT_FAQ_EMBEDDINGS = config('CHAT_FAQ_EMBEDDINGS', default=False, cast=bool)  # Also match FAQ questions by embedding similarity
+CHAT_FAQ_EMBEDDING_WEIGHT = config('CHAT_FAQ_EMBEDDING_WEIGHT', default=4.0, cast=float)  # Score added per unit of question similarity
+CHAT_FAQ_MIN_SIMILARITY = config('CHAT_FAQ_MIN_SIMILARITY', default=0.45, cast=float)  # Ignore weaker question similarities
+CHAT_PRODUCT_MENTIONS = config('CHAT_PRODUCT_MENTIONS', default=True, cast=bool)  # Send product_mention events for catalog names in streamed replies
+CHAT_PRODUCT_MENTION_CHECK_SECONDS = config('CHAT_PRODUCT_MENTION_CHECK_SECONDS', default=30, cast=int)  # How often each worker checks for catalog edits made elsewhere
+CHAT_WS_ENABLED = config('CHAT_WS_ENABLED', default=True, cast=bool)  # WebSocket chat transport (ASGI only)
+CHAT_WS_PATH = config('CHAT_WS_PATH', default='/api/chat/ws/')
+CHAT_WS_PING_SECONDS = config('CHAT_WS_PING_SECONDS', default=20, cast=int)  # Ping a socket that has been quiet this long
+CHAT_WS_IDLE_SECONDS = config('CHAT_WS_IDLE_SECONDS', default=60, cast=int)  # Close a socket that sent nothing (not even a pong) this long
+CHAT_WS_SEND_QUEUE = config('CHAT_WS_SEND_QUEUE', default=64, cast=int)  # Frames buffered per socket before streaming pauses
+CHAT_TEMPLATE_REPLIES = config('CHAT_TEMPLATE_REPLIES', default=True, cast=bool)  # Render list/cart/checkout/product-info replies without the LLM
+CHAT_INTENT_LOCAL_ENABLED = config('CHAT_INTENT_LOCAL_ENABLED', default=True, cast=bool)  # Try the local embedding classifier before the remote one
+CHAT_INTENT_LOCAL_THRESHOLD = config('CHAT_INTENT_LOCAL_THRESHOLD', default=0.8, cast=float)  # Min probability to trust a local intent
+CHAT_INTENT_MODEL_PATH = config('CHAT_INTENT_MODEL_PATH', default='')  # Trained head (default: sweetapp/data/intent_head.npz)
+
 
 # Application definition
 
@@ -51,6 +110,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'backend.middleware.AdmissionMiddleware',  # Chat concurrency limit; before sessions so shedding is cheap
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,11 +144,13 @@ CORS_ALLOWED_HEADERS = [
     'cookie',
     'set-cookie',
     'cache-control',  # For SSE streaming
+    'last-event-id',  # Resuming a dropped chat stream
     'x-accel-buffering',  # For streaming responses
 ]
 
 CORS_EXPOSE_HEADERS = [
     'set-cookie',
+    'x-chat-stream-id',
 ]
 
 # Authentication and session settings
@@ -104,10 +166,39 @@ SESSION_COOKIE_DOMAIN = None  # Allow for localhost
 SESSION_COOKIE_NAME = 'sessionid'  # Explicit session cookie name
 SESSION_COOKIE_PATH = '/'  # Explicit path
 SESSION_SAVE_EVERY_REQUEST = True  # Ensure session is saved on every request
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'  # Use database sessions
+SESSION_ENGINE = 'sweetapp.session_backend'  # Cached sessions, written to the database only on change
+SESSION_CACHE_ALIAS = 'sessions'
+SESSION_WRITE_INTERVAL = config('SESSION_WRITE_INTERVAL', default=300, cast=int)  # Seconds an unchanged session may go without a database write
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False  # Keep session alive
 SESSION_COOKIE_AGE = 86400  # 24 hours
 
+# Caches. Sessions need a cache every worker sees: 'file' works for several
+# workers on one host, 'locmem' only for a single process, and a redis:// URL
+# (Redis or a compatible server such as Valkey; needs the redis package) for
+# several hosts.
+SESSION_CACHE = config('SESSION_CACHE', default='file')
+# Culling limit for the local backends only; RedisCache hands OPTIONS to redis-py, which rejects MAX_ENTRIES
+_session_cache_options = {'MAX_ENTRIES': config('SESSION_CACHE_MAX_ENTRIES', default=20000, cast=int)}
+if SESSION_CACHE.startswith(('redis://', 'rediss://', 'unix://')):
+    _session_cache = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': SESSION_CACHE}
+elif SESSION_CACHE == 'locmem':
+    _session_cache = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+        'OPTIONS': _session_cache_options,
+    }
+else:
+    _session_cache = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(BASE_DIR / '.cache' / 'sessions'),
+        'OPTIONS': _session_cache_options,
+    }
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'sessions': _session_cache,
+}
+
 # CSRF settings
 CSRF_COOKIE_SAMESITE = None  # Important: Allow cross-site requests for CORS
 CSRF_COOKIE_SECURE = False
@@ -132,6 +223,21 @@ CSRF_EXEMPT_URLS = [
     r'^/api/cms/',  # Exempt CMS endpoints (FAQ, About Us, etc.)
 ]
 
+# Admission control (backend.middleware.AdmissionMiddleware)
+ADMISSION_SLOTS = config('ADMISSION_SLOTS', default=24, cast=int)  # Requests the server runs at once; match the worker thread count
+ADMISSION_RESERVED_SLOTS = config('ADMISSION_RESERVED_SLOTS', default=4, cast=int)  # Slots chat streams may never take
+CHAT_ADMISSION_QUEUE = config('CHAT_ADMISSION_QUEUE', default=32, cast=int)  # Chat requests allowed to wait for a slot
+CHAT_ADMISSION_QUEUE_SECONDS = config('CHAT_ADMISSION_QUEUE_SECONDS', default=3.0, cast=float)  # Longest wait before a 503
+ADMISSION_CHAT_URLS = [
+    r'^/api/chat/stream/$',
+]
+ADMISSION_PRIORITY_URLS = [
+    r'^/api/(takeaway/)?create-payment-intent/',
+    r'^/api/orders/',
+    r'^/api/takeaway/(create-order|orders)/',
+    r'^/api/admin/orders/',
+]
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -4,7 +4,7 @@ from .models import (
     CustomerTestimonial, ChefRecommendation, ContactSubmission,
     AboutUsPage, AboutUsValue, AboutUsTeamMember,
     OurStoryPage, StoryTimeline, StoryImpact,
-    FAQPage, FAQCategory, FAQItem
+    FAQPage, FAQCategory, FAQItem, ChatTurn, ChatHeavyHitter, TokenUsage
 )
 
 class UserTypeFilter(admin.SimpleListFilter):
@@ -445,3 +445,27 @@ class FAQItemAdmin(admin.ModelAdmin):
     )
     
     readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(ChatTurn)
+class ChatTurnAdmin(admin.ModelAdmin):
+    list_display = ('message', 'intent', 'action', 'provider', 'outcome', 'response_time_ms', 'created_at')
+    list_filter = ('intent', 'intent_source', 'action', 'provider', 'outcome', 'created_at')
+    search_fields = ('message', 'response', 'session_key')
+    date_hierarchy = 'created_at'
+    readonly_fields = [field.name for field in ChatTurn._meta.fields]
+
+
+@admin.register(ChatHeavyHitter)
+class ChatHeavyHitterAdmin(admin.ModelAdmin):
+    list_display = ('key', 'kind', 'count', 'day')
+    list_filter = ('kind', 'day')
+    search_fields = ('key',)
+
+
+@admin.register(TokenUsage)
+class TokenUsageAdmin(admin.ModelAdmin):
+    list_display = ('day', 'provider', 'model', 'key', 'purpose', 'intent', 'calls', 'prompt_tokens', 'completion_tokens')
+    list_filter = ('day', 'provider', 'purpose', 'intent')
+    search_fields = ('model', 'key')
+    readonly_fields = [field.name for field in TokenUsage._meta.fields]
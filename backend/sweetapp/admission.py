@@ -0,0 +1,173 @@
+"""
+Admission control for Sweet Dessert Chat Assistant
+Chat streams hold a worker thread and a provider connection for many
+seconds, so a burst of chat traffic could take every thread and leave
+checkout waiting. Chat requests are admitted up to a concurrency limit, wait
+in a short bounded FIFO queue beyond it and are shed with 503 + Retry-After
+when the queue is full or their wait runs out. Order and payment requests
+are never queued: they always run, and a share of the slots is reserved so
+chat can never occupy them. Used by backend.middleware.AdmissionMiddleware.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Deque
+
+from django.conf import settings
+
+CHAT = "chat"
+PRIORITY = "priority"
+
+
+class AdmissionRejected(Exception):
+    """Raised when a chat request is shed"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Counts running requests per class and admits chat in FIFO order
+
+    Chat may use at most ADMISSION_SLOTS - ADMISSION_RESERVED_SLOTS slots,
+    and fewer while order/payment requests are running, so the two classes
+    together stay within ADMISSION_SLOTS whenever chat is the one waiting.
+    """
+
+    def __init__(self):
+        self.slots = max(1, getattr(settings, "ADMISSION_SLOTS", 24))
+        reserved = min(getattr(settings, "ADMISSION_RESERVED_SLOTS", 4), self.slots - 1)
+        self.chat_limit = self.slots - max(0, reserved)
+        self.queue_limit = getattr(settings, "CHAT_ADMISSION_QUEUE", 32)
+        self.queue_timeout = getattr(settings, "CHAT_ADMISSION_QUEUE_SECONDS", 3.0)
+        self._lock = threading.Lock()
+        self._waiters: Deque[threading.Event] = deque()
+        self.inflight = {CHAT: 0, PRIORITY: 0}
+        # Resumable replies still generating after their client left (part of inflight[CHAT])
+        self.detached = 0
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "queue_timeout": 0}
+        self.max_queue_wait = 0.0
+        # Moving average of how long a chat request holds its slot
+        self._chat_seconds = 5.0
+
+    def _chat_fits(self) -> bool:
+        return (
+            self.inflight[CHAT] < self.chat_limit
+            and self.inflight[CHAT] + self.inflight[PRIORITY] < self.slots
+        )
+
+    def _dispatch(self):
+        """Hand free slots to queued chat requests, oldest first (lock held)"""
+        while self._waiters and self._chat_fits():
+            self.inflight[CHAT] += 1
+            self.admitted += 1
+            self._waiters.popleft().set()
+
+    def retry_after(self) -> int:
+        """Seconds a shed client should wait: roughly how long the queue takes to drain"""
+        rounds = (len(self._waiters) + 1) / max(1, self.chat_limit)
+        return max(1, min(30, math.ceil(self._chat_seconds * rounds)))
+
+    def acquire_chat(self) -> float:
+        """
+        Take a chat slot, queueing for up to CHAT_ADMISSION_QUEUE_SECONDS
+
+        Returns:
+            Seconds spent in the queue
+
+        Raises:
+            AdmissionRejected: Queue full or wait timed out
+        """
+        with self._lock:
+            if not self._waiters and self._chat_fits():
+                self.inflight[CHAT] += 1
+                self.admitted += 1
+                return 0.0
+            if len(self._waiters) >= self.queue_limit:
+                self.shed["queue_full"] += 1
+                raise AdmissionRejected("queue_full", self.retry_after())
+            admitted = threading.Event()
+            self._waiters.append(admitted)
+
+        started = time.monotonic()
+        admitted.wait(self.queue_timeout)
+        waited = time.monotonic() - started
+        with self._lock:
+            # Checked under the lock: a slot may have been handed over just after the timeout
+            if admitted.is_set():
+                self.max_queue_wait = max(self.max_queue_wait, waited)
+                return waited
+            self._waiters.remove(admitted)
+            self.shed["queue_timeout"] += 1
+            raise AdmissionRejected("queue_timeout", self.retry_after())
+
+    def release_chat(self, held_seconds: float = None):
+        with self._lock:
+            self.inflight[CHAT] -= 1
+            if held_seconds is not None:
+                self._chat_seconds += 0.1 * (held_seconds - self._chat_seconds)
+            self._dispatch()
+
+    def hold_detached_chat(self):
+        """
+        Keep a slot for a reply that generates on after its client left
+
+        The client's own slot was released with its response, so the
+        producer takes one without queueing; it may briefly exceed the limit.
+        """
+        with self._lock:
+            self.inflight[CHAT] += 1
+            self.detached += 1
+
+    def release_detached_chat(self):
+        with self._lock:
+            self.inflight[CHAT] -= 1
+            self.detached -= 1
+            self._dispatch()
+
+    def acquire_priority(self):
+        """Order/payment requests always run; they are only counted"""
+        with self._lock:
+            self.inflight[PRIORITY] += 1
+
+    def release_priority(self):
+        with self._lock:
+            self.inflight[PRIORITY] -= 1
+            self._dispatch()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "slots": self.slots,
+                "chat_limit": self.chat_limit,
+                "chat_in_flight": self.inflight[CHAT],
+                "chat_detached": self.detached,
+                "priority_in_flight": self.inflight[PRIORITY],
+                "chat_queued": len(self._waiters),
+                "queue_limit": self.queue_limit,
+                "admitted": self.admitted,
+                "shed": dict(self.shed),
+                "max_queue_wait_ms": round(self.max_queue_wait * 1000, 1),
+                "avg_chat_seconds": round(self._chat_seconds, 2),
+            }
+
+
+# Global instance shared by all requests in this process
+admission_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Get or create the global admission controller instance"""
+    global admission_controller
+    if admission_controller is None:
+        with _controller_lock:
+            if admission_controller is None:
+                admission_controller = AdmissionController()
+    return admission_controller
@@ -12,6 +12,9 @@ class SweetappConfig(AppConfig):
     
     def ready(self):
         """Initialize ChromaDB when Django starts"""
+        # Connects the receivers that rebuild the FAQ and product mention indexes on edits
+        from . import faq_index, product_mentions  # noqa: F401
+
         # Only run in main process (not in reloader)
         import sys
         if 'runserver' not in sys.argv:
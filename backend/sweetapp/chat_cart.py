@@ -0,0 +1,199 @@
+"""
+Session cart for Sweet Dessert Chat Assistant
+The cart is stored in the session as a compact mapping of line keys to
+quantities (and optional customizations), keyed by DessertItem id, so adds
+are dictionary updates and the session payload stays small. Names, prices
+and images are read from the catalog in one query when the cart is shown
+or quoted, so prices always come from the database.
+"""
+
+import hashlib
+import json
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, List, Optional, Tuple
+
+from django.db.models import Q
+
+from .models import DessertItem
+from .pricing import DELIVERY_FEE, FREE_DELIVERY_THRESHOLD, TAX_RATE
+
+CART_SESSION_KEY = "cart"
+CART_VERSION = 2
+
+CENT = Decimal("0.01")
+
+MAX_LINE_QUANTITY = 99
+
+
+def _money(value: Decimal) -> Decimal:
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def line_key(product_id: int, customizations: dict = None) -> str:
+    """Cart line key: the product id, plus a digest when the line is customized"""
+    if not customizations:
+        return str(product_id)
+    digest = hashlib.sha1(
+        json.dumps(customizations, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:8]
+    return f"{product_id}:{digest}"
+
+
+def _product_id(key: str) -> Optional[int]:
+    try:
+        return int(key.split(":", 1)[0])
+    except ValueError:
+        return None
+
+
+class SessionCart:
+    """
+    Cart lines in the session: {"v": 2, "items": {line_key: {"q": qty, "c": {...}}}}
+
+    Carts saved by older code (a list of full product dicts) are converted
+    on first access by matching their ids or names against the catalog.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._items: Dict[str, dict] = self._load(session.get(CART_SESSION_KEY))
+
+    def _load(self, stored) -> Dict[str, dict]:
+        if isinstance(stored, dict) and stored.get("v") == CART_VERSION:
+            return dict(stored.get("items") or {})
+        if not stored:
+            return {}
+        return self._convert_legacy(stored)
+
+    def _convert_legacy(self, stored) -> Dict[str, dict]:
+        if not isinstance(stored, list):
+            return {}
+        items = {}
+        names = {}
+        for entry in stored:
+            if not isinstance(entry, dict):
+                continue
+            quantity = int(entry.get("quantity") or 1)
+            if entry.get("id"):
+                key = line_key(entry["id"])
+                items[key] = {"q": items.get(key, {}).get("q", 0) + quantity}
+            elif entry.get("name"):
+                names[entry["name"].lower()] = names.get(entry["name"].lower(), 0) + quantity
+        if names:
+            query = Q()
+            for name in names:
+                query |= Q(name__iexact=name)
+            for product_id, name in DessertItem.objects.filter(query).values_list("id", "name"):
+                key = line_key(product_id)
+                items[key] = {"q": items.get(key, {}).get("q", 0) + names.get(name.lower(), 0)}
+        self.session.modified = True
+        return items
+
+    def save(self):
+        self.session[CART_SESSION_KEY] = {"v": CART_VERSION, "items": self._items}
+        self.session.modified = True
+
+    def add(self, product_id: int, quantity: int = 1, customizations: dict = None) -> Tuple[str, int]:
+        """
+        Add to a line, creating it if needed
+
+        Returns:
+            (line key, new quantity of that line)
+        """
+        key = line_key(product_id, customizations)
+        line = self._items.get(key)
+        if line is None:
+            line = self._items[key] = {"q": 0}
+            if customizations:
+                line["c"] = customizations
+        line["q"] = min(MAX_LINE_QUANTITY, line["q"] + max(1, int(quantity)))
+        return key, line["q"]
+
+    def set_quantity(self, key: str, quantity: int):
+        """Change a line's quantity; zero or less removes it"""
+        if quantity <= 0:
+            self._items.pop(key, None)
+        elif key in self._items:
+            self._items[key]["q"] = min(MAX_LINE_QUANTITY, int(quantity))
+
+    def remove(self, key: str):
+        self._items.pop(key, None)
+
+    def clear(self):
+        self._items = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def item_count(self) -> int:
+        return sum(line["q"] for line in self._items.values())
+
+    def _catalog(self) -> Dict[int, DessertItem]:
+        ids = {_product_id(key) for key in self._items}
+        ids.discard(None)
+        if not ids:
+            return {}
+        products = DessertItem.objects.filter(id__in=ids).select_related("category").only(
+            "id", "name", "price", "image", "available", "category__name"
+        )
+        return {product.id: product for product in products}
+
+    def lines(self, catalog: Dict[int, DessertItem] = None) -> List[dict]:
+        """
+        Cart lines with catalog details, in the order they were added
+
+        Lines whose product no longer exists are dropped; unavailable
+        products are kept but flagged so the client can show them.
+        """
+        catalog = self._catalog() if catalog is None else catalog
+        lines = []
+        for key, line in self._items.items():
+            product = catalog.get(_product_id(key))
+            if product is None:
+                continue
+            price = _money(product.price)
+            lines.append({
+                "line_id": key,
+                "id": product.id,
+                "name": product.name,
+                "price": str(price),
+                "image": product.image,
+                "category": product.category.name,
+                "quantity": line["q"],
+                "customizations": line.get("c", {}),
+                "available": product.available,
+                "line_total": str(_money(price * line["q"])),
+            })
+        return lines
+
+    def quote(self, order_type: str = "delivery") -> dict:
+        """
+        Line totals, delivery fee, tax and total from one catalog query
+
+        Args:
+            order_type: "delivery" or "takeaway" (no delivery fee)
+
+        Returns:
+            Dict of lines and money amounts as strings, like the order views
+        """
+        lines = self.lines()
+        subtotal = sum(
+            (Decimal(line["line_total"]) for line in lines if line["available"]), Decimal("0.00")
+        )
+        if order_type == "takeaway" or not subtotal:
+            delivery_fee = Decimal("0.00")
+        else:
+            delivery_fee = Decimal("0.00") if subtotal > FREE_DELIVERY_THRESHOLD else DELIVERY_FEE
+        tax = _money(subtotal * TAX_RATE)
+        return {
+            "lines": lines,
+            "item_count": sum(line["quantity"] for line in lines if line["available"]),
+            "unavailable": [line["line_id"] for line in lines if not line["available"]],
+            "order_type": order_type,
+            "subtotal": str(_money(subtotal)),
+            "delivery_fee": str(delivery_fee),
+            "tax": str(tax),
+            "total": str(_money(subtotal + delivery_fee + tax)),
+        }
+
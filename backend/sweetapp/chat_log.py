@@ -0,0 +1,150 @@
+"""
+Write-behind chat turn log for Sweet Dessert Chat Assistant
+Chat turns are queued in memory and inserted in batches with bulk_create on a
+background thread, so logging never adds database latency to the SSE path.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import ChatTurn
+
+logger = logging.getLogger(__name__)
+
+
+class ChatLogWriter:
+    """
+    Bounded in-memory queue of ChatTurn instances flushed by a daemon thread
+
+    A batch is written once `batch_size` turns are waiting or `flush_interval`
+    seconds have passed. When the queue is full (database down or too slow)
+    new turns are dropped and counted rather than blocking the request.
+    """
+
+    def __init__(self, batch_size: int = None, flush_interval: float = None, max_queue: int = None):
+        self.batch_size = batch_size or getattr(settings, "CHAT_LOG_BATCH_SIZE", 50)
+        self.flush_interval = flush_interval or getattr(settings, "CHAT_LOG_FLUSH_SECONDS", 2.0)
+        self._queue = queue.Queue(maxsize=max_queue or getattr(settings, "CHAT_LOG_QUEUE_SIZE", 5000))
+        self._lock = threading.Lock()
+        self._thread = None
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True, name="chat-log-writer")
+                self._thread.start()
+
+    def enqueue(self, turn) -> bool:
+        """Queue an unsaved ChatTurn; returns False if it had to be dropped"""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(turn)
+            return True
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            return False
+
+    def _drain(self, first=None) -> List:
+        batch = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # Give a burst a moment to fill the batch before writing
+            deadline = time.monotonic() + self.flush_interval
+            batch = self._drain(first)
+            while len(batch) < self.batch_size and time.monotonic() < deadline:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch: List):
+        if not batch:
+            return
+        try:
+            ChatTurn.objects.bulk_create(batch, batch_size=self.batch_size)
+            with self._lock:
+                self._written += len(batch)
+        except Exception as e:
+            logger.error("Failed to write %s chat turns: %s", len(batch), e)
+            with self._lock:
+                self._failed += len(batch)
+        finally:
+            # This thread owns its own DB connection; drop it if it went stale
+            close_old_connections()
+
+    def flush(self):
+        """Write everything still queued from the calling thread"""
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            self._write(batch)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "written": self._written,
+                "dropped": self._dropped,
+                "failed": self._failed,
+            }
+
+
+# Global instance shared by all requests in this process
+chat_log_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_chat_log_writer() -> ChatLogWriter:
+    """Get or create the global chat log writer instance"""
+    global chat_log_writer
+    if chat_log_writer is None:
+        with _writer_lock:
+            if chat_log_writer is None:
+                chat_log_writer = ChatLogWriter()
+                atexit.register(chat_log_writer.flush)
+    return chat_log_writer
+
+
+def log_chat_turn(**fields) -> bool:
+    """
+    Record a chat turn without touching the database on the calling thread
+
+    Args:
+        **fields: ChatTurn field values (message, intent, provider, timings, ...)
+
+    Returns:
+        True if queued, False if logging is disabled or the queue is full
+    """
+    if not getattr(settings, "CHAT_LOG_ENABLED", True):
+        return False
+    try:
+        return get_chat_log_writer().enqueue(ChatTurn(**fields))
+    except Exception as e:
+        logger.error("Could not queue chat turn: %s", e)
+        return False
@@ -0,0 +1,186 @@
+"""
+In-process metrics for Sweet Dessert Chat Assistant
+Counters describing how chat streams end and latency histograms for each
+stage of a chat turn, shared by all requests in a worker.
+"""
+
+import bisect
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+_lock = threading.Lock()
+_stream_outcomes = Counter()
+_tokens_saved = 0
+_tokens_streamed = 0
+_unattended_frames = 0
+
+
+def record_stream_completed(tokens: int):
+    """Count a stream that ran to completion"""
+    global _tokens_streamed
+    with _lock:
+        _stream_outcomes["completed"] += 1
+        _tokens_streamed += tokens
+
+
+def record_stream_aborted(reason: str, tokens: int, tokens_saved: int):
+    """
+    Count a stream that was cut short
+
+    Args:
+        reason: "disconnect", "max_duration", "max_tokens" or "upstream_error"
+        tokens: Completion tokens streamed before the abort
+        tokens_saved: Completion tokens the provider no longer has to generate
+    """
+    global _tokens_saved, _tokens_streamed
+    with _lock:
+        _stream_outcomes[f"aborted_{reason}"] += 1
+        _tokens_streamed += tokens
+        _tokens_saved += max(0, tokens_saved)
+
+
+def record_unattended_frames(frames: int):
+    """Count frames a resumable reply generated while no client was reading"""
+    global _unattended_frames
+    with _lock:
+        _unattended_frames += frames
+
+
+def stream_stats() -> Dict:
+    """Snapshot of stream outcome counters"""
+    with _lock:
+        aborted = sum(v for k, v in _stream_outcomes.items() if k.startswith("aborted_"))
+        return {
+            "outcomes": dict(_stream_outcomes),
+            "aborted": aborted,
+            "tokens_streamed": _tokens_streamed,
+            "tokens_saved": _tokens_saved,
+            "unattended_frames": _unattended_frames,
+        }
+
+
+# Histogram bucket upper bounds in milliseconds (roughly 1-2-5 steps up to 2 minutes)
+LATENCY_BUCKETS_MS = (
+    1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 200, 300, 500, 750,
+    1000, 1500, 2000, 3000, 5000, 7500, 10000, 15000, 20000, 30000, 60000, 120000,
+)
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram
+
+    Memory stays constant regardless of traffic; percentiles are estimated by
+    linear interpolation inside the bucket that holds the requested rank.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is the overflow bucket
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max_ms
+                fraction = (rank - seen) / bucket_count
+                return min(self.max_ms, lower + (upper - lower) * fraction)
+            seen += bucket_count
+        return self.max_ms
+
+    def snapshot(self) -> Dict:
+        def rounded(value):
+            return round(value, 1) if value is not None else None
+
+        return {
+            "count": self.count,
+            "mean_ms": rounded(self.total_ms / self.count) if self.count else None,
+            "p50_ms": rounded(self.percentile(50)),
+            "p95_ms": rounded(self.percentile(95)),
+            "p99_ms": rounded(self.percentile(99)),
+            "max_ms": rounded(self.max_ms) if self.count else None,
+        }
+
+
+_stage_histograms: Dict[str, LatencyHistogram] = {}
+
+
+class StageTimer:
+    """
+    Collects per-stage durations for one chat turn
+
+    Stages are kept in the order they were first recorded; a stage recorded
+    twice accumulates. Durations are stored in seconds.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def span(self, name: str):
+        """Time the enclosed block as stage `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def rename(self, old: str, new: str):
+        if old in self.stages:
+            self.add(new, self.stages.pop(old))
+
+    def elapsed(self) -> float:
+        """Seconds since the timer was created"""
+        return time.perf_counter() - self.started_at
+
+    def as_dict(self) -> Dict[str, float]:
+        """Stage durations in milliseconds"""
+        return {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+
+    def server_timing(self) -> str:
+        """Stages formatted as a Server-Timing header value"""
+        return ", ".join(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()
+        )
+
+    def record(self):
+        """Add this turn's stages (and its total so far) to the process histograms"""
+        timings = dict(self.as_dict(), total=round(self.elapsed() * 1000, 1))
+        record_stage_timings(timings)
+        return timings
+
+
+def record_stage_timings(timings: Dict[str, float]):
+    """Add stage durations (milliseconds) to the per-stage histograms"""
+    with _lock:
+        for name, ms in timings.items():
+            histogram = _stage_histograms.get(name)
+            if histogram is None:
+                histogram = _stage_histograms[name] = LatencyHistogram()
+            histogram.observe(ms)
+
+
+def stage_stats() -> Dict:
+    """Per-stage latency percentiles (milliseconds)"""
+    with _lock:
+        return {name: h.snapshot() for name, h in _stage_histograms.items()}
@@ -0,0 +1,254 @@
+"""
+Streaming heavy-hitter analytics for Sweet Dessert Chat Assistant
+Tracks the most frequent queries, zero-result queries, requested products and
+intents with fixed-size Count-Min Sketch and Space-Saving structures, so the
+per-message cost and memory stay constant regardless of traffic. Each worker
+periodically merges its counts into the ChatHeavyHitter table.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from array import array
+from datetime import date
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import ChatHeavyHitter
+
+logger = logging.getLogger(__name__)
+
+SKETCH_KINDS = ("query", "zero_result", "product", "intent")
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str, max_length: int = 100) -> str:
+    """Lowercase, strip punctuation and collapse whitespace so variants count together"""
+    text = _PUNCTUATION_RE.sub(" ", text.lower())
+    return _WHITESPACE_RE.sub(" ", text).strip()[:max_length]
+
+
+class CountMinSketch:
+    """
+    Count-Min Sketch: approximate counts for any key in width * depth counters
+
+    Estimates never undercount; with width w the overcount is at most
+    about (e / w) * total with probability 1 - e^-depth.
+    """
+
+    def __init__(self, width: int = 1024, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array("Q", [0]) * width for _ in range(depth)]
+        self.total = 0
+
+    def _indexes(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        # Double hashing gives `depth` independent-enough positions from one digest
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, key: str, count: int = 1) -> int:
+        """Add to a key and return its new estimate"""
+        self.total += count
+        estimate = None
+        for row, index in zip(self.rows, self._indexes(key)):
+            row[index] += count
+            estimate = row[index] if estimate is None else min(estimate, row[index])
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+
+class SpaceSaving:
+    """
+    Space-Saving top-k: keeps `capacity` candidate keys with counts
+
+    When full, a new key replaces the current minimum and inherits its count
+    (recorded as the error bound), so frequent keys are never lost.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.counters: Dict[str, List[int]] = {}  # key -> [count, error]
+
+    def add(self, key: str, count: int = 1):
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += count
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[key] = [count, 0]
+            return
+        # Capacity is small and fixed, so a linear scan for the minimum is constant cost
+        victim = min(self.counters, key=lambda k: self.counters[k][0])
+        floor = self.counters.pop(victim)[0]
+        self.counters[key] = [floor + count, floor]
+
+    def top(self, n: int = None) -> List[Tuple[str, int, int]]:
+        """(key, count, error) tuples, most frequent first"""
+        ranked = sorted(
+            ((key, c[0], c[1]) for key, c in self.counters.items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        return ranked[:n] if n else ranked
+
+
+class HeavyHitters:
+    """Space-Saving candidates with counts tightened by a Count-Min Sketch"""
+
+    def __init__(self, capacity: int = 64, width: int = 1024, depth: int = 4):
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates = SpaceSaving(capacity)
+
+    def add(self, key: str, count: int = 1):
+        self.sketch.add(key, count)
+        self.candidates.add(key, count)
+
+    def top(self, n: int = None) -> List[Tuple[str, int]]:
+        ranked = [
+            (key, min(count, self.sketch.estimate(key)))
+            for key, count, _error in self.candidates.top()
+        ]
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return ranked[:n] if n else ranked
+
+    def estimate(self, key: str) -> int:
+        return self.sketch.estimate(key)
+
+
+class ChatSketches:
+    """
+    Per-worker heavy hitters for each kind, merged into the database periodically
+
+    Local structures only hold counts since the last merge; merging adds the
+    top candidates of each kind to today's ChatHeavyHitter rows and trims the
+    table back to CHAT_SKETCH_TABLE_SIZE keys per kind and day.
+    """
+
+    def __init__(self):
+        self.capacity = getattr(settings, "CHAT_SKETCH_CAPACITY", 64)
+        self.merge_interval = getattr(settings, "CHAT_SKETCH_MERGE_SECONDS", 60)
+        self.table_size = getattr(settings, "CHAT_SKETCH_TABLE_SIZE", 100)
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._last_merge = time.monotonic()
+        self._sketches = self._fresh()
+
+    def _fresh(self) -> Dict[str, HeavyHitters]:
+        return {kind: HeavyHitters(self.capacity) for kind in SKETCH_KINDS}
+
+    def record_turn(self, message: str, intent: str, products: List[str] = None, zero_results: bool = False):
+        """Count one chat message; may start a background merge"""
+        query = normalize_query(message)
+        with self._lock:
+            if query:
+                self._sketches["query"].add(query)
+                if zero_results:
+                    self._sketches["zero_result"].add(query)
+            if intent:
+                self._sketches["intent"].add(intent)
+            for product in products or []:
+                self._sketches["product"].add(product)
+            merge_due = time.monotonic() - self._last_merge >= self.merge_interval
+            if merge_due:
+                self._last_merge = time.monotonic()
+
+        if merge_due:
+            threading.Thread(target=self.merge, daemon=True, name="chat-sketch-merge").start()
+
+    def local_top(self, n: int = 10) -> Dict[str, List[Tuple[str, int]]]:
+        """Unmerged top keys of this worker"""
+        with self._lock:
+            return {kind: hh.top(n) for kind, hh in self._sketches.items()}
+
+    def merge(self):
+        """Add local top candidates to today's table rows and reset local counts"""
+        if not self._merge_lock.acquire(blocking=False):
+            return  # another merge is running
+        try:
+            with self._lock:
+                sketches, self._sketches = self._sketches, self._fresh()
+                self._last_merge = time.monotonic()
+            today = timezone.localdate()
+            try:
+                for kind, hh in sketches.items():
+                    for key, count in hh.top():
+                        self._increment(kind, key, today, count)
+                    self._trim(kind, today)
+            except Exception as e:
+                logger.error("Failed to merge chat sketches: %s", e)
+        finally:
+            close_old_connections()
+            self._merge_lock.release()
+
+    def _increment(self, kind: str, key: str, day: date, count: int):
+        rows = ChatHeavyHitter.objects.filter(kind=kind, key=key, day=day)
+        if rows.update(count=F("count") + count):
+            return
+        try:
+            with transaction.atomic():
+                ChatHeavyHitter.objects.create(kind=kind, key=key, day=day, count=count)
+        except IntegrityError:
+            # Another worker created the row first
+            rows.update(count=F("count") + count)
+
+    def _trim(self, kind: str, day: date):
+        rows = ChatHeavyHitter.objects.filter(kind=kind, day=day)
+        keep = list(rows.order_by("-count").values_list("id", flat=True)[: self.table_size])
+        rows.exclude(id__in=keep).delete()
+
+
+# Global instance shared by all requests in this process
+chat_sketches = None
+_sketches_lock = threading.Lock()
+
+
+def get_chat_sketches() -> ChatSketches:
+    """Get or create the global chat sketches instance"""
+    global chat_sketches
+    if chat_sketches is None:
+        with _sketches_lock:
+            if chat_sketches is None:
+                chat_sketches = ChatSketches()
+    return chat_sketches
+
+
+def heavy_hitter_report(since: date = None, limit: int = 10) -> Dict[str, List[Dict]]:
+    """
+    Top keys per kind from the merged table plus this worker's unmerged counts
+
+    Args:
+        since: First day to include (None = all retained days)
+        limit: Keys returned per kind
+
+    Returns:
+        {kind: [{"key": ..., "count": ...}, ...]} sorted by count
+    """
+    rows = ChatHeavyHitter.objects.all()
+    if since is not None:
+        rows = rows.filter(day__gte=since)
+    totals = {kind: {} for kind in SKETCH_KINDS}
+    for row in rows.values("kind", "key").annotate(total=Sum("count")):
+        totals.setdefault(row["kind"], {})[row["key"]] = row["total"]
+    for kind, ranked in get_chat_sketches().local_top(limit).items():
+        for key, count in ranked:
+            totals[kind][key] = totals[kind].get(key, 0) + count
+    return {
+        kind: [
+            {"key": key, "count": count}
+            for key, count in sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+        ]
+        for kind, counts in totals.items()
+    }
@@ -0,0 +1,226 @@
+"""
+Templated chat replies for Sweet Dessert Chat Assistant
+Structured intents (product lists, cart updates, checkout and product
+details) already have everything the reply needs in the session or the
+catalog, so the text is rendered locally instead of asking the LLM. Each
+renderer returns None when it cannot answer, and the caller falls back to
+the LLM.
+"""
+
+import re
+from decimal import Decimal, InvalidOperation
+from typing import Iterator, List, Optional
+
+from .models import DessertItem
+from .sse import format_sse
+
+# Question topics a product_info message can ask about, checked in order
+_PRODUCT_TOPICS = [
+    ("price", re.compile(r"\b(price|cost|costs|how much|rs\.?)\b")),
+    ("preparation", re.compile(r"\b(how long|prep|preparation|ready in|take to make)\b")),
+    ("dietary", re.compile(r"\b(vegan|vegetarian|keto|sugar[- ]free|gluten[- ]free|halal)\b")),
+    ("allergens", re.compile(r"\b(allerg\w*|nuts?|peanuts?|eggs?|dairy|milk|gluten|wheat|soya?|lactose)\b")),
+    ("ingredients", re.compile(r"\b(ingredients?|made (of|with|from)|what'?s in|contain\w*)\b")),
+]
+
+# Dietary labels as stored in DessertItem.dietary_info, keyed by how people ask
+_DIETARY_TERMS = {
+    "vegan": "vegan",
+    "vegetarian": "vegetarian",
+    "keto": "keto",
+    "sugar free": "sugar free",
+    "sugar-free": "sugar free",
+    "gluten free": "gluten free",
+    "gluten-free": "gluten free",
+    "halal": "halal",
+}
+
+# Allergen synonyms mapped to one group name; applied to both the question and
+# the allergens stored on products, which use either word ("milk" or "dairy")
+_ALLERGEN_TERMS = {
+    "nut": "nuts",
+    "nuts": "nuts",
+    "peanut": "nuts",
+    "peanuts": "nuts",
+    "egg": "eggs",
+    "eggs": "eggs",
+    "dairy": "dairy",
+    "milk": "dairy",
+    "lactose": "dairy",
+    "gluten": "gluten",
+    "wheat": "gluten",
+    "soy": "soy",
+    "soya": "soy",
+}
+
+
+def _allergen_group(allergen: str) -> Optional[str]:
+    return _ALLERGEN_TERMS.get(allergen.strip().lower())
+
+
+def _allergens_in_group(allergen_groups: dict, group: str) -> List[str]:
+    return [allergen for allergen, allergen_group in allergen_groups.items() if allergen_group == group]
+
+
+def _price(value) -> Optional[Decimal]:
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+
+
+def _format_price(value) -> str:
+    price = _price(value)
+    if price is None:
+        return "Rs. ?"
+    return f"Rs. {price:,.0f}" if price == price.to_integral_value() else f"Rs. {price:,.2f}"
+
+
+def _join(items: List[str]) -> str:
+    items = [str(item) for item in items if item]
+    if len(items) <= 1:
+        return "".join(items)
+    return ", ".join(items[:-1]) + " and " + items[-1]
+
+
+def _cart_summary(cart: list) -> str:
+    count = sum(int(item.get("quantity", 1)) for item in cart)
+    total = sum(
+        (_price(item.get("price")) or Decimal(0)) * int(item.get("quantity", 1)) for item in cart
+    )
+    noun = "item" if count == 1 else "items"
+    return f"{count} {noun}, {_format_price(total)} in total"
+
+
+def render_product_list(products: list, category: str = None) -> Optional[str]:
+    """Numbered list of products with prices"""
+    if not products:
+        return None
+    heading = f"Here are our {category.lower()}:" if category else "Here's what we have:"
+    lines = [heading]
+    for index, product in enumerate(products, 1):
+        lines.append(f"{index}. **{product['name']}** — {_format_price(product.get('price'))}")
+    lines.append("\nTell me which one you'd like and I'll add it to your cart.")
+    return "\n".join(lines)
+
+
+def render_cart_update(product: dict, quantity: int, cart: list, quantity_updated: bool = False) -> str:
+    """Confirmation after a product was added to the session cart"""
+    if quantity_updated:
+        line = f"Added {quantity} more **{product['name']}** to your cart."
+    else:
+        line = f"Added {quantity} × **{product['name']}** ({_format_price(product.get('price'))} each) to your cart."
+    return f"{line} Your cart now has {_cart_summary(cart)}. Say \"checkout\" when you're ready, or keep browsing!"
+
+
+def render_checkout(cart: list, is_authenticated: bool) -> str:
+    """Reply for a checkout request, matching the auth_required/redirect_checkout event"""
+    if not cart:
+        return "Your cart is empty right now. Tell me what you'd like and I'll add it for you!"
+    if not is_authenticated:
+        return f"Your cart has {_cart_summary(cart)}. Please sign in to complete your order; your cart will be waiting."
+    return f"Taking you to checkout with {_cart_summary(cart)}. Thank you for ordering from Sweet Dessert!"
+
+
+def _product_topic(message_lower: str) -> Optional[str]:
+    for topic, pattern in _PRODUCT_TOPICS:
+        if pattern.search(message_lower):
+            return topic
+    return None
+
+
+def render_product_info(product_id, message: str) -> Optional[str]:
+    """
+    Answer a question about one product from its catalog fields
+
+    Args:
+        product_id: DessertItem primary key of the matched product
+        message: User's question (decides which fields are answered)
+
+    Returns:
+        Reply text, or None when the catalog lacks the requested detail
+    """
+    try:
+        item = DessertItem.objects.select_related("category").get(pk=product_id)
+    except (DessertItem.DoesNotExist, ValueError, TypeError):
+        return None
+
+    message_lower = message.lower()
+    name = f"**{item.name}**"
+    dietary = [label.lower().replace("-", " ") for label in item.dietary_info or []]
+    # Group of each stored allergen, None for names the synonym table doesn't know
+    allergen_groups = {allergen: _allergen_group(allergen) for allergen in item.allergens or []}
+    topic = _product_topic(message_lower)
+
+    if topic == "price":
+        return f"{name} costs {_format_price(item.price)}."
+
+    if topic == "preparation":
+        return f"{name} takes about {item.preparation_time} minutes to prepare."
+
+    if topic == "dietary":
+        asked = next(
+            (label for term, label in _DIETARY_TERMS.items() if term in message_lower), None
+        )
+        if asked is None:
+            return None
+        if asked in dietary:
+            return f"Yes, {name} is {asked}."
+        if asked == "gluten free" and "gluten" in allergen_groups.values():
+            return f"No, {name} contains {_join(_allergens_in_group(allergen_groups, 'gluten'))}."
+        if not dietary:
+            return None
+        return f"{name} isn't marked as {asked}; it's listed as {_join(dietary)}."
+
+    if topic == "allergens":
+        if not item.allergens:
+            return None
+        asked = next(
+            (group for term, group in _ALLERGEN_TERMS.items() if re.search(rf"\b{term}\b", message_lower)),
+            None,
+        )
+        if asked and asked in allergen_groups.values():
+            found = _join(_allergens_in_group(allergen_groups, asked))
+            return f"Yes, {name} contains {found}. Its allergens are {_join(item.allergens)}."
+        if asked:
+            if None in allergen_groups.values():
+                # An allergen we can't classify might be the one asked about; never guess "no"
+                return None
+            return (
+                f"{name}'s listed allergens are {_join(item.allergens)}, not {asked}. "
+                "If you have a severe allergy, please contact us before ordering."
+            )
+        return f"{name} contains {_join(item.allergens)}."
+
+    if topic == "ingredients":
+        if not item.ingredients:
+            return None
+        return f"{name} is made with {_join(item.ingredients)}."
+
+    # No specific question: a short overview of everything we know
+    parts = [f"{name} ({item.category.name}) — {_format_price(item.price)}."]
+    if item.description:
+        parts.append(item.description.strip())
+    if item.ingredients:
+        parts.append(f"Made with {_join(item.ingredients)}.")
+    if item.allergens:
+        parts.append(f"Allergens: {_join(item.allergens)}.")
+    if dietary:
+        parts.append(f"Suitable for: {_join(dietary)}.")
+    return " ".join(parts)
+
+
+def stream_template_reply(text: str, turn_log: dict = None) -> Iterator[str]:
+    """
+    Stream a rendered reply as SSE content frames, ending with [DONE]
+
+    Frames are split per line so lists render progressively like LLM output.
+    """
+    if turn_log is not None:
+        turn_log.update(outcome="templated", response=text, provider="template")
+    lines = text.split("\n")
+    for index, line in enumerate(lines):
+        chunk = line if index == len(lines) - 1 else line + "\n"
+        if chunk:
+            yield format_sse({"content": chunk, "templated": True})
+    yield "data: [DONE]\n\n"
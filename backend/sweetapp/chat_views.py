@@ -4,60 +4,73 @@ Handles streaming chat responses, AI-powered intent detection, and cart manageme
 """
 # cSpell:ignore OPENROUTER mistralai stepfun choco Dreamcake Referer cerebras csk
 
+import contextvars
+import hashlib
 import json
 import re
 import logging
+import threading
+import time
+from collections import Counter
+from typing import Iterator, NamedTuple
 import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
 from django.http import StreamingHttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.db.models import Q
-import os
 from dotenv import load_dotenv
 from .vector_db import get_vector_db
-from .models import DessertItem, FAQItem, FAQCategory
+from .intent_classifier import get_intent_classifier
+from .chat_templates import (
+    render_cart_update,
+    render_checkout,
+    render_product_info,
+    render_product_list,
+    stream_template_reply,
+)
+from .llm_router import ProviderTarget, StreamInterrupted, get_provider_router
+from .provider_context import (
+    current_provider_context,
+    iterate_in_context,
+    set_provider_context,
+)
+from .provider_guard import ProviderUnavailable, get_provider_guard, key_fingerprint
+from .provider_registry import get_provider_registry
+from .prompt_budget import count_tokens, pack_prompt, prompt_budget_stats
+from .chat_log import get_chat_log_writer, log_chat_turn
+from .chat_metrics import (
+    StageTimer,
+    record_stream_aborted,
+    record_stream_completed,
+    stage_stats,
+    stream_stats,
+)
+from .chat_sketches import get_chat_sketches, heavy_hitter_report, normalize_query
+from .conversation_store import get_conversation_store
+from .faq_index import get_faq_index
+from .product_mentions import get_product_mentions
+from .admission import get_admission_controller
+from .single_flight import get_single_flight, normalize_text
+from .token_meter import EXHAUSTED, NORMAL, get_token_meter, usage_tokens
+from .chat_cart import SessionCart
+from .sse import ContentCoalescer, format_sse
+from .stream_replay import get_stream_replay, parse_event_id
+from .models import ChatTurn, DessertItem
 
 logger = logging.getLogger(__name__)
 
-# OpenRouter API Configuration
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-OPENROUTER_MODEL = "stepfun/step-3.5-flash:free"
+# How long (seconds) a full reply is kept to answer identical prompts while providers are unavailable
+REPLY_CACHE_TIMEOUT = 600
 
-# Model that supports structured outputs (GPT-4o, Gemini, etc.)
-# Using Step-3.5 Flash (Free) for intent detection
-OPENROUTER_INTENT_MODEL = "stepfun/step-3.5-flash:free"
+# Idle seconds before a keep-alive comment is written to the client
+STREAM_HEARTBEAT_SECONDS = 5
 
-# Cerebras API Configuration
-CEREBRAS_API_URL = "https://api.cerebras.ai/v1/chat/completions"
-CEREBRAS_MODEL = "qwen-3-235b-a22b-instruct-2507"
-
-
-def _read_env_key(env_var_name: str) -> str:
-    """
-    Read key from backend/.env first, then process environment variables.
-    """
-    env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env")
-    key_value = ""
-
-    if os.path.exists(env_path):
-        try:
-            with open(env_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if line.startswith(f"{env_var_name}="):
-                        key_value = line.split("=", 1)[1].strip()
-                        if key_value.startswith('"') and key_value.endswith('"'):
-                            key_value = key_value[1:-1]
-                        elif key_value.startswith("'") and key_value.endswith("'"):
-                            key_value = key_value[1:-1]
-                        break
-        except Exception as e:
-            logger.error(f"Error reading {env_var_name} from .env file: {e}")
-
-    if not key_value:
-        key_value = os.environ.get(env_var_name, "")
-
-    return key_value
+# Latest turns scanned to label the common queries with an intent
+COMMON_QUERY_INTENT_TURNS = 500
 
 
 def detect_api_provider(frontend_key: str = "", requested_provider: str = "") -> str:
@@ -87,13 +100,61 @@ def get_provider_api_key(provider: str, frontend_key: str = None) -> str:
         )
         return frontend_key.strip()
 
-    env_var = "CEREBRAS_API_KEY" if provider == "cerebras" else "OPENROUTER_API_KEY"
-    api_key = _read_env_key(env_var)
+    api_key = get_provider_registry().default_key(provider)
     if api_key:
-        logger.info(f"Using {provider} API key from {env_var}")
+        logger.info(f"Using server-side {provider} API key")
     return api_key
 
 
+def get_provider_targets(
+    api_provider: str, api_key: str = None, purpose: str = "chat"
+) -> list:
+    """
+    Build candidate provider targets for a request, requested provider first.
+
+    The requested provider uses the given key; other providers are only added
+    as failover candidates when a server-side key is configured for them.
+    Providers with several server-side keys contribute one target per key,
+    the key chosen by the registry's strategy first.
+
+    Args:
+        api_provider: Provider chosen for this request
+        api_key: Key for the requested provider (frontend or env)
+        purpose: "chat" for streaming replies, "intent" for structured outputs
+
+    Returns:
+        List of ProviderTarget
+    """
+    registry = get_provider_registry()
+    context_model = current_provider_context().model
+    targets = []
+    providers = [api_provider] + [
+        p.name for p in registry.providers() if p.name != api_provider
+    ]
+    for provider in providers:
+        config = registry.get(provider)
+        if config is None:
+            continue
+        if purpose == "intent":
+            if not config.intent_model:
+                continue
+            model = config.intent_model
+        else:
+            model = config.chat_model
+            if provider == api_provider and context_model in config.chat_models:
+                model = context_model
+
+        # A client-supplied key is used alone; server keys rotate and back each other up
+        if provider == api_provider and api_key and not registry.is_server_key(provider, api_key):
+            keys = [api_key.strip()]
+        else:
+            keys = registry.ordered_keys(provider, purpose)
+        targets.extend(
+            ProviderTarget(provider, model, config.url, key, config.timeout) for key in keys
+        )
+    return targets
+
+
 def get_openrouter_api_key(frontend_key: str = None):
     """
     Get API key - prioritize frontend-provided key over environment variable.
@@ -107,20 +168,9 @@ def get_openrouter_api_key(frontend_key: str = None):
     return get_provider_api_key("openrouter", frontend_key)
 
 
-# Global variable to store frontend API key for current request
-_current_request_api_key = None
-
-
-def set_request_api_key(api_key: str):
-    """Set API key for current request context"""
-    global _current_request_api_key
-    _current_request_api_key = api_key
-
-
 def get_current_api_key():
     """Get API key for current request (frontend key or env fallback)"""
-    global _current_request_api_key
-    return get_openrouter_api_key(_current_request_api_key)
+    return get_openrouter_api_key(current_provider_context().api_key)
 
 
 def ai_analyze_intent(
@@ -129,21 +179,50 @@ def ai_analyze_intent(
     conversation_history: list = None,
     api_provider: str = "openrouter",
     api_key: str = None,
+    provider_pinned: bool = False,
 ) -> dict:
     """
     Use AI with Structured Outputs to intelligently analyze the user's query intent.
     Uses JSON Schema enforcement for guaranteed valid responses.
-    Short/simple messages skip the AI call and use the fast keyword fallback.
+    Short/simple messages skip the AI call and use the fast keyword fallback,
+    and messages the local embedding classifier is confident about skip it too.
 
     Args:
         message: User's message
         available_products: List of available product names for context
         conversation_history: Recent chat history for context
-        api_key: OpenRouter API key to use
+        api_provider: Provider chosen for this request
+        api_key: API key for the chosen provider
+        provider_pinned: Keep the chosen provider first instead of ranking
 
     Returns:
         Dictionary with intent analysis results (guaranteed schema)
     """
+    # Cheapest first: a confident local classification avoids the remote round trip entirely
+    return (
+        _fast_path_intent(message)
+        or _local_intent_detection(message)
+        or _remote_intent_detection(
+            message,
+            available_products,
+            conversation_history,
+            api_provider,
+            api_key,
+            provider_pinned,
+        )
+    )
+
+
+def _fast_path_intent(message: str) -> dict:
+    """
+    Keyword intent for trivial greetings/thanks, skipping every classifier.
+
+    Args:
+        message: User's message
+
+    Returns:
+        Intent analysis dict, or None when the message needs a real classifier
+    """
     # Fast-path: skip AI call for trivial greetings/thanks
     # Do NOT fast-path messages that might contain order/product/list intents
     message_stripped = message.strip().lower()
@@ -185,19 +264,58 @@ def ai_analyze_intent(
     if is_simple and not has_action_intent:
         logger.info("Fast-path intent detection (skipping AI call)")
         return _fallback_intent_detection(message)
+    return None
 
-    # Structured intent output is currently configured for OpenRouter.
-    if api_provider != "openrouter":
-        return _fallback_intent_detection(message)
 
+def _remote_intent_detection(
+    message: str,
+    available_products: list = None,
+    conversation_history: list = None,
+    api_provider: str = "openrouter",
+    api_key: str = None,
+    provider_pinned: bool = False,
+) -> dict:
+    """
+    Classify intent with the remote structured-output model.
+
+    Falls back to keyword detection (results carry "fallback") when no
+    provider is configured or the call fails, and to the local classifier
+    at a lower threshold when the key's token budget is low.
+
+    Args:
+        message: User's message
+        available_products: List of available product names for context
+        conversation_history: Recent chat history for context
+        api_provider: Provider chosen for this request
+        api_key: API key for the chosen provider
+        provider_pinned: Keep the chosen provider first instead of ranking
+
+    Returns:
+        Intent analysis dict
+    """
     # Use passed api_key or fall back to getting current key
-    if not api_key:
+    if not api_key and api_provider == "openrouter":
         api_key = get_current_api_key()
-    if not api_key:
+    router = get_provider_router()
+    targets = router.rank(
+        get_provider_targets(api_provider, api_key, purpose="intent"),
+        pinned=provider_pinned and api_provider == "openrouter",
+    )
+    if not targets:
         logger.warning(
-            "OpenRouter API key not configured, falling back to keyword detection"
+            "No structured-output provider configured, falling back to keyword detection"
         )
-        return {"intent": "general_chat", "confidence": "low", "fallback": True}
+        return _fallback_intent_detection(message)
+
+    meter = get_token_meter()
+    targets, budget_mode = meter.within_budget(targets)
+    if budget_mode != NORMAL:
+        # Over the economy threshold: classify locally, accepting less confidence
+        logger.info("Token budget %s, skipping the AI intent call", budget_mode)
+        meter.note_degraded("intent", budget_mode)
+        return _local_intent_detection(
+            message, threshold=getattr(settings, "CHAT_ECONOMY_INTENT_THRESHOLD", 0.5)
+        ) or _fallback_intent_detection(message)
 
     # Build product list for context
     product_names = []
@@ -252,13 +370,6 @@ def ai_analyze_intent(
 
 Analyze the message and provide structured classification."""
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "http://localhost:8000",
-        "X-Title": "Sweet Dessert Intent Analyzer",
-    }
-
     # Define JSON Schema for structured output
     intent_schema = {
         "name": "intent_analysis",
@@ -314,7 +425,6 @@ Analyze the message and provide structured classification."""
     }
 
     payload = {
-        "model": OPENROUTER_INTENT_MODEL,
         "messages": [
             {
                 "role": "system",
@@ -330,16 +440,25 @@ Analyze the message and provide structured classification."""
     }
 
     try:
-        response = requests.post(
-            OPENROUTER_API_URL, headers=headers, json=payload, timeout=8
+        upstream_timings = {}
+        result = router.complete(
+            targets, payload, "Sweet Dessert Intent Analyzer", timeout=8, timings=upstream_timings
         )
-        response.raise_for_status()
-
-        result = response.json()
         content = result.get("choices", [{}])[0].get("message", {}).get("content", "{}")
 
-        # Parse the guaranteed valid JSON response
-        intent_data = json.loads(content)
+        intent_data = {}
+        try:
+            # Parse the guaranteed valid JSON response
+            intent_data = json.loads(content)
+        finally:
+            # The call is billed whether or not its answer parses
+            _record_usage(
+                "intent",
+                upstream_timings,
+                payload["messages"],
+                content or "",
+                intent_data.get("intent", "") if isinstance(intent_data, dict) else "",
+            )
 
         logger.info(
             f"AI Intent Analysis (Structured): {intent_data.get('intent')} (confidence: {intent_data.get('confidence')}) - {intent_data.get('reason', 'No reason')}"
@@ -361,6 +480,203 @@ Analyze the message and provide structured classification."""
         return _fallback_intent_detection(message)
 
 
+def _record_usage(purpose: str, upstream_timings: dict, messages: list, completion: str, intent: str = ""):
+    """
+    Meter the tokens of one provider call
+
+    Uses the provider's usage object when it sent one, otherwise counts the
+    prompt messages and the completion text locally.
+
+    Args:
+        purpose: "intent" or "reply"
+        upstream_timings: Filled by the router (provider, model, key, usage)
+        messages: Prompt messages sent
+        completion: Text received
+        intent: Intent of the chat turn
+
+    Returns:
+        (prompt_tokens, completion_tokens, estimated)
+    """
+    prompt_tokens, completion_tokens = usage_tokens(upstream_timings.get("usage"))
+    estimated = not (prompt_tokens or completion_tokens)
+    if estimated:
+        prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+        completion_tokens = count_tokens(completion)
+    get_token_meter().record(
+        upstream_timings.get("provider", ""),
+        upstream_timings.get("model", ""),
+        upstream_timings.get("key", ""),
+        purpose,
+        prompt_tokens,
+        completion_tokens,
+        intent=intent,
+        estimated=estimated,
+    )
+    return prompt_tokens, completion_tokens, estimated
+
+
+def _extract_product_mention(message_lower: str) -> str:
+    """
+    Find the product a message refers to by matching it against the catalog.
+
+    Args:
+        message_lower: Lowercased user message
+
+    Returns:
+        Product name, or None if nothing matches well enough
+    """
+    try:
+        # Remove common action words to isolate the product reference
+        # Use word-boundary-aware removal to avoid corrupting product names
+        noise_words = {
+            "add",
+            "order",
+            "buy",
+            "want",
+            "get",
+            "give",
+            "me",
+            "have",
+            "to",
+            "cart",
+            "my",
+            "please",
+            "i",
+            "a",
+            "the",
+            "some",
+            "can",
+            "you",
+            "put",
+            "in",
+        }
+        words = message_lower.replace("-", " ").split()
+        stripped_words = [w for w in words if w not in noise_words and len(w) > 1]
+        normalized = " ".join(stripped_words)
+
+        best_score = 0
+        best_product = None
+
+        for product in DessertItem.objects.filter(available=True):
+            pname = product.name.lower()
+            pname_norm = pname.replace("-", " ")
+
+            # Exact full-name match in original message
+            if pname_norm in message_lower or pname in message_lower:
+                best_product = product.name
+                break
+
+            # Score: how many user words appear in the product name
+            user_words = [w for w in normalized.split() if len(w) > 2]
+            if not user_words:
+                continue
+            fwd = sum(1 for w in user_words if w in pname_norm)
+            fwd_score = fwd / len(user_words)
+
+            # Reverse: product key words in user message
+            prod_words = [w for w in pname_norm.split() if len(w) > 3]
+            rev = sum(1 for w in prod_words if w in normalized)
+            rev_score = rev / len(prod_words) if prod_words else 0
+
+            combined = max(fwd_score, rev_score)
+            if combined > best_score and combined >= 0.4:
+                best_score = combined
+                best_product = product.name
+
+        return best_product
+    except Exception as e:
+        logger.error(f"Product extraction error: {e}")
+        return None
+
+
+_QUANTITY_RE = re.compile(r"\b(\d{1,2})\b")
+_QUANTITY_WORDS = {
+    "one": 1,
+    "two": 2,
+    "three": 3,
+    "four": 4,
+    "five": 5,
+    "six": 6,
+    "seven": 7,
+    "eight": 8,
+    "nine": 9,
+    "ten": 10,
+    "a dozen": 12,
+}
+
+
+def _extract_quantity(message_lower: str) -> int:
+    """Quantity requested in a message (digits or number words), default 1"""
+    match = _QUANTITY_RE.search(message_lower)
+    if match and 0 < int(match.group(1)) <= 99:
+        return int(match.group(1))
+    for word, value in _QUANTITY_WORDS.items():
+        if re.search(rf"\b{word}\b", message_lower):
+            return value
+    return 1
+
+
+def _extract_category_filter(message_lower: str) -> str:
+    """Menu category named in a message (singular or plural), or None"""
+    for category in _catalog_overview().split(", "):
+        name = category.lower()
+        if name in message_lower or name.rstrip("s") in message_lower:
+            return category
+    return None
+
+
+def _local_intent_detection(message: str, threshold: float = None) -> dict:
+    """
+    Classify intent with the local embedding head, skipping the remote call.
+
+    Uses the MiniLM embedding already computed for vector search. Product,
+    quantity and category are extracted from the message and catalog.
+
+    Args:
+        message: User's message
+        threshold: Minimum probability to accept (default CHAT_INTENT_LOCAL_THRESHOLD)
+
+    Returns:
+        Intent analysis dict, or None if the head is missing or not confident
+    """
+    if not getattr(settings, "CHAT_INTENT_LOCAL_ENABLED", True):
+        return None
+    classifier = get_intent_classifier()
+    if classifier.head() is None:
+        return None
+    try:
+        embedding = get_vector_db().embed_query(message)
+        result = classifier.classify(embedding, threshold)
+    except Exception as e:
+        logger.error(f"Local intent classification failed: {e}")
+        return None
+    if result is None:
+        return None
+
+    intent, probability = result
+    message_lower = message.lower().strip()
+    product_mentioned = None
+    if intent in ("order", "product_info"):
+        product_mentioned = _extract_product_mention(message_lower)
+    category_filter = None
+    if intent == "list_products":
+        category_filter = _extract_category_filter(message_lower)
+
+    logger.info(
+        f"Local Intent Detection: {intent} (p={probability:.2f}), product: {product_mentioned}"
+    )
+
+    return {
+        "intent": intent,
+        "confidence": "high" if probability >= 0.9 else "medium",
+        "product_mentioned": product_mentioned,
+        "quantity": _extract_quantity(message_lower) if intent == "order" else 1,
+        "category_filter": category_filter,
+        "reason": f"Local embedding classifier (p={probability:.2f})",
+        "local": True,
+    }
+
+
 def _fallback_intent_detection(message: str) -> dict:
     """
     Fallback keyword-based intent detection when AI is unavailable.
@@ -422,67 +738,7 @@ def _fallback_intent_detection(message: str) -> dict:
     # Extract product name from database when intent is order
     product_mentioned = None
     if intent == "order":
-        try:
-            # Remove common action words to isolate the product reference
-            # Use word-boundary-aware removal to avoid corrupting product names
-            noise_words = {
-                "add",
-                "order",
-                "buy",
-                "want",
-                "get",
-                "give",
-                "me",
-                "have",
-                "to",
-                "cart",
-                "my",
-                "please",
-                "i",
-                "a",
-                "the",
-                "some",
-                "can",
-                "you",
-                "put",
-                "in",
-            }
-            words = message_lower.replace("-", " ").split()
-            stripped_words = [w for w in words if w not in noise_words and len(w) > 1]
-            normalized = " ".join(stripped_words)
-
-            best_score = 0
-            best_product = None
-
-            for product in DessertItem.objects.filter(available=True):
-                pname = product.name.lower()
-                pname_norm = pname.replace("-", " ")
-
-                # Exact full-name match in original message
-                if pname_norm in message_lower or pname in message_lower:
-                    best_product = product.name
-                    break
-
-                # Score: how many user words appear in the product name
-                user_words = [w for w in normalized.split() if len(w) > 2]
-                if not user_words:
-                    continue
-                fwd = sum(1 for w in user_words if w in pname_norm)
-                fwd_score = fwd / len(user_words)
-
-                # Reverse: product key words in user message
-                prod_words = [w for w in pname_norm.split() if len(w) > 3]
-                rev = sum(1 for w in prod_words if w in normalized)
-                rev_score = rev / len(prod_words) if prod_words else 0
-
-                combined = max(fwd_score, rev_score)
-                if combined > best_score and combined >= 0.4:
-                    best_score = combined
-                    best_product = product.name
-
-            product_mentioned = best_product
-        except Exception as e:
-            logger.error(f"Fallback product extraction error: {e}")
+        product_mentioned = _extract_product_mention(message_lower)
 
     logger.info(f"Fallback Intent Detection: {intent}, product: {product_mentioned}")
 
@@ -695,6 +951,97 @@ def get_products_by_category(category_filter: str = None, limit: int = 10) -> li
         return []
 
 
+# FAQ trigger keywords - questions about the business, policies, etc.
+FAQ_TRIGGER_KEYWORDS = (
+    # Ordering & Delivery
+    "how to order",
+    "how do i order",
+    "delivery",
+    "deliver",
+    "shipping",
+    "delivery time",
+    "how long",
+    "delivery fee",
+    "delivery charge",
+    "minimum order",
+    "free delivery",
+    "delivery area",
+    "where do you deliver",
+    # Payment
+    "payment",
+    "pay",
+    "payment method",
+    "accept",
+    "card",
+    "cash",
+    "stripe",
+    "online payment",
+    "pay at store",
+    "pay on delivery",
+    # Pickup/Takeaway
+    "pickup",
+    "pick up",
+    "takeaway",
+    "take away",
+    "collect",
+    "store pickup",
+    "pickup time",
+    "when can i pick",
+    # Store Info
+    "location",
+    "address",
+    "where are you",
+    "store hours",
+    "opening hours",
+    "open",
+    "close",
+    "timing",
+    "working hours",
+    "contact",
+    "phone",
+    "email",
+    # Products/Menu
+    "allergen",
+    "allergy",
+    "allergies",
+    "ingredients",
+    "vegan",
+    "vegetarian",
+    "gluten",
+    "gluten-free",
+    "dairy",
+    "dairy-free",
+    "nut",
+    "nut-free",
+    "dietary",
+    "customization",
+    "customize",
+    "custom cake",
+    "custom order",
+    # Policies
+    "refund",
+    "return",
+    "cancel",
+    "cancellation",
+    "exchange",
+    "policy",
+    "terms",
+    "conditions",
+    # General Help
+    "help",
+    "faq",
+    "question",
+    "how does",
+    "what is",
+    "can i",
+    "do you",
+    "is there",
+    "are there",
+    "about",
+    "tell me about",
+)
+
+
 def get_relevant_faqs(message: str, limit: int = 3) -> list:
     """
     Get relevant FAQ items based on the user's message
@@ -704,60 +1051,10 @@ def get_relevant_faqs(message: str, limit: int = 3) -> list:
         limit: Maximum FAQs to return
 
     Returns:
-        List of FAQ dicts
+        List of FAQ dicts, best match first
     """
-    message_lower = message.lower()
-
     try:
-        faq_items = FAQItem.objects.filter(
-            is_active=True, category__is_active=True
-        ).select_related("category")
-
-        scored_faqs = []
-        message_words = set(message_lower.split())
-
-        for faq in faq_items:
-            question_lower = faq.question.lower()
-            answer_lower = faq.answer.lower()
-            score = 0
-
-            # Word matching
-            question_words = set(question_lower.split())
-            common_words = message_words.intersection(question_words)
-            score += len(common_words) * 2
-
-            # Key phrase matching
-            key_phrases = [
-                "delivery",
-                "payment",
-                "order",
-                "cancel",
-                "refund",
-                "hours",
-                "pickup",
-                "custom",
-                "allergy",
-                "vegan",
-            ]
-            for phrase in key_phrases:
-                if phrase in message_lower and (
-                    phrase in question_lower or phrase in answer_lower
-                ):
-                    score += 3
-
-            if score > 0:
-                scored_faqs.append(
-                    {
-                        "question": faq.question,
-                        "answer": faq.answer,
-                        "category": faq.category.name,
-                        "score": score,
-                    }
-                )
-
-        scored_faqs.sort(key=lambda x: x["score"], reverse=True)
-        return scored_faqs[:limit]
-
+        return get_faq_index().search(message, limit=limit)
     except Exception as e:
         logger.error(f"Error getting FAQs: {e}")
         return []
@@ -775,155 +1072,14 @@ def detect_faq_intent(message: str) -> dict:
     """
     message_lower = message.lower().strip()
 
-    # FAQ trigger keywords - questions about the business, policies, etc.
-    faq_keywords = [
-        # Ordering & Delivery
-        "how to order",
-        "how do i order",
-        "delivery",
-        "deliver",
-        "shipping",
-        "delivery time",
-        "how long",
-        "delivery fee",
-        "delivery charge",
-        "minimum order",
-        "free delivery",
-        "delivery area",
-        "where do you deliver",
-        # Payment
-        "payment",
-        "pay",
-        "payment method",
-        "accept",
-        "card",
-        "cash",
-        "stripe",
-        "online payment",
-        "pay at store",
-        "pay on delivery",
-        # Pickup/Takeaway
-        "pickup",
-        "pick up",
-        "takeaway",
-        "take away",
-        "collect",
-        "store pickup",
-        "pickup time",
-        "when can i pick",
-        # Store Info
-        "location",
-        "address",
-        "where are you",
-        "store hours",
-        "opening hours",
-        "open",
-        "close",
-        "timing",
-        "working hours",
-        "contact",
-        "phone",
-        "email",
-        # Products/Menu
-        "allergen",
-        "allergy",
-        "allergies",
-        "ingredients",
-        "vegan",
-        "vegetarian",
-        "gluten",
-        "gluten-free",
-        "dairy",
-        "dairy-free",
-        "nut",
-        "nut-free",
-        "dietary",
-        "customization",
-        "customize",
-        "custom cake",
-        "custom order",
-        # Policies
-        "refund",
-        "return",
-        "cancel",
-        "cancellation",
-        "exchange",
-        "policy",
-        "terms",
-        "conditions",
-        # General Help
-        "help",
-        "faq",
-        "question",
-        "how does",
-        "what is",
-        "can i",
-        "do you",
-        "is there",
-        "are there",
-        "about",
-        "tell me about",
-    ]
-
     # Check if message contains FAQ-related keywords
-    has_faq_intent = any(keyword in message_lower for keyword in faq_keywords)
+    has_faq_intent = any(keyword in message_lower for keyword in FAQ_TRIGGER_KEYWORDS)
 
     if not has_faq_intent:
         return {"has_intent": False, "faqs": [], "action": "none"}
 
-    # Search for matching FAQs in database
-    matching_faqs = []
-
-    try:
-        # Get all active FAQ items
-        faq_items = FAQItem.objects.filter(
-            is_active=True, category__is_active=True
-        ).select_related("category")
-
-        # Score each FAQ based on keyword matches
-        scored_faqs = []
-        message_words = set(message_lower.split())
-
-        for faq in faq_items:
-            question_lower = faq.question.lower()
-            answer_lower = faq.answer.lower()
-
-            # Calculate relevance score
-            score = 0
-
-            # Check for word matches in question
-            question_words = set(question_lower.split())
-            common_words = message_words.intersection(question_words)
-            score += len(common_words) * 2  # Question matches worth more
-
-            # Check for phrase matches
-            for keyword in faq_keywords:
-                if keyword in message_lower and keyword in question_lower:
-                    score += 3
-                if keyword in message_lower and keyword in answer_lower:
-                    score += 1
-
-            # Check for direct substring match
-            if any(word in question_lower for word in message_words if len(word) > 3):
-                score += 2
-
-            if score > 0:
-                scored_faqs.append(
-                    {
-                        "question": faq.question,
-                        "answer": faq.answer,
-                        "category": faq.category.name,
-                        "category_icon": faq.category.icon,
-                        "score": score,
-                    }
-                )
-
-        # Sort by score and take top 3
-        scored_faqs.sort(key=lambda x: x["score"], reverse=True)
-        matching_faqs = scored_faqs[:3]
-
-    except Exception as e:
-        logger.error(f"Error searching FAQs: {e}")
+    # Search for matching FAQs in the index
+    matching_faqs = get_relevant_faqs(message, limit=3)
 
     return {
         "has_intent": has_faq_intent,
@@ -1114,59 +1270,35 @@ def detect_order_intent(message: str, context_products: list) -> dict:
     }
 
 
-def build_system_prompt(
-    context_chunks: list,
-    user_authenticated: bool = False,
-    username: str = None,
-    faq_context: list = None,
-) -> str:
-    """
-    Build system prompt with context from ChromaDB and FAQs
+def _format_context_item(chunk: dict) -> str:
+    """Render one vector search result for the system prompt."""
+    metadata = chunk.get("metadata", {})
+    product_name = metadata.get("product_name", "Product")
+    price = metadata.get("price", "N/A")
+    category = metadata.get("category", "Dessert")
 
-    Args:
-        context_chunks: List of relevant product chunks from vector search
-        user_authenticated: Whether user is logged in
-        username: Username if authenticated
-        faq_context: List of relevant FAQ items for general queries
+    # Get a snippet of the description (first 300 chars)
+    description = chunk.get("text", "")[:300]
 
-    Returns:
-        Formatted system prompt string
-    """
-    # Build context from ChromaDB results
-    context_items = []
+    return f"**{product_name}** (Category: {category}, Price: Rs. {price})\n{description}..."
 
-    for chunk in context_chunks:
-        metadata = chunk.get("metadata", {})
-        product_name = metadata.get("product_name", "Product")
-        price = metadata.get("price", "N/A")
-        category = metadata.get("category", "Dessert")
 
-        # Get a snippet of the description (first 300 chars)
-        description = chunk.get("text", "")[:300]
+def _format_faq_item(faq: dict) -> str:
+    """Render one FAQ for the system prompt."""
+    return f"Q: {faq['question']}\nA: {faq['answer']}"
 
-        context_items.append(
-            f"**{product_name}** (Category: {category}, Price: Rs. {price})\n{description}..."
-        )
 
-    context_text = (
-        "\n\n".join(context_items) if context_items else "No specific products found."
-    )
+# Bump whenever the static prompt prefix text changes so cache hit rates can be compared per version
+PROMPT_PREFIX_VERSION = "2"
 
-    # Build FAQ context if available
-    faq_text = ""
-    if faq_context:
-        faq_items = []
-        for faq in faq_context:
-            faq_items.append(f"Q: {faq['question']}\nA: {faq['answer']}")
-        faq_text = "\n\n**Relevant FAQ Information:**\n" + "\n\n".join(faq_items)
+CATALOG_OVERVIEW_CACHE_KEY = "chat:catalog_overview"
+CATALOG_OVERVIEW_TIMEOUT = 300
 
-    auth_status = (
-        f"User is logged in as **{username}**"
-        if user_authenticated
-        else "User is NOT logged in"
-    )
+# Requests served per static prefix hash in this process
+_prompt_prefix_counts = Counter()
 
-    system_prompt = f"""You are a friendly and helpful AI assistant for Sweet Dessert, a premium dessert shop.
+STATIC_PROMPT_TEMPLATE = """You are a friendly and helpful AI assistant for Sweet Dessert, a premium dessert shop.
+Prompt version: {version}
 
 **Your Role:**
 - Help customers discover and learn about our delicious desserts
@@ -1176,21 +1308,14 @@ def build_system_prompt(
 - Be warm, enthusiastic, and professional
 - Use emojis sparingly but appropriately 🍰
 
-**Current User Status:** {auth_status}
-
-**Available Menu Items (based on current query):**
-
-{context_text}
-{faq_text}
-
 **Guidelines:**
-1. Use the product information above to answer questions accurately
+1. Use the product information in the request context below to answer questions accurately
 2. Always mention prices in PKR (Pakistani Rupees) as "Rs. [amount]"
 3. If asked about products not in the context, politely mention what we do have available
 4. When user asks to "list" or "show all" products in a category, provide a formatted list
 5. Encourage customers to explore our full menu and special offers
 6. Be concise but informative - aim for 2-3 sentences unless more detail is requested
-7. **For general questions (delivery, payment, policies, store info):** Use the FAQ information provided above to give accurate answers
+7. **For general questions (delivery, payment, policies, store info):** Use the FAQ information in the request context below to give accurate answers
 8. If the user asks about something not in FAQs, provide helpful general information about Sweet Dessert
 
 **General Store Information (use for FAQ-type questions):**
@@ -1225,7 +1350,7 @@ def build_system_prompt(
 - "List [category]" or "Show all [category]" → Provide formatted list of products in that category
 - "Order [product]" or "I want [product]" → Add to cart if logged in, confirm with happy message, ask if they want more
 - "Proceed to payment" or "Checkout" or "Yes, proceed" → Confirm and indicate they will be taken to payment page
-- General questions about delivery/payment/policies → Answer using FAQ information above
+- General questions about delivery/payment/policies → Answer using the FAQ information in the request context
 
 **Sweet Dessert Information:**
 - We offer cakes, brownies, cookies, cupcakes, donuts, ice cream, and more
@@ -1234,9 +1359,121 @@ def build_system_prompt(
 - Secure online ordering through our website
 - Payment via Stripe (all major cards accepted)
 
+**Menu Categories:** {catalog_overview}
+
 Respond naturally and helpfully to the customer's query!"""
 
-    return system_prompt
+
+def _catalog_overview() -> str:
+    """Comma-separated menu categories, cached so the prompt prefix stays stable."""
+    overview = cache.get(CATALOG_OVERVIEW_CACHE_KEY)
+    if overview is None:
+        try:
+            names = (
+                DessertItem.objects.filter(available=True)
+                .values_list("category__name", flat=True)
+                .distinct()
+            )
+            overview = ", ".join(sorted(set(names))) or "Various desserts"
+        except Exception as e:
+            logger.error(f"Error building catalog overview: {e}")
+            return "Various desserts"
+        cache.set(CATALOG_OVERVIEW_CACHE_KEY, overview, CATALOG_OVERVIEW_TIMEOUT)
+    return overview
+
+
+def build_static_prompt_prefix() -> str:
+    """
+    Build the request-independent part of the system prompt
+
+    Persona, rules, store information and the catalog overview only change
+    with PROMPT_PREFIX_VERSION or the menu, so every request shares this
+    exact prefix and provider-side prompt caches can reuse it.
+
+    Returns:
+        Static system prompt prefix
+    """
+    return STATIC_PROMPT_TEMPLATE.format(
+        version=PROMPT_PREFIX_VERSION, catalog_overview=_catalog_overview()
+    )
+
+
+def prompt_prefix_hash(prefix: str) -> str:
+    """Short hash identifying a static prompt prefix."""
+    return hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:12]
+
+
+def build_system_prompt(
+    context_chunks: list,
+    user_authenticated: bool = False,
+    username: str = None,
+    faq_context: list = None,
+    conversation_summary: str = None,
+) -> str:
+    """
+    Build system prompt with context from ChromaDB and FAQs
+
+    The static prefix comes first; per-request sections (user status,
+    retrieved products, FAQs) are appended after it.
+
+    Args:
+        context_chunks: List of relevant product chunks from vector search
+        user_authenticated: Whether user is logged in
+        username: Username if authenticated
+        faq_context: List of relevant FAQ items for general queries
+        conversation_summary: Rolling summary of turns older than the history window
+
+    Returns:
+        Formatted system prompt string
+    """
+    prefix = build_static_prompt_prefix()
+
+    # Build context from ChromaDB results
+    context_items = [_format_context_item(chunk) for chunk in context_chunks]
+
+    context_text = (
+        "\n\n".join(context_items) if context_items else "No specific products found."
+    )
+
+    # Build FAQ context if available
+    faq_text = ""
+    if faq_context:
+        faq_items = [_format_faq_item(faq) for faq in faq_context]
+        faq_text = "\n\n**Relevant FAQ Information:**\n" + "\n\n".join(faq_items)
+
+    auth_status = (
+        f"User is logged in as **{username}**"
+        if user_authenticated
+        else "User is NOT logged in"
+    )
+
+    summary_text = (
+        f"\n\n**Earlier in this conversation:**\n{conversation_summary}"
+        if conversation_summary
+        else ""
+    )
+
+    dynamic_context = f"""
+
+---
+**Request Context**
+
+**Current User Status:** {auth_status}
+
+**Available Menu Items (based on current query):**
+
+{context_text}
+{faq_text}{summary_text}"""
+
+    return prefix + dynamic_context
+
+
+def _reply_cache_key(llm_messages: list) -> str:
+    """Cache key for a full LLM reply to an exact prompt."""
+    digest = hashlib.sha256(
+        json.dumps(llm_messages, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return f"chat:reply:{digest}"
 
 
 def generate_chat_stream(
@@ -1248,9 +1485,15 @@ def generate_chat_stream(
     conversation_history: list = None,
     api_provider: str = "openrouter",
     api_key: str = None,
+    provider_pinned: bool = False,
+    abort_event: threading.Event = None,
+    timer: StageTimer = None,
+    turn_log: dict = None,
+    conversation_summary: str = None,
+    intent: str = "",
 ):
     """
-    Generate streaming response from selected AI provider.
+    Generate streaming response from the best available AI provider.
 
     Args:
         message: User's message
@@ -1261,129 +1504,344 @@ def generate_chat_stream(
         conversation_history: Recent conversation turns
         api_provider: Provider name (openrouter/cerebras)
         api_key: Provider API key to use
+        provider_pinned: Keep the chosen provider first instead of ranking
+        abort_event: Set when the client disconnected (ASGI); stops the upstream stream
+        timer: Receives upstream_connect, first_token and stream_end stage timings
+        turn_log: Filled with provider, token counts, reply text and outcome for the chat log
+        conversation_summary: Rolling summary of older turns from the conversation store
+        intent: Intent of the turn, for token usage metering
 
     Yields:
         Server-Sent Events formatted chunks
     """
+    if turn_log is None:
+        turn_log = {}
+
+    # Fit retrieved context, FAQs and history into the prompt token budget
+    packed = pack_prompt(
+        build_system_prompt([], user_authenticated, username, None, conversation_summary),
+        message,
+        context_chunks,
+        faq_context,
+        (conversation_history or [])[-10:],
+        format_chunk=_format_context_item,
+        format_faq=_format_faq_item,
+    )
+
     # Build system prompt with context
     system_prompt = build_system_prompt(
-        context_chunks, user_authenticated, username, faq_context
+        packed.context_chunks,
+        user_authenticated,
+        username,
+        packed.faq_context,
+        conversation_summary,
+    )
+
+    turn_log["prompt_tokens"] = packed.token_counts["total"]
+
+    # Track the static prefix so provider prompt-cache effectiveness can be measured
+    prefix_hash = prompt_prefix_hash(build_static_prompt_prefix())
+    _prompt_prefix_counts[prefix_hash] += 1
+    logger.info(
+        "Prompt prefix v%s hash=%s (requests with this prefix: %s)",
+        PROMPT_PREFIX_VERSION,
+        prefix_hash,
+        _prompt_prefix_counts[prefix_hash],
     )
 
     # Use passed api_key or fall back to provider-specific key
     if not api_key:
-        api_key = get_provider_api_key(api_provider, _current_request_api_key)
+        api_key = get_provider_api_key(api_provider, current_provider_context().api_key)
 
-    if api_key and len(api_key) > 20:
-        logger.info(f"Streaming with API key: {api_key[:15]}...{api_key[-5:]}")
+    router = get_provider_router()
+    candidates = [
+        target
+        for target in get_provider_targets(api_provider, api_key)
+        if len(target.api_key) > 20
+    ]
+
+    if candidates:
+        target = candidates[0]
+        logger.info(
+            f"Streaming with API key: {target.api_key[:15]}...{target.api_key[-5:]}"
+        )
     else:
         logger.error(
             f"Invalid or missing API key! Length: {len(api_key) if api_key else 0}"
         )
-        yield f"data: {json.dumps({'content': 'API key not configured. Please check your settings.'})}\n\n"
+        turn_log["outcome"] = "no_api_key"
+        yield _error_frame("no_api_key", "API key not configured. Please check your settings.")
         yield "data: [DONE]\n\n"
         return
 
-    # Prepare API request headers
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    if api_provider == "openrouter":
-        headers["HTTP-Referer"] = "http://localhost:8000"
-        headers["X-Title"] = "Sweet Dessert Chat Assistant"
-
-    # Prepare request payload
+    # Prepare request payload (model is set per target by the router)
     llm_messages = [{"role": "system", "content": system_prompt}]
-    if conversation_history:
-        llm_messages.extend(conversation_history[-10:])
+    llm_messages.extend(packed.history)
     llm_messages.append({"role": "user", "content": message})
 
-    model_name = CEREBRAS_MODEL if api_provider == "cerebras" else OPENROUTER_MODEL
-    api_url = CEREBRAS_API_URL if api_provider == "cerebras" else OPENROUTER_API_URL
-
     payload = {
-        "model": model_name,
         "messages": llm_messages,
         "stream": True,
         "temperature": 0.7,
         "max_tokens": 400,
         "top_p": 0.9,
     }
+    reply_cache_key = _reply_cache_key(llm_messages)
+
+    # Daily token budget per key: shorter replies when low, none when spent
+    meter = get_token_meter()
+    candidates, budget_mode = meter.within_budget(candidates)
+    if budget_mode != NORMAL:
+        meter.note_degraded("reply", budget_mode)
+    if budget_mode == EXHAUSTED:
+        logger.warning("Token budget exhausted for every provider key, skipping AI call")
+        cached_reply = cache.get(reply_cache_key)
+        if cached_reply:
+            turn_log.update(outcome="cached", response=cached_reply)
+            yield f"data: {json.dumps({'content': cached_reply, 'cached': True}, ensure_ascii=False)}\n\n"
+        else:
+            turn_log["outcome"] = "budget_exhausted"
+            yield f"data: {json.dumps({'type': 'token_budget', 'mode': budget_mode})}\n\n"
+            budget_text = (
+                "Our assistant has reached its usage limit for today. "
+                "You can still browse the menu and order from the shop pages."
+            )
+            yield f"data: {json.dumps({'content': budget_text})}\n\n"
+        yield "data: [DONE]\n\n"
+        return
+    if budget_mode != NORMAL:
+        payload["max_tokens"] = min(
+            payload["max_tokens"], getattr(settings, "CHAT_ECONOMY_MAX_TOKENS", 200)
+        )
 
-    try:
-        # Make streaming request to selected provider
-        logger.info(
-            f"Making streaming request to {api_provider} with model: {model_name}"
+    def start_reply(reply_abort: threading.Event, reply_log: dict):
+        return _stream_reply(
+            router,
+            candidates,
+            payload,
+            reply_cache_key,
+            provider_pinned,
+            api_provider,
+            reply_abort,
+            timer,
+            reply_log,
+            intent,
         )
 
+    if not getattr(settings, "CHAT_SINGLE_FLIGHT", True):
+        yield from start_reply(abort_event, turn_log)
+        return
+
+    # Identical prompts to the same provider set share one upstream stream;
+    # sorted because round-robin rotates the candidate order
+    flight_key = (
+        reply_cache_key,
+        payload["max_tokens"],
+        tuple(sorted(f"{t.provider}:{t.model}:{key_fingerprint(t.api_key)}" for t in candidates)),
+    )
+    yield from get_single_flight().stream(flight_key, start_reply, abort_event, turn_log)
+
+
+def _stream_reply(
+    router,
+    candidates: list,
+    payload: dict,
+    reply_cache_key: str,
+    provider_pinned: bool,
+    api_provider: str,
+    abort_event: threading.Event,
+    timer: StageTimer,
+    turn_log: dict,
+    intent: str = "",
+):
+    """
+    Stream one LLM reply through the provider router.
+
+    Args:
+        router: Provider router
+        candidates: Provider targets with usable API keys
+        payload: Chat completion request body (model is set per target)
+        reply_cache_key: Cache key of the reply, for storing it and for provider_busy fallbacks
+        provider_pinned: Keep the chosen provider first instead of ranking
+        api_provider: Provider name, for error messages
+        abort_event: Stops the upstream stream when set
+        timer: Receives upstream_connect, first_token and stream_end stage timings
+        turn_log: Filled with provider, token counts, reply text and outcome
+        intent: Intent of the turn, for token usage metering
+
+    Yields:
+        Server-Sent Events formatted chunks, ending with [DONE]
+    """
+    try:
+        targets = router.rank(candidates, pinned=provider_pinned)
+        if not targets:
+            raise router.unavailable_error(candidates)
+
         content_received = False
-        buffer = ""
-
-        with requests.post(
-            api_url, headers=headers, json=payload, stream=True, timeout=30
-        ) as response:
-            response.raise_for_status()
-            # Force UTF-8 encoding to handle emojis correctly
-            response.encoding = "utf-8"
-            logger.info(f"{api_provider} response status: {response.status_code}")
-
-            # Use iter_content with SSE-style parsing
-            for chunk in response.iter_content(chunk_size=512, decode_unicode=True):
-                if not chunk:
-                    continue
-
-                buffer += chunk
-
-                while True:
-                    try:
-                        # Find the next complete SSE line
-                        line_end = buffer.find("\n")
-                        if line_end == -1:
-                            break
-
-                        line = buffer[:line_end].strip()
-                        buffer = buffer[line_end + 1 :]
-
-                        # Skip empty lines and processing messages
-                        if not line or line.startswith(":"):
-                            continue
-
-                        if line.startswith("data: "):
-                            data = line[6:]
-                            if data == "[DONE]":
-                                if not content_received:
-                                    logger.warning(
-                                        "No content received from AI, sending fallback"
-                                    )
-                                    yield f"data: {json.dumps({'content': 'I can help you with our desserts! What would you like to know?'})}\n\n"
-                                yield "data: [DONE]\n\n"
-                                return
-
-                            try:
-                                data_obj = json.loads(data)
-                                content = (
-                                    data_obj.get("choices", [{}])[0]
-                                    .get("delta", {})
-                                    .get("content")
-                                )
-                                if content:
-                                    content_received = True
-                                    # logger.info(f"AI content chunk: {content[:50]}...")
-                                    # Use ensure_ascii=False to send actual UTF-8 characters (emojis) instead of \u escape sequences
-                                    yield f"data: {json.dumps({'content': content}, ensure_ascii=False)}\n\n"
-                            except json.JSONDecodeError:
-                                pass
-                    except Exception as e:
-                        logger.warning(f"Buffer parsing error: {e}")
-                        break
+        reply_parts = []
+        # Optionally merge token deltas into fewer downstream frames
+        coalescer = ContentCoalescer(
+            interval=getattr(settings, "CHAT_SSE_COALESCE_MS", 0) / 1000,
+            max_chars=getattr(settings, "CHAT_SSE_COALESCE_CHARS", 64),
+        )
+        # Product names in the reply, found frame by frame as they are sent
+        mentions = (
+            get_product_mentions().matcher()
+            if getattr(settings, "CHAT_PRODUCT_MENTIONS", True)
+            else None
+        )
+
+        completion_budget = payload["max_tokens"]
+        max_stream_tokens = min(
+            getattr(settings, "CHAT_STREAM_MAX_TOKENS", completion_budget),
+            completion_budget,
+        )
+        max_stream_seconds = getattr(settings, "CHAT_STREAM_MAX_SECONDS", 60)
+        request_remaining = current_provider_context().remaining()
+        if request_remaining is not None:
+            max_stream_seconds = min(max_stream_seconds, request_remaining)
+        started_at = time.monotonic()
+        first_token_at = None
+        upstream_timings = {}
+        tokens_streamed = 0
+        abort_reason = None
+        interrupted = None
+
+        upstream = router.stream(
+            targets,
+            payload,
+            "Sweet Dessert Chat Assistant",
+            timeout=30,
+            abort_event=abort_event,
+            heartbeat=STREAM_HEARTBEAT_SECONDS,
+            timings=upstream_timings,
+        )
+        try:
+            for content in upstream:
+                if content is not None:
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                        if timer is not None:
+                            timer.add("upstream_connect", upstream_timings.get("upstream_connect") or 0.0)
+                            timer.add("first_token", first_token_at - started_at)
+                    content_received = True
+                    reply_parts.append(content)
+                    tokens_streamed += count_tokens(content)
+                    frame_content = coalescer.add(content)
+                    if frame_content:
+                        # format_sse sends actual UTF-8 characters (emojis) instead of \u escape sequences
+                        yield format_sse({"content": frame_content})
+                        if mentions is not None:
+                            yield from _product_mention_events(mentions.feed(frame_content))
+                else:
+                    # Idle keep-alive; under WSGI writing it is what reveals a closed client
+                    yield ": keep-alive\n\n"
+
+                if tokens_streamed >= max_stream_tokens:
+                    abort_reason = "max_tokens"
+                    break
+                if time.monotonic() - started_at >= max_stream_seconds:
+                    abort_reason = "max_duration"
+                    break
+        except StreamInterrupted as e:
+            # The provider dropped mid-answer; what was sent so far is incomplete
+            interrupted = e
+        except GeneratorExit:
+            # Client went away mid-answer (WSGI closes the response iterator)
+            turn_log["outcome"] = "aborted_disconnect"
+            record_stream_aborted(
+                "disconnect", tokens_streamed, completion_budget - tokens_streamed
+            )
+            raise
+        finally:
+            # Closing the router generator cancels the upstream request right away
+            upstream.close()
+            turn_log.update(
+                provider=upstream_timings.get("provider", ""),
+                completion_tokens=tokens_streamed,
+                response="".join(reply_parts),
+            )
+            if upstream_timings.get("provider"):
+                prompt_tokens, completion_tokens, estimated = _record_usage(
+                    "reply", upstream_timings, payload["messages"], turn_log["response"], intent
+                )
+                if not estimated:
+                    # Prefer the provider's billed counts for the chat log
+                    turn_log.update(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            # Cancelled hedges (and attempts the client never waited for) are billed as well
+            for attempt in upstream_timings.get("abandoned", []):
+                _record_usage("reply", attempt, payload["messages"], attempt["completion"], intent)
+            if timer is not None and first_token_at is not None:
+                timer.add("stream_end", time.monotonic() - first_token_at)
+
+        if abort_reason is None and abort_event is not None and abort_event.is_set():
+            turn_log["outcome"] = "aborted_disconnect"
+            record_stream_aborted(
+                "disconnect", tokens_streamed, completion_budget - tokens_streamed
+            )
+            return
+
+        frame_content = coalescer.flush()
+        if frame_content:
+            yield format_sse({"content": frame_content})
+        if mentions is not None:
+            yield from _product_mention_events(mentions.feed(frame_content or "") + mentions.finish())
+
+        if interrupted is not None:
+            # Not cached and not logged as completed: a retry should get a full answer
+            logger.warning("Reply cut off after %s tokens: %s", tokens_streamed, interrupted.__cause__)
+            turn_log["outcome"] = "error"
+            record_stream_aborted(
+                "upstream_error", tokens_streamed, completion_budget - tokens_streamed
+            )
+            yield _error_frame(
+                "stream_interrupted", "\n\nSorry, my answer was cut off. Please send your message again."
+            )
+            yield "data: [DONE]\n\n"
+            return
+
+        if abort_reason is not None:
+            logger.info(
+                "Stream stopped early (%s) after %s tokens", abort_reason, tokens_streamed
+            )
+            turn_log["outcome"] = f"aborted_{abort_reason}"
+            record_stream_aborted(
+                abort_reason, tokens_streamed, completion_budget - tokens_streamed
+            )
+            yield "data: [DONE]\n\n"
+            return
+        record_stream_completed(tokens_streamed)
+        turn_log["outcome"] = "completed"
 
         # Ensure we send DONE if not already sent
         if not content_received:
             logger.warning("Stream ended without content")
             yield f"data: {json.dumps({'content': 'I can help you with our desserts! What would you like to know?'})}\n\n"
+        else:
+            cache.set(reply_cache_key, "".join(reply_parts), REPLY_CACHE_TIMEOUT)
         yield "data: [DONE]\n\n"
 
+    except ProviderUnavailable as e:
+        # Every provider is rate limited or tripped: answer from cache or defer
+        logger.warning("Skipping AI call: %s (retry in %.0fs)", e, e.retry_after)
+        cached_reply = cache.get(reply_cache_key)
+        if cached_reply:
+            turn_log.update(outcome="cached", response=cached_reply)
+            yield f"data: {json.dumps({'content': cached_reply, 'cached': True}, ensure_ascii=False)}\n\n"
+        else:
+            turn_log["outcome"] = "provider_busy"
+            retry_after = max(1, round(e.retry_after))
+            busy_event = {"type": "provider_busy", "retry_after": retry_after}
+            yield f"data: {json.dumps(busy_event)}\n\n"
+            busy_text = (
+                "Our assistant is handling a lot of requests right now. "
+                f"Please try again in about {retry_after} seconds."
+            )
+            yield f"data: {json.dumps({'content': busy_text})}\n\n"
+        yield "data: [DONE]\n\n"
     except requests.exceptions.Timeout:
         logger.error("%s API request timed out", api_provider)
-        yield f"data: {json.dumps({'content': 'The AI service timed out. Please try again in a moment.'})}\n\n"
+        yield _error_frame("provider_timeout", "The AI service timed out. Please try again in a moment.")
         yield "data: [DONE]\n\n"
     except requests.exceptions.HTTPError as e:
         status_code = e.response.status_code if e.response is not None else None
@@ -1403,21 +1861,74 @@ def generate_chat_stream(
                 else "AI service returned an error. Please try again."
             )
 
-        yield f"data: {json.dumps({'content': message_text})}\n\n"
+        yield _error_frame("provider_error", message_text)
         yield "data: [DONE]\n\n"
     except requests.exceptions.RequestException as e:
         logger.error("%s API request failed: %s", api_provider, e)
-        yield f"data: {json.dumps({'content': 'Failed to connect to AI service. Please check your network and try again.'})}\n\n"
+        yield _error_frame(
+            "provider_unreachable", "Failed to connect to AI service. Please check your network and try again."
+        )
         yield "data: [DONE]\n\n"
     except Exception as e:
         logger.error(f"Unexpected error in chat generation: {e}")
-        yield f"data: {json.dumps({'content': 'An unexpected error occurred while generating the response. Please try again.'})}\n\n"
+        yield _error_frame(
+            "internal_error", "An unexpected error occurred while generating the response. Please try again."
+        )
         yield "data: [DONE]\n\n"
 
 
+def _error_frame(code: str, text: str) -> str:
+    """
+    SSE frame for a failed turn
+
+    The message is sent as content so chat clients show it like a reply;
+    the error type and code let other clients (and chat_loadtest) tell it
+    apart from a real answer.
+    """
+    return format_sse({"type": "error", "code": code, "content": text})
+
+
+def _product_mention_events(products: list) -> Iterator[str]:
+    """product_mention events for products whose name the reply just completed"""
+    for product in products:
+        yield format_sse({"type": "product_mention", "product": product})
+
+
+async def _async_event_stream(sync_stream, abort_event: threading.Event):
+    """
+    Drive a sync SSE generator from ASGI and flag client disconnects
+
+    Django cancels async streaming iterators when the client disconnects.
+    The cancellation lands here; the abort flag tells the worker thread to
+    stop reading from the provider and close the upstream response.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=False)
+    try:
+        while True:
+            chunk = await next_chunk(sync_stream, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        abort_event.set()
+        try:
+            await sync_to_async(sync_stream.close, thread_sensitive=False)()
+        except Exception:
+            # Still running in the worker thread; it stops on the abort flag
+            pass
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def chat_stream(request):
+    """
+    Serve a chat message in a fresh copy of the context so the provider
+    settings it sets never leak into other requests on the same thread.
+    """
+    return contextvars.copy_context().run(_chat_stream, request)
+
+
+def _chat_stream(request):
     """
     Main streaming chat endpoint with AI-powered intent detection
 
@@ -1426,20 +1937,152 @@ def chat_stream(request):
     - Vector search for context
     - Smart action handling based on AI intent
     - Cart management
+    - Templated replies for list/cart/checkout/product-info turns
+      (send "llm_reply": true to get an LLM-written reply instead)
     - Streaming AI responses
     - Authentication checking
     """
     try:
         # Parse request body
-        data = json.loads(request.body)
-        message = data.get("message", "").strip()
-        conversation_history = _normalize_conversation_history(data.get("history", []))
+        data = json.loads(request.body) if request.body else {}
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON in request body"}, status=400)
+
+    # A reconnect after a dropped connection: replay what was missed
+    last_event_id = request.headers.get("Last-Event-ID") or data.get("last_event_id")
+    if last_event_id:
+        return _resume_chat_stream(request, str(last_event_id))
+
+    turn = start_chat_turn(request, data)
+    if not isinstance(turn, ChatTurnStream):
+        return turn
+
+    # Create streaming response
+    # Every step of the body runs in this request's context, whichever thread drives it
+    events = iterate_in_context(turn.events)
+    if getattr(settings, "CHAT_STREAM_RESUME", True) and data.get("resumable"):
+        # Generated into a replay buffer by its own thread, so a dropped client
+        # can reconnect with Last-Event-ID instead of sending the message again.
+        # Only for clients that ask: everyone else's disconnect stops the upstream at once
+        replay = get_stream_replay().start(
+            events, request.session.session_key or "", turn.abort_event
+        )
+        response = _replay_response(request, replay, 0)
+    else:
+        response = _event_stream_response(request, events, turn.abort_event)
+    # Headers go out before the body, so only pre-stream stages are listed here;
+    # upstream stages arrive in the final "timing" event
+    response["Server-Timing"] = turn.timer.server_timing()
+
+    return response
+
+
+def _event_stream_response(request, stream, abort_event: threading.Event) -> StreamingHttpResponse:
+    """SSE response over a sync frame generator"""
+    # Under ASGI, drive the generator from an async wrapper so disconnects are seen
+    if isinstance(request, ASGIRequest):
+        stream = _async_event_stream(stream, abort_event)
+
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+
+    # Set headers for SSE (avoid hop-by-hop headers in WSGI)
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    # Note: Connection header removed - not allowed in WSGI
+    return response
+
+
+def _replay_response(request, replay, start: int) -> StreamingHttpResponse:
+    """
+    SSE response reading a replay buffer from a sequence number
+
+    A disconnect only detaches this reader; the generation keeps running for
+    CHAT_STREAM_RESUME_GRACE seconds in case the client comes back, holding
+    an admission slot meanwhile.
+    """
+    detach_event = threading.Event()
+    response = _event_stream_response(request, replay.read(start, detach_event), detach_event)
+    response["X-Chat-Stream-Id"] = replay.stream_id
+    return response
+
+
+def _resume_chat_stream(request, last_event_id: str):
+    """Attach to a running or just-finished stream after the frame the client last saw"""
+    parsed = parse_event_id(last_event_id)
+    replay = None
+    if parsed:
+        replay = get_stream_replay().get(parsed[0], request.session.session_key or "")
+    if replay is None or not replay.can_resume_from(parsed[1] + 1):
+        # Expired, never existed, served by another worker or fell out of the buffer
+        return JsonResponse(
+            {"error": "Stream can no longer be resumed", "code": "stream_expired"}, status=410
+        )
+    logger.info("Resuming chat stream %s after frame %s", parsed[0], parsed[1])
+    return _replay_response(request, replay, parsed[1] + 1)
+
+
+class ChatTurnStream(NamedTuple):
+    """A chat message that is ready to stream its reply"""
+
+    events: Iterator[str]  # SSE frames, ending with "data: [DONE]"
+    abort_event: threading.Event  # Set to cancel the upstream LLM stream
+    timer: StageTimer
+
+
+def start_chat_turn(request, data: dict):
+    """
+    Handle one chat message up to the point where its reply streams
+
+    Shared by the SSE endpoint and the WebSocket transport (chat_ws). Intent
+    analysis, search and cart changes happen here, in the caller's context
+    and before it saves the session; the returned events produce the reply.
+
+    Args:
+        request: Request (or connection) carrying user and session
+        data: Message payload (message, conversation_id, api_key, ...)
+
+    Returns:
+        ChatTurnStream, or a JsonResponse for invalid messages and errors
+    """
+    # Per-stage latency for the Server-Timing header, the final timing event and histograms
+    timer = StageTimer()
+    try:
+        message = str(data.get("message") or "").strip()
+        # New clients send only the conversation id and the last turn id they saw;
+        # older clients send the full history on every request
+        conversation_id = str(data.get("conversation_id") or "").strip()
+        last_turn_id = data.get("last_turn_id")
+        client_history = _normalize_conversation_history(data.get("history", []))
         frontend_api_key = data.get("api_key", "").strip()  # Get API key from frontend
         frontend_provider = data.get("api_provider", "").strip().lower()
         api_provider = detect_api_provider(frontend_api_key, frontend_provider)
+        # An explicit key/provider choice is tried first; otherwise rank by stats
+        provider_pinned = bool(frontend_api_key or frontend_provider)
+        # Structured intents get a templated reply unless the client opts into the LLM
+        use_templates = getattr(settings, "CHAT_TEMPLATE_REPLIES", True) and not data.get(
+            "llm_reply", False
+        )
+
+        # The client may choose among the chat models configured for its provider
+        requested_model = str(data.get("model") or "").strip()
+        if requested_model:
+            provider_config = get_provider_registry().get(api_provider)
+            if provider_config is None or requested_model not in provider_config.chat_models:
+                return JsonResponse(
+                    {"error": f"Model not available for {api_provider}", "code": "invalid_model"},
+                    status=400,
+                )
 
-        # Set the API key for this request context
-        set_request_api_key(frontend_api_key)
+        # Request-scoped provider settings, visible to the intent call, the
+        # streamed response and the router's upstream threads
+        set_provider_context(
+            api_key=frontend_api_key,
+            provider=api_provider,
+            model=requested_model or None,
+            pinned=provider_pinned,
+            deadline=time.monotonic()
+            + getattr(settings, "CHAT_REQUEST_DEADLINE_SECONDS", 90),
+        )
         logger.info(
             "Frontend API key provided: %s, provider: %s",
             bool(frontend_api_key),
@@ -1449,27 +2092,60 @@ def chat_stream(request):
         if not message:
             return JsonResponse({"error": "No message provided"}, status=400)
 
+        with timer.span("session"):
+            # Check authentication status
+            is_authenticated = request.user.is_authenticated
+            username = request.user.username if is_authenticated else None
+
+            # Server-side history keyed by session and conversation id
+            if not request.session.session_key:
+                request.session.save()
+            session_key = request.session.session_key
+            conversation_store = get_conversation_store()
+            conversation, conversation_reset = conversation_store.open(
+                session_key, conversation_id, last_turn_id, client_history
+            )
+            if conversation_reset and not client_history:
+                # Expired or evicted: answering without the earlier turns would
+                # lose context, so have the client resend this message with them
+                return JsonResponse(
+                    {
+                        "error": "Conversation not found, resend it with the full history",
+                        "code": "history_required",
+                    },
+                    status=409,
+                )
+            conversation_history = conversation_store.history(conversation)
+            conversation_store.append(session_key, conversation, "user", message)
+
+            chat_context = _get_chat_context(request)
+            if not conversation_history:
+                chat_context = {
+                    "last_product": None,
+                    "last_products": [],
+                    "last_intent": None,
+                }
+                _save_chat_context(request, chat_context)
+
         logger.info(
             f"Chat request: '{message[:100]}...' (history turns: {len(conversation_history)})"
         )
 
-        # Check authentication status
-        is_authenticated = request.user.is_authenticated
-        username = request.user.username if is_authenticated else None
+        # Identical work already running for another request is joined, not repeated
+        flight = get_single_flight()
+        normalized_message = normalize_text(message)
 
-        # Get vector database instance
-        vector_db = get_vector_db()
-        chat_context = _get_chat_context(request)
-        if not conversation_history:
-            chat_context = {
-                "last_product": None,
-                "last_products": [],
-                "last_intent": None,
-            }
-            _save_chat_context(request, chat_context)
+        with timer.span("vector_search"):
+            # Get vector database instance
+            vector_db = get_vector_db()
 
-        # Search ChromaDB for relevant context
-        search_results = vector_db.search(message, n_results=5)
+            # Search ChromaDB for relevant context (shared with identical messages in flight)
+            search_results = list(
+                flight.do(
+                    ("search", normalized_message, 5),
+                    lambda: vector_db.search(message, n_results=5),
+                )
+            )
 
         logger.info(f"Found {len(search_results)} relevant products from vector search")
 
@@ -1479,13 +2155,37 @@ def chat_stream(request):
         # ============================================
         # AI-POWERED INTENT ANALYSIS (First Pass)
         # ============================================
-        ai_intent = ai_analyze_intent(
-            message,
-            search_results,
-            conversation_history=conversation_history,
-            api_provider=api_provider,
-            api_key=current_api_key,
+        with timer.span("intent"):
+            def analyze():
+                return ai_analyze_intent(
+                    message,
+                    search_results,
+                    conversation_history=conversation_history,
+                    api_provider=api_provider,
+                    api_key=current_api_key,
+                    provider_pinned=provider_pinned,
+                )
+
+            if conversation_history:
+                # History changes the answer, so only first messages are shared
+                ai_intent = analyze()
+            else:
+                ai_intent = dict(
+                    flight.do(
+                        (
+                            "intent",
+                            normalized_message,
+                            api_provider,
+                            key_fingerprint(current_api_key),
+                            provider_pinned,
+                        ),
+                        analyze,
+                    )
+                )
+        intent_source = (
+            "fallback" if ai_intent.get("fallback") else "local" if ai_intent.get("local") else "ai"
         )
+        timer.rename("intent", f"intent_{intent_source}")
         intent_type = ai_intent.get("intent", "general_chat")
         intent_confidence = ai_intent.get("confidence", "low")
         product_mentioned = ai_intent.get("product_mentioned")
@@ -1499,13 +2199,15 @@ def chat_stream(request):
         # Get relevant FAQs if it's an FAQ intent
         faq_context = []
         if intent_type == "faq":
-            faq_context = get_relevant_faqs(message, limit=3)
+            with timer.span("faq"):
+                faq_context = get_relevant_faqs(message, limit=3)
             logger.info(f"Found {len(faq_context)} relevant FAQs")
 
         # Find the specific product if mentioned
         matched_product = None
         if product_mentioned and intent_type in ["order", "product_info"]:
-            matched_product = find_product_by_name(product_mentioned)
+            with timer.span("product_match"):
+                matched_product = find_product_by_name(product_mentioned)
             if matched_product:
                 logger.info(f"Matched product: {matched_product['name']}")
 
@@ -1526,7 +2228,8 @@ def chat_stream(request):
         # Get product list if listing intent
         product_list = []
         if intent_type == "list_products":
-            product_list = get_products_by_category(category_filter, limit=10)
+            with timer.span("product_match"):
+                product_list = get_products_by_category(category_filter, limit=10)
             logger.info(f"Found {len(product_list)} products for listing")
 
         # Force order action when message clearly asks to add/order and we resolved a product.
@@ -1553,8 +2256,50 @@ def chat_stream(request):
         chat_context["last_intent"] = intent_type
         _save_chat_context(request, chat_context)
 
+        # Constant-cost top-K counters for queries, products and intents
+        get_chat_sketches().record_turn(
+            message,
+            intent_type,
+            products=[matched_product["name"]] if matched_product else [],
+            zero_results=not search_results
+            or (intent_type == "faq" and not faq_context)
+            or (intent_type == "list_products" and not product_list),
+        )
+
+        # Apply the cart change now: the session is saved when this view returns,
+        # so changes made while the response streams would be lost
+        cart_event = None
+        if intent_type == "order" and matched_product and matched_product.get("id"):
+            with timer.span("cart"):
+                cart = SessionCart(request.session)
+                _line_id, line_quantity = cart.add(matched_product["id"], quantity)
+                cart.save()
+                added_product = dict(matched_product, quantity=quantity)
+                cart_event = {
+                    "type": "cart_update",
+                    "cart": cart.lines(),
+                    "added_products": [added_product],
+                }
+            if line_quantity > quantity:
+                cart_event["quantity_updated"] = True
+            else:
+                cart_event["show_confirmation"] = True
+            logger.info(
+                "Added %s (qty: %s, line total qty: %s) to cart for %s user",
+                matched_product["name"],
+                quantity,
+                line_quantity,
+                "authenticated" if is_authenticated else "guest",
+            )
+
+        # Set when the client disconnects so the upstream LLM stream is cancelled
+        abort_event = threading.Event()
+
         def event_stream():
             """Generate Server-Sent Events stream"""
+            action = ""
+            turn_log = {"outcome": "error"}
+            template_reply = None
 
             # Send intent analysis result to frontend (for transparency/debugging)
             intent_event = {
@@ -1578,21 +2323,26 @@ def chat_stream(request):
             # Handle LIST_PRODUCTS intent
             elif intent_type == "list_products":
                 if product_list:
+                    action = "list"
                     list_event = {
                         "type": "product_list",
                         "products": product_list,
                         "category": category_filter,
                     }
                     yield f"data: {json.dumps(list_event)}\n\n"
+                    if use_templates:
+                        template_reply = render_product_list(product_list, category_filter)
 
             # Handle FAQ intent
             elif intent_type == "faq":
                 if faq_context:
+                    action = "faq"
                     faq_event = {"type": "faq_suggestions", "faqs": faq_context}
                     yield f"data: {json.dumps(faq_event)}\n\n"
 
             # Handle CHECKOUT intent
             elif intent_type == "checkout":
+                action = "checkout"
                 if not is_authenticated:
                     auth_event = {
                         "type": "auth_required",
@@ -1602,115 +2352,113 @@ def chat_stream(request):
                 else:
                     checkout_event = {"type": "redirect_checkout"}
                     yield f"data: {json.dumps(checkout_event)}\n\n"
+                if use_templates:
+                    template_reply = render_checkout(
+                        SessionCart(request.session).lines(), is_authenticated
+                    )
 
-            # Handle ORDER intent - add to cart
-            elif intent_type == "order" and matched_product:
-                # Allow guest + authenticated users to add to cart in session.
-                if "cart" not in request.session:
-                    request.session["cart"] = []
-
-                # Check if product already in cart
-                existing = next(
-                    (
-                        p
-                        for p in request.session["cart"]
-                        if p["name"] == matched_product["name"]
-                    ),
-                    None,
-                )
-
-                if not existing:
-                    # Add quantity to product
-                    product_to_add = matched_product.copy()
-                    product_to_add["quantity"] = quantity
-
-                    request.session["cart"].append(product_to_add)
-                    request.session.modified = True
-
-                    cart_event = {
-                        "type": "cart_update",
-                        "cart": request.session["cart"],
-                        "added_products": [product_to_add],
-                        "show_confirmation": True,
-                    }
-                    yield f"data: {json.dumps(cart_event)}\n\n"
-
-                    logger.info(
-                        "Added %s (qty: %s) to cart for %s user",
-                        matched_product["name"],
+            # Handle ORDER intent - the cart was updated before streaming started
+            elif cart_event is not None:
+                action = "add_to_cart"
+                yield f"data: {json.dumps(cart_event)}\n\n"
+                if use_templates:
+                    template_reply = render_cart_update(
+                        cart_event["added_products"][0],
                         quantity,
-                        "authenticated" if is_authenticated else "guest",
-                    )
-                else:
-                    # Product already in cart, update quantity
-                    for item in request.session["cart"]:
-                        if item["name"] == matched_product["name"]:
-                            item["quantity"] = item.get("quantity", 1) + quantity
-                            break
-                    request.session.modified = True
-
-                    updated_product = matched_product.copy()
-                    updated_product["quantity"] = quantity
-                    cart_event = {
-                        "type": "cart_update",
-                        "cart": request.session["cart"],
-                        "added_products": [updated_product],
-                        "quantity_updated": True,
-                    }
-                    yield f"data: {json.dumps(cart_event)}\n\n"
-                    logger.info(
-                        "Updated quantity for %s in cart for %s user",
-                        matched_product["name"],
-                        "authenticated" if is_authenticated else "guest",
+                        cart_event["cart"],
+                        quantity_updated=cart_event.get("quantity_updated", False),
                     )
 
             # Handle PRODUCT_INFO intent
             elif intent_type == "product_info" and matched_product:
+                action = "product_info"
                 product_info_event = {
                     "type": "product_info",
                     "product": matched_product,
                 }
                 yield f"data: {json.dumps(product_info_event)}\n\n"
+                if use_templates:
+                    with timer.span("template"):
+                        template_reply = render_product_info(matched_product.get("id"), message)
 
             # ============================================
             # GENERATE AI RESPONSE
             # ============================================
             try:
-                # Get the API key to use (frontend key or env fallback)
-                current_api_key = get_provider_api_key(api_provider, frontend_api_key)
-                for chunk in generate_chat_stream(
-                    message,
-                    search_results,
-                    is_authenticated,
-                    username,
-                    faq_context,
-                    conversation_history=conversation_history,
-                    api_provider=api_provider,
-                    api_key=current_api_key,
-                ):
-                    yield chunk
+                if template_reply is not None:
+                    # Rendered locally: no provider call and no tokens spent
+                    llm_stream = stream_template_reply(template_reply, turn_log)
+                else:
+                    # Get the API key to use (frontend key or env fallback)
+                    current_api_key = get_provider_api_key(api_provider, frontend_api_key)
+                    llm_stream = generate_chat_stream(
+                        message,
+                        search_results,
+                        is_authenticated,
+                        username,
+                        faq_context,
+                        conversation_history=conversation_history,
+                        api_provider=api_provider,
+                        api_key=current_api_key,
+                        provider_pinned=provider_pinned,
+                        abort_event=abort_event,
+                        timer=timer,
+                        turn_log=turn_log,
+                        conversation_summary=conversation["summary"],
+                        intent=intent_type,
+                    )
+                try:
+                    for chunk in llm_stream:
+                        if chunk == "data: [DONE]\n\n":
+                            last_turn = conversation["next_id"] - 1
+                            if turn_log.get("response"):
+                                last_turn = conversation_store.append(
+                                    session_key, conversation, "assistant", turn_log["response"]
+                                )
+                            # Lets the client send only deltas on the next message
+                            conversation_event = {
+                                "type": "conversation",
+                                "conversation_id": conversation["id"],
+                                "last_turn_id": last_turn,
+                                "reset": conversation_reset,
+                            }
+                            yield format_sse(conversation_event)
+                            # Report where the time went just before the stream ends
+                            timing_event = {"type": "timing", "stages": timer.record()}
+                            yield format_sse(timing_event)
+                        yield chunk
+                finally:
+                    # Forward close() so a disconnect cancels the upstream stream
+                    llm_stream.close()
+                    # Queued for a background batch insert; no DB work on this path
+                    log_chat_turn(
+                        session_key=request.session.session_key or "",
+                        user_id=request.user.id if is_authenticated else None,
+                        message=message,
+                        response=turn_log.get("response", ""),
+                        intent=intent_type,
+                        confidence=str(intent_confidence),
+                        intent_fallback=bool(ai_intent.get("fallback")),
+                        intent_source=intent_source,
+                        action=action,
+                        products=[matched_product["name"]] if matched_product else [],
+                        provider=turn_log.get("provider", ""),
+                        prompt_tokens=turn_log.get("prompt_tokens", 0),
+                        completion_tokens=turn_log.get("completion_tokens", 0),
+                        outcome=turn_log["outcome"],
+                        response_time_ms=round(timer.elapsed() * 1000),
+                        timings=timer.as_dict(),
+                    )
             except Exception as e:
                 logger.error(f"Error generating AI response: {e}", exc_info=True)
-                error_event = {
-                    "content": "I apologize, but I'm having trouble generating a response. Please try again."
-                }
-                yield f"data: {json.dumps(error_event)}\n\n"
+                yield _error_frame(
+                    "internal_error",
+                    "I apologize, but I'm having trouble generating a response. Please try again.",
+                )
                 yield "data: [DONE]\n\n"
 
-        # Create streaming response
-        response = StreamingHttpResponse(
-            event_stream(), content_type="text/event-stream"
-        )
-
-        # Set headers for SSE (avoid hop-by-hop headers in WSGI)
-        response["Cache-Control"] = "no-cache"
-        response["X-Accel-Buffering"] = "no"
-        # Note: Connection header removed - not allowed in WSGI
+        return ChatTurnStream(event_stream(), abort_event, timer)
 
-        return response
-
-    except json.JSONDecodeError:
-        return JsonResponse({"error": "Invalid JSON in request body"}, status=400)
     except Exception as e:
         logger.error(f"Error in chat_stream: {e}", exc_info=True)
         return JsonResponse({"error": "Internal server error"}, status=500)
@@ -1720,49 +2468,67 @@ def chat_stream(request):
 @require_http_methods(["POST"])
 def add_to_cart(request):
     """
-    Add product to cart by name/query
+    Add a product to the session cart
 
-    Query Params:
-        product: Product name or search query
+    Body (JSON) or Query Params:
+        product_id: DessertItem id
+        product: Product name or search query (used when no id is given)
+        quantity: How many to add (default 1)
+        customizations: Optional dict of choices, kept as a separate cart line
     """
     try:
-        product_query = request.GET.get("product", "").strip()
-
-        if not product_query:
+        try:
+            data = json.loads(request.body) if request.body else {}
+        except json.JSONDecodeError:
+            return JsonResponse({"error": "Invalid JSON in request body"}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({"error": "Request body must be a JSON object"}, status=400)
+        params = {**request.GET.dict(), **data}
+        product_id = params.get("product_id")
+        product_query = str(params.get("product", "")).strip()
+        customizations = params.get("customizations") or None
+        if customizations is not None and not isinstance(customizations, dict):
+            return JsonResponse({"error": "customizations must be an object"}, status=400)
+        try:
+            quantity = max(1, int(params.get("quantity", 1)))
+        except (TypeError, ValueError):
+            return JsonResponse({"error": "Invalid quantity"}, status=400)
+        if product_id:
+            try:
+                product_id = int(product_id)
+            except (TypeError, ValueError):
+                return JsonResponse({"error": "Invalid product_id"}, status=400)
+
+        product = None
+        if product_id:
+            product = (
+                DessertItem.objects.filter(id=product_id, available=True)
+                .values("id", "name")
+                .first()
+            )
+        elif product_query:
+            product = find_product_by_name(product_query)
+            if product is None:
+                # Fall back to semantic search, then map the hit to the catalog
+                search_results = get_vector_db().search(product_query, n_results=1)
+                if search_results:
+                    metadata = search_results[0].get("metadata", {})
+                    product = find_product_by_name(metadata.get("product_name", ""))
+        else:
             return JsonResponse({"error": "No product specified"}, status=400)
 
-        # Get vector database
-        vector_db = get_vector_db()
-
-        # Search for product
-        search_results = vector_db.search(product_query, n_results=1)
-
-        if not search_results:
+        if not product:
             return JsonResponse({"error": "Product not found"}, status=404)
 
-        # Extract product info
-        result = search_results[0]
-        metadata = result.get("metadata", {})
-
-        product = {
-            "name": metadata.get("product_name", product_query),
-            "price": metadata.get("price", "N/A"),
-            "category": metadata.get("category", "Dessert"),
-        }
-
-        # Initialize cart if not exists
-        if "cart" not in request.session:
-            request.session["cart"] = []
-
-        # Add product to cart
-        request.session["cart"].append(product)
-        request.session.modified = True
+        cart = SessionCart(request.session)
+        line_id, line_quantity = cart.add(product["id"], quantity, customizations)
+        cart.save()
 
-        logger.info(f"Added product to cart: {product['name']}")
+        logger.info(f"Added product to cart: {product['name']} (qty: {quantity})")
 
-        return JsonResponse(
-            {"success": True, "cart": request.session["cart"], "added_product": product}
-        )
+        lines = cart.lines()
+        added = next((line for line in lines if line["line_id"] == line_id), None)
+        return JsonResponse({"success": True, "cart": lines, "added_product": added})
 
     except Exception as e:
         logger.error(f"Error in add_to_cart: {e}", exc_info=True)
@@ -1771,17 +2537,39 @@ def add_to_cart(request):
 
 @require_http_methods(["GET"])
 def get_cart(request):
-    """Get current cart contents"""
-    cart = request.session.get("cart", [])
-    return JsonResponse({"cart": cart, "count": len(cart)})
+    """
+    Get current cart contents
+
+    "count" is the number of cart lines, as before; "item_count" is the
+    total quantity across them.
+    """
+    cart = SessionCart(request.session)
+    lines = cart.lines()
+    item_count = sum(line["quantity"] for line in lines)
+    return JsonResponse({"cart": lines, "count": len(lines), "item_count": item_count})
+
+
+@require_http_methods(["GET"])
+def cart_quote(request):
+    """
+    Price the session cart: line totals, delivery fee, tax and total
+
+    Query Params:
+        order_type: "delivery" (default) or "takeaway"
+    """
+    order_type = request.GET.get("order_type", "delivery")
+    if order_type not in ("delivery", "takeaway"):
+        return JsonResponse({"error": "order_type must be delivery or takeaway"}, status=400)
+    return JsonResponse(SessionCart(request.session).quote(order_type))
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def clear_cart(request):
     """Clear all items from cart"""
-    request.session["cart"] = []
-    request.session.modified = True
+    cart = SessionCart(request.session)
+    cart.clear()
+    cart.save()
 
     logger.info("Cart cleared")
 
@@ -1799,10 +2587,24 @@ def chat_stats(request):
             {
                 "success": True,
                 "stats": stats,
-                "api_configured": bool(
-                    get_provider_api_key("openrouter")
-                    or get_provider_api_key("cerebras")
-                ),
+                "api_configured": get_provider_registry().configured(),
+                "provider_config": get_provider_registry().describe(),
+                "providers": get_provider_router().snapshot(),
+                "provider_limits": get_provider_guard().snapshot(),
+                "streams": stream_stats(),
+                "latency": stage_stats(),
+                "chat_log": get_chat_log_writer().stats(),
+                "faq_index": get_faq_index().stats(),
+                "product_mentions": get_product_mentions().stats(),
+                "token_usage": get_token_meter().report(),
+                "stream_replay": get_stream_replay().stats(),
+                "admission": get_admission_controller().stats(),
+                "single_flight": get_single_flight().stats(),
+                "prompt_budget": prompt_budget_stats(),
+                "prompt_prefix": {
+                    "version": PROMPT_PREFIX_VERSION,
+                    "hashes": dict(_prompt_prefix_counts.most_common(5)),
+                },
             }
         )
     except Exception as e:
@@ -1810,6 +2612,19 @@ def chat_stats(request):
         return JsonResponse({"success": False, "error": str(e)}, status=500)
 
 
+def _turn_response_time_percentile(turns, pct: int):
+    """Response time (ms) at the given percentile, using the ordered queryset"""
+    timed = turns.filter(response_time_ms__isnull=False)
+    count = timed.count()
+    if not count:
+        return None
+    index = min(count - 1, int(pct / 100 * count))
+    return (
+        timed.order_by("response_time_ms")
+        .values_list("response_time_ms", flat=True)[index]
+    )
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def chat_analytics(request):
@@ -1817,23 +2632,25 @@ def chat_analytics(request):
     Get comprehensive chat assistant analytics for admin panel
     """
     try:
-        from datetime import datetime, timedelta
-        from django.db.models import Count, Q
-        from collections import Counter
+        from datetime import timedelta
+        from django.db.models import Avg, Count
+        from django.utils import timezone
 
         time_range = request.GET.get("range", "7days")
 
         # Calculate date filter
-        now = datetime.now()
+        now = timezone.now()
         if time_range == "7days":
             start_date = now - timedelta(days=7)
         elif time_range == "30days":
             start_date = now - timedelta(days=30)
         else:
-            start_date = datetime.min
+            start_date = None
 
-        # Mock data for now - will be replaced with actual database queries when chat history model is created
-        # In production, you'd have a ChatConversation model to store these
+        # Chat turns logged by chat_stream (indexed on created_at)
+        turns = ChatTurn.objects.all()
+        if start_date is not None:
+            turns = turns.filter(created_at__gte=start_date)
 
         # Get vector DB status with error handling
         vector_db_count = 0
@@ -1854,39 +2671,44 @@ def chat_analytics(request):
             vector_db_count = 0
 
         # Get popular products from recent orders
-        from .models import Order, OrderItem
+        from .models import OrderItem
 
-        # Orders in time range
-        recent_orders = (
-            Order.objects.filter(created_at__gte=start_date)
-            if time_range != "all"
-            else Order.objects.all()
+        # A conversation is one session; turns without a session count on their own
+        session_turns = turns.exclude(session_key="")
+        total_conversations = (
+            session_turns.values("session_key").distinct().count()
+            + turns.filter(session_key="").count()
         )
 
-        # Count orders that likely came from chat (could be enhanced with a 'source' field)
-        total_conversations = (
-            recent_orders.count() * 2
-        )  # Approximate: each order might have 2-3 chat interactions
-        orders_via_chat = recent_orders.filter(
-            Q(customer_notes__icontains="chat") | Q(status="confirmed")
-        ).count()
-
-        # Get popular products
-        popular_products_data = (
-            OrderItem.objects.filter(
-                order__created_at__gte=start_date
-                if time_range != "all"
-                else datetime.min
-            )
-            .values("product__name", "product__category__name")
+        # Sessions that added something to the cart via chat, and those that went on to checkout
+        cart_sessions = session_turns.filter(action="add_to_cart").values("session_key")
+        orders_via_chat = (
+            session_turns.filter(action="checkout", session_key__in=cart_sessions)
+            .values("session_key")
+            .distinct()
+            .count()
+        )
+        carts_started = cart_sessions.distinct().count()
+
+        # Get popular products (order items store the product name, not a FK)
+        order_items = OrderItem.objects.all()
+        if start_date is not None:
+            order_items = order_items.filter(order__created_at__gte=start_date)
+        popular_products_data = list(
+            order_items.values("product_name")
             .annotate(count=Count("id"))
             .order_by("-count")[:10]
         )
+        categories = dict(
+            DessertItem.objects.filter(
+                name__in=[item["product_name"] for item in popular_products_data]
+            ).values_list("name", "category__name")
+        )
 
         popular_products = [
             {
-                "name": item["product__name"],
-                "category": item["product__category__name"] or "Unknown",
+                "name": item["product_name"],
+                "category": categories.get(item["product_name"]) or "Unknown",
                 "count": item["count"],
             }
             for item in popular_products_data
@@ -1894,44 +2716,74 @@ def chat_analytics(request):
 
         # Calculate conversion rate
         successful_orders = orders_via_chat
-        abandoned_carts = max(0, total_conversations - successful_orders)
+        abandoned_carts = max(0, carts_started - successful_orders)
         conversion_rate = (
             round((successful_orders / total_conversations * 100), 2)
             if total_conversations > 0
             else 0
         )
 
-        # Common queries (mock data - would come from ChatConversation model in production)
+        # Top queries, zero-result queries, products and intents from the streaming sketches
+        heavy_hitters = heavy_hitter_report(start_date.date() if start_date is not None else None)
+
+        # Most frequent messages from the query sketch, labelled with the intent
+        # of their latest turn among the most recent ones (read via the created_at index)
+        query_intents = {}
+        for turn_message, turn_intent in turns.values_list("message", "intent")[
+            :COMMON_QUERY_INTENT_TURNS
+        ]:
+            query_intents.setdefault(normalize_query(turn_message), turn_intent)
         common_queries = [
-            {"query": "Show me chocolate desserts", "intent": "list", "count": 45},
-            {"query": "I want to order a cake", "intent": "order", "count": 38},
-            {"query": "What desserts do you have?", "intent": "list", "count": 32},
-            {"query": "Show me all products", "intent": "list", "count": 28},
-            {"query": "I need a birthday cake", "intent": "order", "count": 24},
-            {"query": "What are your prices?", "intent": "info", "count": 19},
+            {
+                "query": hit["key"],
+                "intent": query_intents.get(hit["key"], "unknown"),
+                "count": hit["count"],
+            }
+            for hit in heavy_hitters["query"][:6]
         ]
 
-        # Recent conversations (mock data - would come from ChatConversation model)
         recent_conversations = [
             {
-                "session_id": f"session_{i}",
-                "message": f"Sample conversation {i}",
-                "response": "AI response",
-                "action": "add_to_cart" if i % 3 == 0 else "list",
-                "products": ["All-Chocolate Dreamcake"] if i % 3 == 0 else [],
-                "timestamp": (now - timedelta(hours=i)).isoformat(),
+                "session_id": turn["session_key"] or f"turn_{turn['id']}",
+                "message": turn["message"],
+                "response": turn["response"][:300],
+                "intent": turn["intent"],
+                "action": turn["action"],
+                "products": turn["products"],
+                "timestamp": turn["created_at"].isoformat(),
             }
-            for i in range(1, 11)
+            for turn in turns.values(
+                "id", "session_key", "message", "response", "intent", "action", "products", "created_at"
+            )[:10]
         ]
 
-        # Get unique users (based on orders for now)
-        unique_users = recent_orders.values("customer_email").distinct().count()
+        # Logged-in users plus guest sessions
+        unique_users = (
+            turns.filter(user__isnull=False).values("user").distinct().count()
+            + session_turns.filter(user__isnull=True).values("session_key").distinct().count()
+        )
+
+        avg_response_time = turns.aggregate(avg=Avg("response_time_ms"))["avg"] or 0
+        response_time_percentiles = {
+            f"p{pct}": _turn_response_time_percentile(turns, pct) for pct in (50, 95, 99)
+        }
 
         analytics_data = {
             "total_conversations": total_conversations,
             "orders_via_chat": orders_via_chat,
-            "unique_users": max(unique_users, total_conversations // 3),  # Estimate
-            "avg_response_time": 234,  # Mock - would be calculated from actual response times
+            "unique_users": unique_users,
+            "avg_response_time": round(avg_response_time),
+            "response_time_percentiles": response_time_percentiles,
+            # Per-stage percentiles measured by this worker since it started
+            "stage_latency": stage_stats(),
+            "heavy_hitters": heavy_hitters,
+            "intent_mix": dict(
+                turns.values_list("intent").annotate(count=Count("id")).order_by()
+            ),
+            # How many turns the local classifier answered without a remote call
+            "intent_sources": dict(
+                turns.values_list("intent_source").annotate(count=Count("id")).order_by()
+            ),
             "conversion_rate": conversion_rate,
             "successful_orders": successful_orders,
             "abandoned_carts": abandoned_carts,
@@ -0,0 +1,372 @@
+"""
+WebSocket chat transport for Sweet Dessert Chat Assistant
+An optional, persistent alternative to POSTing each message to /chat/stream/.
+The session and user are loaded once when the socket opens; each message
+takes a chat admission slot (sweetapp.admission) as a POST would, then runs
+the same turn as the SSE endpoint (start_chat_turn) and its events are sent
+as text frames carrying the same JSON payloads (intent_detected,
+product_list, cart_update, content, ...) followed by "[DONE]". The server
+pings idle sockets, stops reading the LLM stream while a slow client's send
+queue is full, and pushes order status changes to the customer's sockets.
+
+Served by the ASGI app (backend/asgi.py) at CHAT_WS_PATH. Frames from the
+client are JSON objects:
+    {"type": "message", "message": "...", ...}  same fields as the POST body
+    {"type": "cancel"}                          stop the reply being streamed
+    {"type": "ping"} / {"type": "pong"}         heartbeats
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import aclosing
+from http.cookies import SimpleCookie
+from importlib import import_module
+from typing import Dict, Optional, Set
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.http import HttpRequest
+
+from .admission import AdmissionRejected, get_admission_controller
+from .chat_views import ChatTurnStream, _async_event_stream, start_chat_turn
+from .models import Order
+from .provider_context import iterate_in_context
+from .sse import SSEParser
+
+logger = logging.getLogger(__name__)
+
+CHAT_WS_PATH = getattr(settings, "CHAT_WS_PATH", "/api/chat/ws/")
+
+# Close codes (4000-4999 are application defined)
+CLOSE_FORBIDDEN = 4003
+CLOSE_NOT_FOUND = 4004
+CLOSE_IDLE = 4008
+CLOSE_ERROR = 1011
+
+# Open sockets by lowercased customer email, for server pushes
+_sockets_by_email: Dict[str, Set["ChatSocket"]] = {}
+_sockets_lock = threading.Lock()
+_socket_count = 0
+
+
+def socket_stats() -> dict:
+    """Open sockets in this worker"""
+    with _sockets_lock:
+        return {
+            "open": _socket_count,
+            "signed_in": sum(len(sockets) for sockets in _sockets_by_email.values()),
+        }
+
+
+def push_to_customer(email: str, event: dict) -> int:
+    """
+    Send an event to every open socket of a customer in this worker
+
+    Safe to call from any thread. Pushes are dropped for sockets whose send
+    queue is full rather than blocking the caller.
+
+    Returns:
+        Number of sockets the event was queued for
+    """
+    if not email:
+        return 0
+    with _sockets_lock:
+        sockets = list(_sockets_by_email.get(email.lower(), ()))
+    for socket in sockets:
+        socket.push(event)
+    return len(sockets)
+
+
+@receiver(post_save, sender=Order)
+def _order_saved(sender, instance, created, **kwargs):
+    if not _sockets_by_email:
+        return
+    push_to_customer(
+        instance.customer_email,
+        {
+            "type": "order_status",
+            "order_number": instance.order_number,
+            "status": instance.status,
+            "status_display": instance.get_status_display_with_context(),
+            "payment_status": instance.payment_status,
+            "created": created,
+        },
+    )
+
+
+def _origin_allowed(headers: Dict[str, str]) -> bool:
+    """Browsers send cookies with cross-site sockets too, so apply the CORS origin list"""
+    origin = headers.get("origin")
+    if origin is None or getattr(settings, "CORS_ALLOW_ALL_ORIGINS", False):
+        return True
+    return origin in getattr(settings, "CORS_ALLOWED_ORIGINS", [])
+
+
+class ChatSocket:
+    """One client connection, driven by the ASGI server"""
+
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.headers = {
+            name.decode("latin-1").lower(): value.decode("latin-1")
+            for name, value in scope.get("headers", [])
+        }
+        self.ping_seconds = getattr(settings, "CHAT_WS_PING_SECONDS", 20)
+        self.idle_seconds = getattr(settings, "CHAT_WS_IDLE_SECONDS", 60)
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=getattr(settings, "CHAT_WS_SEND_QUEUE", 64))
+        self.request: Optional[HttpRequest] = None
+        self.email = ""
+        self.loop = None
+        self.turn_task: Optional[asyncio.Task] = None
+        self.turn_abort: Optional[threading.Event] = None
+        self.last_received = time.monotonic()
+        self.last_sent = time.monotonic()
+
+    # ---- connection state, loaded once ----
+
+    def _open(self):
+        """Load the session and user the way SessionMiddleware and AuthenticationMiddleware would"""
+        request = HttpRequest()
+        request.method = "WEBSOCKET"
+        request.path = self.scope.get("path", "")
+        client = self.scope.get("client") or ("", 0)
+        request.META.update(REMOTE_ADDR=client[0], HTTP_USER_AGENT=self.headers.get("user-agent", ""))
+        cookies = SimpleCookie()
+        cookies.load(self.headers.get("cookie", ""))
+        request.COOKIES = {name: morsel.value for name, morsel in cookies.items()}
+
+        engine = import_module(settings.SESSION_ENGINE)
+        request.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+        request.user = auth.get_user(request)
+        self.request = request
+        if request.user.is_authenticated:
+            self.email = (request.user.email or "").lower()
+
+    def _refresh_session(self):
+        """
+        Re-read session data before a message
+
+        Another tab may have changed the cart over HTTP; the session engine
+        serves this from its cache, so no database query is made.
+        """
+        session_key = self.request.session.session_key
+        if session_key:
+            engine = import_module(settings.SESSION_ENGINE)
+            self.request.session = engine.SessionStore(session_key)
+
+    def _save_session(self):
+        session = self.request.session
+        if session.modified or settings.SESSION_SAVE_EVERY_REQUEST:
+            if not session.is_empty():
+                session.save()
+
+    # ---- sending ----
+
+    def push(self, event: dict):
+        """Queue a server-initiated event from any thread; dropped if the client is backed up"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._offer, json.dumps(event))
+
+    def _offer(self, text: str):
+        try:
+            self.outbox.put_nowait(text)
+        except asyncio.QueueFull:
+            logger.debug("Dropped a push for a slow chat socket")
+
+    async def _writer(self):
+        while True:
+            text = await self.outbox.get()
+            if text is None:
+                await self.send({"type": "websocket.close", "code": CLOSE_IDLE})
+                return
+            # Waits while the server's buffer for this client is full; the
+            # queue then fills and turn streaming pauses (backpressure)
+            await self.send({"type": "websocket.send", "text": text})
+            self.last_sent = time.monotonic()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.ping_seconds)
+            now = time.monotonic()
+            if now - self.last_received > self.idle_seconds:
+                logger.info("Closing chat socket idle for %.0fs", now - self.last_received)
+                self._offer(None)
+                return
+            if now - self.last_sent >= self.ping_seconds:
+                self._offer(json.dumps({"type": "ping"}))
+
+    async def _error(self, error: str, status: int = 400):
+        await self.outbox.put(json.dumps({"type": "error", "error": error, "status": status}))
+
+    # ---- chat turns ----
+
+    async def _admit(self, controller) -> bool:
+        """
+        Take a chat slot for one turn, or tell the client to retry later
+
+        The socket bypasses AdmissionMiddleware, so each turn is admitted here.
+        """
+        # Queue waits block, so keep them off the event loop
+        acquire = asyncio.ensure_future(
+            sync_to_async(controller.acquire_chat, thread_sensitive=False)()
+        )
+        try:
+            await asyncio.shield(acquire)
+        except AdmissionRejected as rejected:
+            await self.outbox.put(json.dumps({
+                "type": "error",
+                "error": "The chat assistant is busy right now, please try again shortly",
+                "status": 503,
+                "code": "overloaded",
+                "reason": rejected.reason,
+                "retry_after": rejected.retry_after,
+            }))
+            return False
+        except asyncio.CancelledError:
+            # The wait goes on in its thread; hand the slot back if it gets one
+            acquire.add_done_callback(
+                lambda future: future.cancelled() or future.exception() or controller.release_chat()
+            )
+            raise
+        return True
+
+    async def _run_turn(self, data: dict):
+        context = contextvars.copy_context()
+        controller = get_admission_controller()
+        if not await self._admit(controller):
+            return
+        started = time.monotonic()
+        try:
+            await sync_to_async(self._refresh_session)()
+            turn = await sync_to_async(context.run)(start_chat_turn, self.request, data)
+            if not isinstance(turn, ChatTurnStream):
+                payload = json.loads(turn.content or b"{}")
+                await self._error(payload.get("error", "Request failed"), turn.status_code)
+                return
+            # Cart and context changes were made before streaming, as in the SSE view
+            await sync_to_async(self._save_session)()
+
+            self.turn_abort = turn.abort_event
+            parser = SSEParser()
+            events = iterate_in_context(turn.events, context)
+            async with aclosing(_async_event_stream(events, turn.abort_event)) as stream:
+                async for chunk in stream:
+                    for event in parser.feed(chunk.encode("utf-8")):
+                        await self.outbox.put(event.data)
+        except asyncio.CancelledError:
+            # Cancelled by the client or by a disconnect; the stream was closed above
+            self._offer(json.dumps({"type": "cancelled"}))
+            raise
+        except Exception as e:
+            logger.error(f"Error in chat socket turn: {e}", exc_info=True)
+            await self._error("Internal server error", 500)
+        finally:
+            self.turn_abort = None
+            controller.release_chat(time.monotonic() - started)
+
+    async def _handle(self, text: str):
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            await self._error("Invalid JSON")
+            return
+        if not isinstance(data, dict):
+            await self._error("Expected a JSON object")
+            return
+
+        kind = data.get("type", "message")
+        if kind == "ping":
+            await self.outbox.put(json.dumps({"type": "pong"}))
+        elif kind == "pong":
+            pass
+        elif kind == "cancel":
+            if self.turn_task is not None and not self.turn_task.done():
+                self.turn_task.cancel()
+        elif kind == "message":
+            if self.turn_task is not None and not self.turn_task.done():
+                await self._error("A reply is still streaming; send cancel first", 409)
+                return
+            self.turn_task = asyncio.create_task(self._run_turn(data))
+        else:
+            await self._error(f"Unknown message type: {kind}")
+
+    # ---- lifecycle ----
+
+    def _register(self):
+        global _socket_count
+        with _sockets_lock:
+            _socket_count += 1
+            if self.email:
+                _sockets_by_email.setdefault(self.email, set()).add(self)
+
+    def _unregister(self):
+        global _socket_count
+        with _sockets_lock:
+            _socket_count -= 1
+            sockets = _sockets_by_email.get(self.email)
+            if sockets is not None:
+                sockets.discard(self)
+                if not sockets:
+                    del _sockets_by_email[self.email]
+
+    async def run(self):
+        if (await self.receive())["type"] != "websocket.connect":
+            return
+        if not _origin_allowed(self.headers):
+            await self.send({"type": "websocket.close", "code": CLOSE_FORBIDDEN})
+            return
+        try:
+            await sync_to_async(self._open)()
+        except Exception as e:
+            logger.error(f"Error opening chat socket: {e}", exc_info=True)
+            await self.send({"type": "websocket.close", "code": CLOSE_ERROR})
+            return
+
+        await self.send({"type": "websocket.accept"})
+        self.loop = asyncio.get_running_loop()
+        self._register()
+        writer = asyncio.create_task(self._writer())
+        heartbeat = asyncio.create_task(self._heartbeat())
+        user = self.request.user
+        await self.outbox.put(json.dumps({
+            "type": "ready",
+            "authenticated": user.is_authenticated,
+            "username": user.username if user.is_authenticated else None,
+        }))
+        try:
+            while True:
+                message = await self.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message["type"] != "websocket.receive":
+                    continue
+                self.last_received = time.monotonic()
+                text = message.get("text")
+                if text is None:
+                    text = (message.get("bytes") or b"").decode("utf-8", "replace")
+                await self._handle(text)
+        finally:
+            self._unregister()
+            pending = [task for task in (self.turn_task, writer, heartbeat) if task is not None]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def websocket_application(scope, receive, send):
+    """ASGI entry point for websocket scopes"""
+    if not getattr(settings, "CHAT_WS_ENABLED", True) or scope.get("path") != CHAT_WS_PATH:
+        # Reject the handshake (the server answers the client with 403)
+        if (await receive())["type"] == "websocket.connect":
+            await send({"type": "websocket.close", "code": CLOSE_NOT_FOUND})
+        return
+    await ChatSocket(scope, receive, send).run()
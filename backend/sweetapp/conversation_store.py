@@ -0,0 +1,183 @@
+"""
+Server-side conversation history for Sweet Dessert Chat Assistant
+Keeps the recent turns of each conversation in a cache every worker shares
+(CHAT_CONVERSATION_CACHE), keyed by session and conversation id, so clients
+only send the new message and the last turn id they saw. Turns that fall out of the window are folded into a
+bounded rolling summary on a background thread.
+"""
+
+import logging
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .prompt_budget import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+_CONVERSATION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Longest content kept per turn (assistant replies can exceed the 1000 char client limit)
+MAX_TURN_CHARS = 2000
+
+# Tokens kept per turn when it is folded into the summary
+SUMMARY_LINE_TOKENS = 40
+
+
+def summarize_turns(previous_summary: str, turns: List[dict], max_tokens: int) -> str:
+    """
+    Fold turns into a rolling extractive summary
+
+    Each turn contributes its first sentence (trimmed); when the summary
+    exceeds max_tokens the oldest lines are dropped first.
+    """
+    lines = previous_summary.splitlines() if previous_summary else []
+    for turn in turns:
+        first_sentence = _SENTENCE_END_RE.split(turn["content"].strip(), maxsplit=1)[0]
+        speaker = "User" if turn["role"] == "user" else "Assistant"
+        lines.append(f"- {speaker}: {truncate_to_tokens(first_sentence, SUMMARY_LINE_TOKENS)}")
+
+    total = sum(count_tokens(line) + 1 for line in lines)
+    while lines and total > max_tokens:
+        total -= count_tokens(lines.pop(0)) + 1
+    return "\n".join(lines)
+
+
+class ConversationStore:
+    """
+    Bounded per-conversation history in the cache
+
+    A conversation is a dict with its id, the last CHAT_CONVERSATION_MAX_TURNS
+    turns ({id, role, content}), the rolling summary of older turns and the
+    overflow turns still waiting to be summarized.
+    """
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, "CHAT_CONVERSATION_CACHE", "sessions")]
+        self.max_turns = getattr(settings, "CHAT_CONVERSATION_MAX_TURNS", 12)
+        self.ttl = getattr(settings, "CHAT_CONVERSATION_TTL", 86400)
+        self.summary_tokens = getattr(settings, "CHAT_CONVERSATION_SUMMARY_TOKENS", 250)
+        self._lock = threading.Lock()
+        self._summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary")
+
+    @staticmethod
+    def _key(session_key: str, conversation_id: str) -> str:
+        return f"chat:conv:{session_key}:{conversation_id}"
+
+    @staticmethod
+    def _new(conversation_id: str = None) -> dict:
+        return {
+            "id": conversation_id or uuid.uuid4().hex[:16],
+            "turns": [],
+            "next_id": 1,
+            "summary": "",
+            "overflow": [],
+        }
+
+    def _save(self, session_key: str, conversation: dict):
+        self.cache.set(self._key(session_key, conversation["id"]), conversation, self.ttl)
+
+    def load(self, session_key: str, conversation_id: str) -> Optional[dict]:
+        if not conversation_id or not _CONVERSATION_ID_RE.match(conversation_id):
+            return None
+        return self.cache.get(self._key(session_key, conversation_id))
+
+    def open(
+        self,
+        session_key: str,
+        conversation_id: str = None,
+        last_turn_id: int = None,
+        client_history: List[dict] = None,
+    ) -> Tuple[dict, bool]:
+        """
+        Resolve the conversation for a request
+
+        Args:
+            session_key: Django session key the conversation belongs to
+            conversation_id: Id the client received earlier (None for legacy clients)
+            last_turn_id: Last turn id the client saw
+            client_history: Normalized history sent by the client, if any
+
+        Returns:
+            (conversation, reset) where reset means the server lost turns the
+            client knows about and the client should resend its full history
+        """
+        conversation = self.load(session_key, conversation_id)
+        reset = False
+        if conversation_id:
+            server_last = conversation["next_id"] - 1 if conversation else 0
+            reset = conversation is None or (
+                isinstance(last_turn_id, int) and last_turn_id > server_last
+            )
+
+        if conversation is None or (reset and client_history):
+            valid_id = conversation_id if conversation_id and _CONVERSATION_ID_RE.match(conversation_id) else None
+            conversation = self._new(valid_id)
+            for turn in client_history or []:
+                self._add_turn(conversation, turn["role"], turn["content"])
+            self._roll(session_key, conversation)
+            self._save(session_key, conversation)
+        return conversation, reset
+
+    @staticmethod
+    def history(conversation: dict) -> List[dict]:
+        """Recent turns as {role, content} messages for the LLM"""
+        return [{"role": t["role"], "content": t["content"]} for t in conversation["turns"]]
+
+    def _add_turn(self, conversation: dict, role: str, content: str) -> int:
+        turn_id = conversation["next_id"]
+        conversation["next_id"] += 1
+        conversation["turns"].append({"id": turn_id, "role": role, "content": content[:MAX_TURN_CHARS]})
+        return turn_id
+
+    def _roll(self, session_key: str, conversation: dict):
+        """Move turns beyond the window to the overflow and summarize them off the hot path"""
+        excess = len(conversation["turns"]) - self.max_turns
+        if excess <= 0:
+            return
+        conversation["overflow"].extend(conversation["turns"][:excess])
+        del conversation["turns"][:excess]
+        self._summarizer.submit(self._summarize, session_key, conversation["id"])
+
+    def append(self, session_key: str, conversation: dict, role: str, content: str) -> int:
+        """Add a turn, persist the conversation and return the turn id"""
+        with self._lock:
+            turn_id = self._add_turn(conversation, role, content)
+            self._roll(session_key, conversation)
+            self._save(session_key, conversation)
+        return turn_id
+
+    def _summarize(self, session_key: str, conversation_id: str):
+        try:
+            with self._lock:
+                conversation = self.load(session_key, conversation_id)
+                if not conversation or not conversation["overflow"]:
+                    return
+                conversation["summary"] = summarize_turns(
+                    conversation["summary"], conversation["overflow"], self.summary_tokens
+                )
+                conversation["overflow"] = []
+                self._save(session_key, conversation)
+        except Exception as e:
+            logger.error("Failed to summarize conversation %s: %s", conversation_id, e)
+
+
+# Global instance shared by all requests in this process
+conversation_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """Get or create the global conversation store instance"""
+    global conversation_store
+    if conversation_store is None:
+        with _store_lock:
+            if conversation_store is None:
+                conversation_store = ConversationStore()
+    return conversation_store
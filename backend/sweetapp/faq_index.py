@@ -0,0 +1,268 @@
+"""
+FAQ retrieval index for Sweet Dessert Chat Assistant
+Builds a BM25 inverted index over the active FAQ questions and answers (and,
+optionally, embeddings of the questions) once per FAQ content version, so a
+lookup scores only the FAQs that share a term with the message instead of
+re-reading and re-tokenizing every FAQ row. Saving or deleting FAQ rows marks
+the index stale in this process; other workers notice the new content version
+within CHAT_FAQ_INDEX_CHECK_SECONDS.
+"""
+
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import FAQCategory, FAQItem
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters; a question term counts QUESTION_WEIGHT times an answer term
+BM25_K1 = 1.2
+BM25_B = 0.75
+QUESTION_WEIGHT = 2
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = frozenset(
+    """a an and are as at be by can could do does for from have how i if in is it
+    me my of on or our so that the this to up was we what when where which will
+    with would you your""".split()
+)
+
+# Light suffix stripping so "deliveries", "delivery" and "deliver" share a
+# term: (suffix, replacement, shortest stem left)
+_SUFFIXES = (("ies", "y", 3), ("ing", "", 4), ("ed", "", 4), ("s", "", 3), ("y", "", 4))
+
+
+def _stem(token: str) -> str:
+    for _round in range(2):
+        for suffix, replacement, min_stem in _SUFFIXES:
+            if token.endswith(suffix) and len(token) - len(suffix) >= min_stem:
+                token = token[: -len(suffix)] + replacement
+                break
+        else:
+            break
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased, stemmed word tokens without stopwords"""
+    return [_stem(t) for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class FAQEntry(NamedTuple):
+    question: str
+    answer: str
+    category: str
+    category_icon: str
+
+
+class FAQIndex:
+    """
+    In-memory BM25 index of the active FAQs
+
+    Each posting stores its term's finished BM25 weight, so a query is a sum
+    over the postings of its terms. The index is rebuilt lazily by the first
+    search after the content version changes.
+    """
+
+    def __init__(self):
+        self.check_interval = getattr(settings, "CHAT_FAQ_INDEX_CHECK_SECONDS", 30)
+        self.use_embeddings = getattr(settings, "CHAT_FAQ_EMBEDDINGS", False)
+        self.embedding_weight = getattr(settings, "CHAT_FAQ_EMBEDDING_WEIGHT", 4.0)
+        self.min_similarity = getattr(settings, "CHAT_FAQ_MIN_SIMILARITY", 0.45)
+        self._lock = threading.Lock()
+        self._entries: List[FAQEntry] = []
+        self._postings: Dict[str, List[Tuple[int, float]]] = {}
+        self._question_vectors = None
+        self._version: Optional[str] = None
+        self._stale = True
+        self._checked_at = 0.0
+        self._built_at = None
+
+    def content_version(self) -> str:
+        """Fingerprint of the FAQ content: item count and last edit, plus the category rows"""
+        items = FAQItem.objects.aggregate(count=Count("id"), latest=Max("updated_at"))
+        categories = list(
+            FAQCategory.objects.order_by("id").values_list("id", "name", "icon", "is_active")
+        )
+        raw = f"{items['count']}|{items['latest']}|{categories}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+    def invalidate(self):
+        """Rebuild on the next search (called when FAQ rows are saved or deleted)"""
+        self._stale = True
+
+    def _ensure_current(self):
+        now = time.monotonic()
+        if not self._stale and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if not self._stale and now - self._checked_at < self.check_interval:
+                return
+            # Cleared before reading so a save during the rebuild triggers another one
+            self._stale = False
+            self._checked_at = now
+            try:
+                version = self.content_version()
+                if version != self._version:
+                    self._build(version)
+            except Exception as e:
+                logger.error(f"Error building FAQ index: {e}")
+
+    def _build(self, version: str):
+        started = time.perf_counter()
+        rows = (
+            FAQItem.objects.filter(is_active=True, category__is_active=True)
+            .order_by("category__order", "order", "id")
+            .values_list("question", "answer", "category__name", "category__icon")
+        )
+        entries = [FAQEntry(*row) for row in rows]
+
+        term_counts = []
+        lengths = []
+        for entry in entries:
+            question_terms = tokenize(entry.question)
+            counts = Counter(tokenize(entry.answer))
+            for term in question_terms:
+                counts[term] += QUESTION_WEIGHT
+            term_counts.append(counts)
+            lengths.append(sum(counts.values()))
+
+        average_length = (sum(lengths) / len(lengths)) if lengths else 1.0
+        document_frequency = Counter(term for counts in term_counts for term in counts)
+        total = len(entries)
+
+        postings = defaultdict(list)
+        for doc, counts in enumerate(term_counts):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc] / average_length)
+            for term, tf in counts.items():
+                df = document_frequency[term]
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                postings[term].append((doc, idf * tf * (BM25_K1 + 1) / (tf + norm)))
+
+        vectors = self._embed_questions(entries) if self.use_embeddings else None
+
+        self._entries = entries
+        self._postings = dict(postings)
+        self._question_vectors = vectors
+        self._version = version
+        self._built_at = time.time()
+        logger.info(
+            "FAQ index %s built: %d FAQs, %d terms%s in %.1f ms",
+            version,
+            total,
+            len(postings),
+            ", with embeddings" if vectors is not None else "",
+            (time.perf_counter() - started) * 1000,
+        )
+
+    def _embed_questions(self, entries: List[FAQEntry]):
+        if not entries:
+            return None
+        try:
+            from .vector_db import get_vector_db
+
+            return get_vector_db().embedder.encode(
+                [entry.question for entry in entries],
+                batch_size=64,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
+        except Exception as e:
+            logger.warning(f"FAQ question embeddings unavailable, using BM25 only: {e}")
+            return None
+
+    def _similarities(self, query: str):
+        try:
+            from .vector_db import get_vector_db
+
+            return self._question_vectors @ get_vector_db().embed_query(query)
+        except Exception as e:
+            logger.warning(f"FAQ embedding lookup failed: {e}")
+            return None
+
+    def search(self, query: str, limit: int = 3) -> List[dict]:
+        """
+        Best matching FAQs for a message
+
+        Args:
+            query: User's message
+            limit: Maximum FAQs to return
+
+        Returns:
+            FAQ dicts (question, answer, category, category_icon, score),
+            highest score first; only FAQs scoring above zero
+        """
+        self._ensure_current()
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            for doc, weight in self._postings.get(term, ()):
+                scores[doc] += weight
+
+        if self._question_vectors is not None:
+            similarities = self._similarities(query)
+            if similarities is not None:
+                for doc, similarity in enumerate(similarities):
+                    if similarity >= self.min_similarity:
+                        scores[doc] += self.embedding_weight * float(similarity)
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        results = []
+        for doc, score in best:
+            entry = self._entries[doc]
+            results.append(
+                {
+                    "question": entry.question,
+                    "answer": entry.answer,
+                    "category": entry.category,
+                    "category_icon": entry.category_icon,
+                    "score": round(score, 3),
+                }
+            )
+        return results
+
+    def stats(self) -> dict:
+        """Index size and version for diagnostics"""
+        self._ensure_current()
+        return {
+            "version": self._version,
+            "faqs": len(self._entries),
+            "terms": len(self._postings),
+            "embeddings": self._question_vectors is not None,
+            "built_at": self._built_at,
+        }
+
+
+# Global instance shared by all requests in this process
+faq_index = None
+_index_lock = threading.Lock()
+
+
+def get_faq_index() -> FAQIndex:
+    """Get or create the global FAQ index instance"""
+    global faq_index
+    if faq_index is None:
+        with _index_lock:
+            if faq_index is None:
+                faq_index = FAQIndex()
+    return faq_index
+
+
+@receiver(post_save, sender=FAQItem)
+@receiver(post_delete, sender=FAQItem)
+@receiver(post_save, sender=FAQCategory)
+@receiver(post_delete, sender=FAQCategory)
+def _faq_changed(sender, **kwargs):
+    if faq_index is not None:
+        faq_index.invalidate()
@@ -0,0 +1,303 @@
+"""
+Local intent classifier for Sweet Dessert Chat Assistant
+A small linear head over the MiniLM query embeddings already computed for
+vector search. Confident predictions answer the intent question without a
+network call; ambiguous messages are escalated to the remote classifier.
+The head is trained offline by `manage.py train_intent_classifier` and stored
+as a NumPy archive.
+"""
+
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+INTENT_LABELS = (
+    "order",
+    "list_products",
+    "checkout",
+    "faq",
+    "product_info",
+    "greeting",
+    "general_chat",
+)
+
+DEFAULT_MODEL_PATH = Path(__file__).resolve().parent / "data" / "intent_head.npz"
+
+# Softmax temperature for the nearest-centroid head (cosine similarities are close together)
+CENTROID_TEMPERATURE = 0.05
+
+# Hand-labeled examples so a head can be trained before any turns are logged
+SEED_EXAMPLES: Dict[str, List[str]] = {
+    "order": [
+        "I want a chocolate cake",
+        "add a brownie to my cart",
+        "can I get two cupcakes",
+        "I'll take the tiramisu",
+        "order 3 red velvet slices",
+        "put the cheesecake in my cart",
+        "give me a box of cookies",
+        "I'd like to buy the lava cake",
+        "add one more of those",
+        "I want to order the mango mousse",
+        "buy 2 donuts please",
+        "get me a slice of carrot cake",
+    ],
+    "list_products": [
+        "show me your cakes",
+        "what do you have",
+        "list all brownies",
+        "what desserts are available",
+        "can I see the menu",
+        "show me everything",
+        "what cookies do you sell",
+        "do you have any cupcakes",
+        "what are your options for a birthday",
+        "show all products",
+        "list the cheesecakes",
+        "what's on the menu today",
+    ],
+    "checkout": [
+        "checkout",
+        "proceed to payment",
+        "I'm done ordering",
+        "let's pay now",
+        "take me to checkout",
+        "I want to pay",
+        "complete my order",
+        "place the order",
+        "that's all, checkout please",
+        "ready to pay",
+    ],
+    "faq": [
+        "what's the delivery fee",
+        "do you deliver to my area",
+        "what are your opening hours",
+        "do you accept credit cards",
+        "what is your refund policy",
+        "can I cancel my order",
+        "how long does delivery take",
+        "are you open on sundays",
+        "is cash on delivery available",
+        "where is your shop located",
+        "do you do custom orders",
+        "what payment methods do you accept",
+    ],
+    "product_info": [
+        "is the tiramisu vegan",
+        "what's in the chocolate cake",
+        "does the brownie have nuts",
+        "how big is the cheesecake",
+        "is it gluten free",
+        "how much does the red velvet cost",
+        "what flavors does the cupcake come in",
+        "how many people does the cake serve",
+        "does it contain eggs",
+        "tell me about the lava cake",
+        "what's the price of the cookie box",
+        "is this cake sugar free",
+    ],
+    "greeting": [
+        "hi",
+        "hello",
+        "hey there",
+        "good morning",
+        "good evening",
+        "hi, how are you",
+        "hello sweet dessert",
+        "hey!",
+        "assalam o alaikum",
+        "good afternoon",
+    ],
+    "general_chat": [
+        "thanks",
+        "thank you so much",
+        "who are you",
+        "what can you do",
+        "tell me a joke",
+        "ok",
+        "that's nice",
+        "what's the weather like",
+        "bye",
+        "you're helpful",
+        "what is the meaning of life",
+        "never mind",
+    ],
+}
+
+
+def seed_examples() -> List[Tuple[str, str]]:
+    """(text, label) pairs from SEED_EXAMPLES"""
+    return [(text, label) for label, texts in SEED_EXAMPLES.items() for text in texts]
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+class IntentHead:
+    """
+    Linear softmax head: probabilities = softmax(weights @ embedding + bias)
+
+    Both training methods produce this form, so inference is one small
+    matrix-vector product whichever head was trained.
+    """
+
+    def __init__(self, labels: Sequence[str], weights: np.ndarray, bias: np.ndarray, kind: str = "centroid"):
+        self.labels = list(labels)
+        self.weights = weights.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+        self.kind = kind
+
+    def predict_proba(self, embeddings: np.ndarray) -> np.ndarray:
+        """Class probabilities for one embedding (1-D) or a batch (2-D)"""
+        embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+        return _softmax(embeddings @ self.weights.T + self.bias)
+
+    def predict(self, embedding: np.ndarray) -> Tuple[str, float]:
+        """Most likely label and its probability"""
+        probabilities = self.predict_proba(embedding)
+        index = int(np.argmax(probabilities))
+        return self.labels[index], float(probabilities[index])
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write beside the target and rename so workers never load a partial file
+        tmp_path = path.with_name(path.stem + ".tmp.npz")
+        np.savez(tmp_path, labels=np.array(self.labels), weights=self.weights, bias=self.bias, kind=np.array(self.kind))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path) -> "IntentHead":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                [str(label) for label in data["labels"]],
+                data["weights"],
+                data["bias"],
+                str(data["kind"]),
+            )
+
+
+def train_centroid(embeddings: np.ndarray, labels: Sequence[str]) -> IntentHead:
+    """Nearest-centroid head: each intent's weight row is its mean embedding direction"""
+    embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+    labels = np.asarray(labels)
+    classes = [label for label in INTENT_LABELS if label in set(labels)]
+    centroids = np.stack([_normalize(embeddings[labels == label].mean(axis=0)) for label in classes])
+    return IntentHead(classes, centroids / CENTROID_TEMPERATURE, np.zeros(len(classes)), kind="centroid")
+
+
+def train_logistic(
+    embeddings: np.ndarray,
+    labels: Sequence[str],
+    epochs: int = 300,
+    learning_rate: float = 0.5,
+    l2: float = 1e-3,
+) -> IntentHead:
+    """
+    Multinomial logistic regression fitted with full-batch gradient descent
+
+    Classes are weighted by inverse frequency so the many logged general_chat
+    turns do not drown out rare intents like checkout.
+    """
+    embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+    labels = np.asarray(labels)
+    classes = [label for label in INTENT_LABELS if label in set(labels)]
+    index = {label: i for i, label in enumerate(classes)}
+    targets = np.zeros((len(labels), len(classes)), dtype=np.float32)
+    targets[np.arange(len(labels)), [index[label] for label in labels]] = 1.0
+    class_counts = targets.sum(axis=0)
+    sample_weights = (len(labels) / (len(classes) * class_counts))[targets.argmax(axis=1)][:, None]
+
+    # Start from the centroid head; gradient descent then sharpens the boundaries
+    weights = train_centroid(embeddings, labels).weights.copy()
+    bias = np.zeros(len(classes), dtype=np.float32)
+    for _ in range(epochs):
+        probabilities = _softmax(embeddings @ weights.T + bias)
+        error = (probabilities - targets) * sample_weights / len(labels)
+        weights -= learning_rate * (error.T @ embeddings + l2 * weights)
+        bias -= learning_rate * error.sum(axis=0)
+    return IntentHead(classes, weights, bias, kind="logistic")
+
+
+class LocalIntentClassifier:
+    """
+    Serves the trained head, reloading it when the file on disk changes
+
+    classify() returns None when no head has been trained or the top
+    probability is below CHAT_INTENT_LOCAL_THRESHOLD, meaning the caller
+    should ask the remote classifier instead.
+    """
+
+    def __init__(self, path=None, threshold: float = None):
+        self.path = Path(path or getattr(settings, "CHAT_INTENT_MODEL_PATH", "") or DEFAULT_MODEL_PATH)
+        self.threshold = threshold if threshold is not None else getattr(settings, "CHAT_INTENT_LOCAL_THRESHOLD", 0.8)
+        self._lock = threading.Lock()
+        self._head = None
+        self._mtime = None
+
+    def head(self) -> Optional[IntentHead]:
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            return None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    try:
+                        self._head = IntentHead.load(self.path)
+                        logger.info("Loaded %s intent head from %s", self._head.kind, self.path)
+                    except Exception as e:
+                        logger.error("Failed to load intent head %s: %s", self.path, e)
+                        self._head = None
+                    self._mtime = mtime
+        return self._head
+
+    def classify(self, embedding: np.ndarray, threshold: float = None) -> Optional[Tuple[str, float]]:
+        """
+        Classify a query embedding locally
+
+        Args:
+            embedding: MiniLM embedding of the user message
+            threshold: Minimum probability to accept (default: the configured one)
+
+        Returns:
+            (intent, probability) when confident, otherwise None
+        """
+        head = self.head()
+        if head is None:
+            return None
+        intent, probability = head.predict(embedding)
+        if probability < (self.threshold if threshold is None else threshold):
+            logger.info("Local intent %s below threshold (%.2f), escalating", intent, probability)
+            return None
+        return intent, probability
+
+
+# Global instance shared by all requests in this process
+intent_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_intent_classifier() -> LocalIntentClassifier:
+    """Get or create the global local intent classifier instance"""
+    global intent_classifier
+    if intent_classifier is None:
+        with _classifier_lock:
+            if intent_classifier is None:
+                intent_classifier = LocalIntentClassifier()
+    return intent_classifier
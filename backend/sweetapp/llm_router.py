@@ -0,0 +1,551 @@
+"""
+LLM Provider Routing for Sweet Dessert Chat Assistant
+Tracks rolling latency/error statistics per provider and model, ranks providers
+for each request, fails over on rate limits and server errors, and optionally
+hedges slow streams with a second provider.
+"""
+# cSpell:ignore OPENROUTER cerebras ttft
+
+import contextvars
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+import requests
+from django.conf import settings
+
+from .provider_context import current_provider_context
+from .provider_guard import ProviderUnavailable, get_provider_guard, key_fingerprint
+from .sse import iter_sse_events
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes that indicate the provider (not the request) is the problem
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Rolling window size for latency and outcome samples
+STATS_WINDOW = 50
+
+# Assumed TTFT (seconds) for a provider we have no samples for yet
+DEFAULT_TTFT = 2.0
+
+# Bounds for the hedge deadline derived from the p95 TTFT
+MIN_HEDGE_DELAY = 1.0
+MAX_HEDGE_DELAY = 8.0
+
+
+class StreamInterrupted(Exception):
+    """The winning stream failed after it had produced content"""
+
+
+class ProviderTarget(NamedTuple):
+    """A concrete provider endpoint a request can be sent to"""
+
+    provider: str
+    model: str
+    url: str
+    api_key: str
+    timeout: Optional[float] = None  # Per-provider override of the caller's timeout
+
+
+class ProviderStats:
+    """Rolling time-to-first-token and error-rate statistics for one provider/model"""
+
+    def __init__(self, window: int = STATS_WINDOW):
+        self.ttft_samples = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.last_status = None
+        self.last_error_at = None
+
+    def record_success(self, ttft: float):
+        self.ttft_samples.append(ttft)
+        self.outcomes.append(True)
+
+    def record_failure(self, status_code: Optional[int] = None):
+        self.outcomes.append(False)
+        self.last_status = status_code
+        self.last_error_at = time.time()
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.ttft_samples:
+            return None
+        ordered = sorted(self.ttft_samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def score(self) -> float:
+        """Lower is better: median TTFT inflated by the recent error rate"""
+        p50 = self.percentile(50)
+        if p50 is None:
+            p50 = DEFAULT_TTFT
+        return p50 * (1 + 4 * self.error_rate)
+
+    def snapshot(self) -> Dict:
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        return {
+            "samples": len(self.ttft_samples),
+            "ttft_p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "ttft_p95_ms": round(p95 * 1000) if p95 is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "last_status": self.last_status,
+        }
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    response = getattr(error, "response", None)
+    return response.status_code if response is not None else None
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Whether another provider should be tried after this error"""
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError):
+        return _status_code(error) in RETRYABLE_STATUS_CODES
+    return False
+
+
+def build_headers(target: ProviderTarget, title: str) -> Dict[str, str]:
+    """Build request headers for a provider target"""
+    headers = {
+        "Authorization": f"Bearer {target.api_key}",
+        "Content-Type": "application/json",
+    }
+    if target.provider == "openrouter":
+        headers["HTTP-Referer"] = "http://localhost:8000"
+        headers["X-Title"] = title
+    return headers
+
+
+def _iter_raw_bytes(response, chunk_size: int = 8192) -> Iterator[bytes]:
+    """Yield body bytes as soon as each socket read returns, chunked or not"""
+    read1 = getattr(response.raw, "read1", None)
+    if read1 is None:
+        # urllib3 < 2 has no read1; iter_content still streams chunked bodies
+        yield from response.iter_content(chunk_size=None)
+        return
+    while True:
+        data = read1(chunk_size, decode_content=True)
+        if not data:
+            return
+        yield data
+
+
+def iter_content_deltas(response, usage: dict = None) -> Iterator[str]:
+    """
+    Parse an OpenAI-compatible SSE stream and yield content deltas
+
+    Args:
+        response: Streaming requests.Response
+        usage: Filled with the token usage object if the provider sends one
+            (usually on the last chunk)
+
+    Yields:
+        Non-empty content strings from choices[0].delta.content
+    """
+    # Decoding happens per complete line inside the parser
+    for event in iter_sse_events(_iter_raw_bytes(response)):
+        if event.data == "[DONE]":
+            return
+
+        try:
+            data_obj = json.loads(event.data)
+        except json.JSONDecodeError:
+            continue
+
+        if usage is not None and data_obj.get("usage"):
+            usage.update(data_obj["usage"])
+        choices = data_obj.get("choices") or [{}]
+        content = choices[0].get("delta", {}).get("content")
+        if content:
+            yield content
+
+
+class _StreamAttempt(threading.Thread):
+    """One upstream streaming request, pumping deltas into a shared queue"""
+
+    def __init__(self, target: ProviderTarget, payload: dict, title: str, timeout: float, events: queue.Queue):
+        super().__init__(daemon=True, name=f"llm-stream-{target.provider}")
+        self.target = target
+        self.payload = dict(payload, model=target.model)
+        self.title = title
+        self.timeout = timeout
+        self.events = events
+        self.cancelled = threading.Event()
+        self.response = None
+        self.started_at = time.monotonic()
+        self.connect_time = None
+        self.ttft = None
+        self.usage = {}
+        # Deltas received, kept so a cancelled hedge's completion can still be metered
+        self.deltas = []
+        self.error = None
+        # Threads do not inherit contextvars; run in the request's provider context
+        self.context = contextvars.copy_context()
+
+    def run(self):
+        self.context.run(self._run)
+
+    def _run(self):
+        try:
+            with requests.post(
+                self.target.url,
+                headers=build_headers(self.target, self.title),
+                json=self.payload,
+                stream=True,
+                timeout=self.timeout,
+            ) as response:
+                self.response = response
+                self.connect_time = time.monotonic() - self.started_at
+                if self.cancelled.is_set():
+                    return
+                response.raise_for_status()
+                for delta in iter_content_deltas(response, self.usage):
+                    if self.cancelled.is_set():
+                        return
+                    if self.ttft is None:
+                        self.ttft = time.monotonic() - self.started_at
+                    self.deltas.append(delta)
+                    self.events.put((self, "delta", delta))
+            self.events.put((self, "done", None))
+        except Exception as e:
+            if not self.cancelled.is_set():
+                self.error = e
+                self.events.put((self, "error", e))
+
+    def cancel(self):
+        """Stop forwarding deltas and close the upstream connection"""
+        self.cancelled.set()
+        response = self.response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+
+class ProviderRouter:
+    """Ranks provider targets by rolling stats and streams with failover/hedging"""
+
+    def __init__(self):
+        self._stats: Dict[tuple, ProviderStats] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def failover_enabled(self) -> bool:
+        return getattr(settings, "CHAT_PROVIDER_FAILOVER", True)
+
+    @property
+    def hedging_enabled(self) -> bool:
+        return getattr(settings, "CHAT_HEDGE_REQUESTS", False)
+
+    def _get_stats(self, target: ProviderTarget) -> ProviderStats:
+        key = (target.provider, target.model)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = ProviderStats()
+            return stats
+
+    def record_success(self, target: ProviderTarget, ttft: float):
+        stats = self._get_stats(target)
+        with self._lock:
+            stats.record_success(ttft)
+        get_provider_guard().record_success(target.provider, target.api_key)
+
+    def record_failure(self, target: ProviderTarget, error: Exception = None):
+        stats = self._get_stats(target)
+        with self._lock:
+            stats.record_failure(_status_code(error) if error is not None else None)
+        # Only provider-side trouble counts towards opening the breaker
+        if error is None or is_retryable_error(error):
+            get_provider_guard().record_failure(target.provider, target.api_key)
+
+    def unavailable_error(self, targets: List[ProviderTarget]) -> ProviderUnavailable:
+        """Build a ProviderUnavailable carrying the shortest expected wait"""
+        guard = get_provider_guard()
+        waits = [guard.retry_after(t.provider, t.api_key) for t in targets]
+        return ProviderUnavailable(
+            "All AI providers are rate limited or unavailable",
+            retry_after=min(waits) if waits else 0,
+        )
+
+    def rank(self, targets: List[ProviderTarget], pinned: bool = False) -> List[ProviderTarget]:
+        """
+        Order candidate targets best-first
+
+        Args:
+            targets: Candidate targets, preferred first
+            pinned: Keep the first target first (explicit user choice)
+
+        Returns:
+            Ordered list of available targets (only the first one if failover
+            is disabled). Targets with an open breaker or an empty token bucket
+            are skipped.
+        """
+        guard = get_provider_guard()
+        targets = [t for t in targets if guard.is_available(t.provider, t.api_key)]
+        if not targets:
+            return []
+        if pinned:
+            head, rest = targets[:1], targets[1:]
+        else:
+            head, rest = [], targets
+        ranked = head + sorted(rest, key=lambda t: self._get_stats(t).score())
+        return ranked if self.failover_enabled else ranked[:1]
+
+    def hedge_delay(self, target: ProviderTarget) -> float:
+        """Seconds to wait for a first token before hedging, based on the p95 TTFT"""
+        stats = self._get_stats(target)
+        with self._lock:
+            p95 = stats.percentile(95) if len(stats.ttft_samples) >= 5 else None
+        if p95 is None:
+            p95 = getattr(settings, "CHAT_HEDGE_DEFAULT_DELAY", 3.0)
+        return max(MIN_HEDGE_DELAY, min(MAX_HEDGE_DELAY, p95))
+
+    def complete(
+        self,
+        targets: List[ProviderTarget],
+        payload: dict,
+        title: str,
+        timeout: float = 8,
+        timings: dict = None,
+    ) -> dict:
+        """
+        Non-streaming completion with sequential failover
+
+        Args:
+            timings: Filled with the answering target's provider, model, key
+                (fingerprint) and the usage object of the response
+
+        Returns:
+            Parsed JSON response from the first target that succeeds
+
+        Raises:
+            ProviderUnavailable if every target was skipped by the guard,
+            otherwise the last request exception if every target fails
+        """
+        guard = get_provider_guard()
+        last_error = None
+        for target in targets:
+            if not guard.acquire(target.provider, target.api_key):
+                logger.info("Skipping %s: rate limited or breaker open", target.provider)
+                continue
+            started = time.monotonic()
+            try:
+                response = requests.post(
+                    target.url,
+                    headers=build_headers(target, title),
+                    json=dict(payload, model=target.model),
+                    timeout=current_provider_context().timeout(target.timeout or timeout),
+                )
+                response.raise_for_status()
+                result = response.json()
+                self.record_success(target, time.monotonic() - started)
+                if timings is not None:
+                    timings.update(
+                        provider=target.provider,
+                        model=target.model,
+                        key=key_fingerprint(target.api_key),
+                        usage=result.get("usage") or {},
+                    )
+                return result
+            except requests.exceptions.RequestException as e:
+                self.record_failure(target, e)
+                last_error = e
+                if not is_retryable_error(e):
+                    raise
+                logger.warning("%s (%s) failed, trying next provider: %s", target.provider, target.model, e)
+        if last_error is None:
+            raise self.unavailable_error(targets)
+        raise last_error
+
+    def stream(
+        self,
+        targets: List[ProviderTarget],
+        payload: dict,
+        title: str,
+        timeout: float = 30,
+        abort_event: threading.Event = None,
+        heartbeat: float = None,
+        timings: dict = None,
+    ) -> Iterator[Optional[str]]:
+        """
+        Stream content deltas from the best available provider
+
+        Fails over to the next target on retryable errors before the first token,
+        and (if enabled) launches a hedged request on the next target when the
+        first has produced no token within its p95-based deadline. The first
+        attempt to produce a token wins; the loser is cancelled. Setting
+        abort_event (or closing this generator) cancels every upstream request.
+
+        Args:
+            abort_event: Set by the caller when the client went away
+            heartbeat: Yield None after this many idle seconds so the caller
+                can write a keep-alive (and notice a dead client)
+            timings: Filled with the winning attempt's provider, model, key
+                (fingerprint), upstream_connect (seconds until response
+                headers), ttft (seconds) and usage (the provider's token
+                usage object, empty until the stream has finished). When
+                the stream ends, "abandoned" lists the provider, model, key,
+                usage and completion text of every other attempt that did
+                not fail (cancelled hedges, or the only attempt when the
+                caller aborted before a token); providers bill them too
+
+        Yields:
+            Content delta strings, or None as an idle heartbeat
+
+        Raises:
+            ProviderUnavailable if every target was skipped by the guard,
+            otherwise the last request exception if no target produced a
+            response; StreamInterrupted if the answering stream failed after
+            its first token (the reply so far is incomplete)
+        """
+        guard = get_provider_guard()
+        events = queue.Queue()
+        pending = list(targets)
+        active = []
+        launched = []
+        winner = None
+        hedged = False
+        hedge_at = None
+
+        def launch():
+            while pending:
+                target = pending.pop(0)
+                if not guard.acquire(target.provider, target.api_key):
+                    logger.info("Skipping %s: rate limited or breaker open", target.provider)
+                    continue
+                attempt = _StreamAttempt(
+                    target,
+                    payload,
+                    title,
+                    current_provider_context().timeout(target.timeout or timeout),
+                    events,
+                )
+                active.append(attempt)
+                launched.append(attempt)
+                attempt.start()
+                logger.info("Streaming from %s with model: %s", target.provider, target.model)
+                return attempt
+            return None
+
+        first = launch()
+        if first is None:
+            raise self.unavailable_error(targets)
+        if self.hedging_enabled:
+            hedge_at = first.started_at + self.hedge_delay(first.target)
+
+        last_output = time.monotonic()
+        try:
+            while active:
+                if abort_event is not None and abort_event.is_set():
+                    logger.info("Stream aborted, cancelling %s upstream request(s)", len(active))
+                    return
+                hedge_wait = None
+                if winner is None and hedge_at is not None and not hedged and pending:
+                    hedge_wait = max(0.0, hedge_at - time.monotonic())
+                waits = [w for w in (hedge_wait, heartbeat) if w is not None]
+                if abort_event is not None:
+                    # Poll so an abort from another thread is noticed promptly
+                    waits.append(0.5)
+                try:
+                    attempt, kind, value = events.get(timeout=min(waits) if waits else None)
+                except queue.Empty:
+                    if hedge_wait is None or time.monotonic() < hedge_at:
+                        if heartbeat is not None and time.monotonic() - last_output >= heartbeat:
+                            last_output = time.monotonic()
+                            yield None
+                        continue
+                    hedged = True
+                    logger.info("No token from %s within hedge deadline, hedging", active[0].target.provider)
+                    launch()
+                    continue
+
+                if attempt.cancelled.is_set():
+                    continue
+
+                if kind == "delta":
+                    if winner is None:
+                        winner = attempt
+                        self.record_success(attempt.target, attempt.ttft)
+                        if timings is not None:
+                            timings.update(
+                                provider=attempt.target.provider,
+                                model=attempt.target.model,
+                                key=key_fingerprint(attempt.target.api_key),
+                                upstream_connect=attempt.connect_time,
+                                ttft=attempt.ttft,
+                                usage=attempt.usage,
+                            )
+                        for other in active:
+                            if other is not attempt:
+                                other.cancel()
+                        active[:] = [attempt]
+                    last_output = time.monotonic()
+                    yield value
+                elif kind == "done":
+                    active.remove(attempt)
+                    if attempt is winner or not active:
+                        return
+                else:
+                    active.remove(attempt)
+                    self.record_failure(attempt.target, value)
+                    if attempt is winner:
+                        logger.warning("%s stream failed mid-response: %s", attempt.target.provider, value)
+                        raise StreamInterrupted(f"{attempt.target.provider} stream failed mid-response") from value
+                    if active:
+                        continue
+                    if pending and is_retryable_error(value):
+                        logger.warning("%s failed (%s), failing over", attempt.target.provider, value)
+                        if launch() is not None:
+                            continue
+                    raise value
+        finally:
+            for attempt in active:
+                attempt.cancel()
+            if timings is not None:
+                timings["abandoned"] = [
+                    {
+                        "provider": attempt.target.provider,
+                        "model": attempt.target.model,
+                        "key": key_fingerprint(attempt.target.api_key),
+                        "usage": attempt.usage,
+                        "completion": "".join(attempt.deltas),
+                    }
+                    for attempt in launched
+                    if attempt is not winner
+                    and attempt.error is None
+                    and (attempt.response is None or attempt.response.ok)
+                ]
+
+    def snapshot(self) -> Dict:
+        """Current per-provider/model statistics for diagnostics"""
+        with self._lock:
+            return {
+                f"{provider}:{model}": stats.snapshot()
+                for (provider, model), stats in self._stats.items()
+            }
+
+
+# Global instance shared by all requests in this process
+provider_router = None
+
+
+def get_provider_router() -> ProviderRouter:
+    """Get or create the global provider router instance"""
+    global provider_router
+    if provider_router is None:
+        provider_router = ProviderRouter()
+    return provider_router
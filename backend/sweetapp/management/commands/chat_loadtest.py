@@ -0,0 +1,140 @@
+"""
+End-to-end load test for the chat stream endpoint.
+
+Opens N concurrent SSE sessions against /api/chat/stream/ and reports
+latency percentiles. Run the backend against `manage.py mock_llm_server`
+to benchmark the pipeline without spending provider quota.
+"""
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+
+from sweetapp.sse import iter_sse_events
+
+DEFAULT_MESSAGES = [
+    "Hi there!",
+    "Show me your cakes",
+    "What's the delivery fee?",
+    "I want a chocolate dreamcake",
+    "Is the tiramisu vegan?",
+    "What desserts would you recommend for a birthday?",
+]
+
+
+def _percentile(values: list, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _run_session(url: str, message: str, provider: str, api_key: str, timeout: float) -> dict:
+    """Send one chat message and time the SSE stream it produces"""
+    result = {"ttfe": None, "ttft": None, "total": None, "events": 0, "error": None}
+    body = {"message": message, "history": []}
+    if provider:
+        body["api_provider"] = provider
+    if api_key:
+        body["api_key"] = api_key
+
+    start = time.perf_counter()
+    try:
+        with requests.post(url, json=body, stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                result["error"] = f"HTTP {response.status_code}"
+                return result
+            for event in iter_sse_events(response.iter_content(chunk_size=None)):
+                elapsed = time.perf_counter() - start
+                if result["ttfe"] is None:
+                    result["ttfe"] = elapsed
+                result["events"] += 1
+                try:
+                    data = json.loads(event.data)
+                except json.JSONDecodeError:
+                    continue
+                kind = data.get("type")
+                if kind == "error":
+                    result["error"] = data.get("code", "error event")
+                elif kind in ("provider_busy", "token_budget"):
+                    # The apology that follows is not a real answer
+                    result["error"] = kind
+                elif "content" in data and result["ttft"] is None:
+                    # Reply frames carry only content, no type
+                    result["ttft"] = elapsed
+    except requests.exceptions.RequestException as e:
+        result["error"] = type(e).__name__
+    result["total"] = time.perf_counter() - start
+    return result
+
+
+class Command(BaseCommand):
+    help = 'Load test the chat SSE endpoint with concurrent sessions and report latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/api/chat/stream/')
+        parser.add_argument('--concurrency', type=int, default=10, help='Concurrent SSE sessions')
+        parser.add_argument('--requests', type=int, default=50, help='Total chat messages to send')
+        parser.add_argument('--message', action='append', help='Message to send (repeatable); defaults to a mixed set')
+        parser.add_argument('--provider', default='', help='api_provider sent with each request')
+        parser.add_argument('--api-key', default='', help='api_key sent with each request')
+        parser.add_argument('--timeout', type=float, default=90)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        messages = options['message'] or DEFAULT_MESSAGES
+        rng = random.Random(options['seed'])
+        plan = [rng.choice(messages) for _ in range(options['requests'])]
+
+        self.stdout.write(
+            f"🚀 {len(plan)} chat requests, {options['concurrency']} concurrent → {options['url']}"
+        )
+
+        results = []
+        lock = threading.Lock()
+        started = time.perf_counter()
+
+        def worker(message):
+            outcome = _run_session(
+                options['url'], message, options['provider'], options['api_key'], options['timeout']
+            )
+            with lock:
+                results.append(outcome)
+                if len(results) % 10 == 0:
+                    self.stdout.write(f"   {len(results)}/{len(plan)} done")
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(worker, plan))
+
+        wall = time.perf_counter() - started
+        errors = [r for r in results if r['error']]
+        ok = [r for r in results if not r['error']]
+
+        self.stdout.write('')
+        self.stdout.write(f"{'metric':<22}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+        for label, key in [
+            ('time to first event', 'ttfe'),
+            ('time to first token', 'ttft'),
+            ('total duration', 'total'),
+        ]:
+            values = [r[key] for r in ok if r[key] is not None]
+            if not values:
+                self.stdout.write(f"{label:<22}{'n/a':>9}")
+                continue
+            row = [_percentile(values, p) for p in (50, 90, 95, 99)] + [max(values)]
+            self.stdout.write(f"{label:<22}" + "".join(f"{v * 1000:>7.0f}ms" for v in row))
+
+        self.stdout.write('')
+        self.stdout.write(f"Throughput: {len(results) / wall:.2f} req/s over {wall:.1f}s")
+        if errors:
+            kinds = {}
+            for r in errors:
+                kinds[r['error']] = kinds.get(r['error'], 0) + 1
+            self.stdout.write(self.style.WARNING(f"Errors: {len(errors)}/{len(results)} {kinds}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✅ {len(results)} requests, no errors"))
@@ -0,0 +1,305 @@
+"""
+Evaluate the intent classification paths offline.
+
+Runs a labeled corpus of chat messages (JSON lines with "message", "intent"
+and optionally "product" and "quantity") through each path ai_analyze_intent
+can take and reports, per path, coverage, accuracy, per-intent precision and
+recall, a confusion matrix, product and quantity extraction accuracy and
+per-message latency percentiles. With --baseline the run is compared with a
+report saved by --save-report, and the command fails when a path regressed
+by more than the allowed margin, so keyword, prompt or speed changes to the
+intent code can be checked before they ship.
+
+Paths:
+    fast_path  keyword answer for trivial messages (abstains on the rest)
+    fallback   keyword detection for every message
+    local      local embedding head at CHAT_INTENT_LOCAL_THRESHOLD (abstains below it)
+    local_all  the local head's top intent for every message
+    remote     structured-output model; point OPENROUTER_API_URL at
+               `manage.py mock_llm_server`, or replay answers saved with --record.
+               Calls are paced to CHAT_PROVIDER_RATE_PER_MINUTE, and the wait is
+               not counted as latency
+    pipeline   fast path, then local, then remote, as in production
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sweetapp.chat_views import (
+    _fallback_intent_detection,
+    _fast_path_intent,
+    _local_intent_detection,
+    _remote_intent_detection,
+    get_current_api_key,
+)
+from sweetapp.intent_classifier import INTENT_LABELS, get_intent_classifier
+from sweetapp.provider_guard import get_provider_guard
+
+DEFAULT_CORPUS = Path(__file__).resolve().parents[2] / 'data' / 'intent_eval.jsonl'
+PATHS = ('fast_path', 'fallback', 'local', 'local_all', 'remote', 'pipeline')
+DEFAULT_PATHS = 'fast_path,fallback,local,local_all'
+
+# Column headers of the confusion matrix
+SHORT_LABELS = {
+    'order': 'order',
+    'list_products': 'list',
+    'checkout': 'chkout',
+    'faq': 'faq',
+    'product_info': 'info',
+    'greeting': 'greet',
+    'general_chat': 'chat',
+}
+
+
+def _load_corpus(path: Path) -> list:
+    examples = []
+    with open(path, encoding='utf-8') as corpus:
+        for line_number, line in enumerate(corpus, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                example = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise CommandError(f'{path}:{line_number}: invalid JSON ({e})')
+            if not example.get('message') or example.get('intent') not in INTENT_LABELS:
+                raise CommandError(f'{path}:{line_number}: needs a message and one of {", ".join(INTENT_LABELS)}')
+            examples.append(example)
+    return examples
+
+
+def _normalize_product(name) -> str:
+    return re.sub(r'[^a-z0-9]+', ' ', (name or '').lower()).strip()
+
+
+def _same_product(expected, predicted) -> bool:
+    """Lenient name match: either normalized name contains the other ("cheesecake" vs "cheesecakes")"""
+    expected, predicted = _normalize_product(expected), _normalize_product(predicted)
+    if not expected or not predicted:
+        return expected == predicted
+    return expected in predicted or predicted in expected
+
+
+def _percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _score(examples: list, results: list) -> dict:
+    """
+    Metrics of one path
+
+    Args:
+        examples: Corpus entries
+        results: (intent dict or None when the path abstained, seconds) per example
+    """
+    handled = [(example, result) for example, (result, _seconds) in zip(examples, results) if result is not None]
+    confusion = defaultdict(Counter)
+    for example, result in handled:
+        confusion[example['intent']][result.get('intent') or 'none'] += 1
+
+    per_intent = {}
+    for label in INTENT_LABELS:
+        support = sum(confusion[label].values())
+        predicted = sum(row[label] for row in confusion.values())
+        hits = confusion[label][label]
+        if support or predicted:
+            per_intent[label] = {
+                'precision': round(hits / predicted, 3) if predicted else 0.0,
+                'recall': round(hits / support, 3) if support else 0.0,
+                'support': support,
+            }
+
+    with_product = [(e, r) for e, r in handled if e.get('product')]
+    with_quantity = [(e, r) for e, r in handled if 'quantity' in e]
+    latencies = [seconds * 1000 for _result, seconds in results]
+    correct = sum(1 for e, r in handled if r.get('intent') == e['intent'])
+    return {
+        'examples': len(examples),
+        'coverage': round(len(handled) / len(examples), 3) if examples else 0.0,
+        'accuracy': round(correct / len(handled), 3) if handled else 0.0,
+        'product_accuracy': (
+            round(sum(1 for e, r in with_product if _same_product(e['product'], r.get('product_mentioned')))
+                  / len(with_product), 3)
+            if with_product else None
+        ),
+        'quantity_accuracy': (
+            round(sum(1 for e, r in with_quantity if r.get('quantity') == e['quantity']) / len(with_quantity), 3)
+            if with_quantity else None
+        ),
+        'fallbacks': sum(1 for _e, r in handled if r.get('fallback')),
+        'latency_ms': {
+            'p50': round(_percentile(latencies, 50), 2),
+            'p95': round(_percentile(latencies, 95), 2),
+            'p99': round(_percentile(latencies, 99), 2),
+        },
+        'per_intent': per_intent,
+        'confusion': {label: dict(row) for label, row in confusion.items()},
+    }
+
+
+class Command(BaseCommand):
+    help = 'Score every intent classification path on a labeled corpus and fail on regressions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=str(DEFAULT_CORPUS), help='Labeled messages, one JSON object per line')
+        parser.add_argument('--paths', default=DEFAULT_PATHS, help=f'Comma-separated paths out of: {", ".join(PATHS)}')
+        parser.add_argument('--provider', default='openrouter', help='Provider for the remote path')
+        parser.add_argument('--api-key', default='', help='API key for the remote path (default: the configured one)')
+        parser.add_argument('--record', default='', help='Save remote answers to this JSON file')
+        parser.add_argument('--replay', default='', help='Answer the remote path from a file saved with --record')
+        parser.add_argument('--save-report', default='', help='Write the metrics as JSON (usable as a --baseline)')
+        parser.add_argument('--baseline', default='', help='Report to compare against')
+        parser.add_argument('--max-drop', type=float, default=0.02,
+                            help='Allowed drop in accuracy, coverage or product accuracy versus the baseline')
+        parser.add_argument('--max-latency-ratio', type=float, default=0.0,
+                            help='Allowed p95 latency as a multiple of the baseline (0 = not checked)')
+        parser.add_argument('--min-accuracy', type=float, default=0.0, help='Fail any path below this accuracy')
+
+    # ---- paths ----
+
+    def _remote(self, options):
+        recorded = {}
+        if options['replay']:
+            with open(options['replay'], encoding='utf-8') as replay:
+                recorded = json.load(replay)
+        provider = options['provider']
+        api_key = options['api_key'] or (get_current_api_key() if provider == 'openrouter' else None)
+        guard = get_provider_guard()
+        self._recording = {}
+        self._waited = 0.0
+
+        def remote(message):
+            if options['replay']:
+                # Unrecorded messages abstain rather than reaching a provider
+                return recorded.get(message)
+            if api_key:
+                # Wait for the rate limiter instead of measuring its keyword fallback
+                wait = guard.retry_after(provider, api_key)
+                if wait > 0:
+                    time.sleep(wait)
+                    self._waited += wait
+            result = _remote_intent_detection(message, api_provider=provider, api_key=api_key)
+            if not result.get('fallback'):
+                self._recording[message] = result
+            return result
+
+        return remote
+
+    def _classifiers(self, paths, options) -> dict:
+        local_threshold = getattr(settings, 'CHAT_INTENT_LOCAL_THRESHOLD', 0.8)
+        remote = self._remote(options) if {'remote', 'pipeline'} & set(paths) else None
+
+        def pipeline(message):
+            return _fast_path_intent(message) or _local_intent_detection(message) or remote(message)
+
+        classifiers = {
+            'fast_path': _fast_path_intent,
+            'fallback': _fallback_intent_detection,
+            'local': lambda message: _local_intent_detection(message, threshold=local_threshold),
+            'local_all': lambda message: _local_intent_detection(message, threshold=0.0),
+            'remote': remote,
+            'pipeline': pipeline,
+        }
+        if {'local', 'local_all'} & set(paths) and get_intent_classifier().head() is None:
+            self.stdout.write(self.style.WARNING(
+                '⚠️  No local intent head trained (manage.py train_intent_classifier); skipping local paths'
+            ))
+            paths = [path for path in paths if path not in ('local', 'local_all')]
+        return {path: classifiers[path] for path in paths}
+
+    # ---- output ----
+
+    def _print_path(self, path, metrics):
+        product = metrics['product_accuracy']
+        quantity = metrics['quantity_accuracy']
+        latency = metrics['latency_ms']
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n{path}'))
+        self.stdout.write(
+            f"coverage {metrics['coverage']:.1%}   accuracy {metrics['accuracy']:.1%}   "
+            f"product {'-' if product is None else f'{product:.1%}'}   "
+            f"quantity {'-' if quantity is None else f'{quantity:.1%}'}   "
+            f"keyword fallbacks {metrics['fallbacks']}"
+        )
+        self.stdout.write(f"latency ms  p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}")
+
+        self.stdout.write(f"\n{'intent':<16}{'precision':>10}{'recall':>9}{'support':>9}")
+        for label, row in metrics['per_intent'].items():
+            self.stdout.write(f"{label:<16}{row['precision']:>10.2f}{row['recall']:>9.2f}{row['support']:>9}")
+
+        columns = [label for label in INTENT_LABELS] + ['none']
+        self.stdout.write('\ntrue \\ predicted'.ljust(17) + ''.join(f'{SHORT_LABELS.get(c, c):>7}' for c in columns))
+        for label in INTENT_LABELS:
+            row = metrics['confusion'].get(label)
+            if row:
+                self.stdout.write(f'{label:<16}' + ''.join(f'{row.get(c, 0) or ".":>7}' for c in columns))
+
+    def _regressions(self, report, baseline, options) -> list:
+        problems = []
+        for path, metrics in report['paths'].items():
+            if options['min_accuracy'] and metrics['accuracy'] < options['min_accuracy']:
+                problems.append(f"{path}: accuracy {metrics['accuracy']:.1%} is below {options['min_accuracy']:.1%}")
+            before = (baseline or {}).get('paths', {}).get(path)
+            if not before:
+                continue
+            for metric in ('accuracy', 'coverage', 'product_accuracy'):
+                if metrics.get(metric) is None or before.get(metric) is None:
+                    continue
+                if before[metric] - metrics[metric] > options['max_drop']:
+                    problems.append(f'{path}: {metric} fell from {before[metric]:.1%} to {metrics[metric]:.1%}')
+            ratio = options['max_latency_ratio']
+            before_p95 = before.get('latency_ms', {}).get('p95')
+            if ratio and before_p95 and metrics['latency_ms']['p95'] > before_p95 * ratio:
+                problems.append(
+                    f"{path}: p95 latency {metrics['latency_ms']['p95']} ms is over {ratio}x the baseline {before_p95} ms"
+                )
+        return problems
+
+    def handle(self, *args, **options):
+        paths = [path.strip() for path in options['paths'].split(',') if path.strip()]
+        unknown = sorted(set(paths) - set(PATHS))
+        if unknown:
+            raise CommandError(f'Unknown path(s): {", ".join(unknown)} (choose from {", ".join(PATHS)})')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as baseline_file:
+                baseline = json.load(baseline_file)
+
+        examples = _load_corpus(Path(options['corpus']))
+        self.stdout.write(f"📋 {len(examples)} labeled messages from {options['corpus']}")
+        if options['verbosity'] < 2:
+            # One log line per classification would bury the report
+            logging.getLogger('sweetapp.chat_views').setLevel(logging.WARNING)
+
+        report = {'corpus': options['corpus'], 'examples': len(examples), 'paths': {}}
+        for path, classify in self._classifiers(paths, options).items():
+            results = []
+            for example in examples:
+                self._waited = 0.0
+                started = time.perf_counter()
+                result = classify(example['message'])
+                results.append((result, time.perf_counter() - started - self._waited))
+            report['paths'][path] = metrics = _score(examples, results)
+            self._print_path(path, metrics)
+
+        if options['record'] and getattr(self, '_recording', None):
+            with open(options['record'], 'w', encoding='utf-8') as record:
+                json.dump(self._recording, record, indent=2, ensure_ascii=False)
+            self.stdout.write(f"\n💾 Recorded {len(self._recording)} remote answers to {options['record']}")
+        if options['save_report']:
+            with open(options['save_report'], 'w', encoding='utf-8') as report_file:
+                json.dump(report, report_file, indent=2)
+            self.stdout.write(f"💾 Saved report to {options['save_report']}")
+
+        problems = self._regressions(report, baseline, options)
+        if problems:
+            raise CommandError('Intent evaluation regressed:\n  ' + '\n  '.join(problems))
+        self.stdout.write(self.style.SUCCESS('\n✅ No regressions' if baseline else '\n✅ Evaluation complete'))
@@ -0,0 +1,257 @@
+# cSpell:ignore OPENROUTER cerebras ttft
+"""
+Local stand-in for OpenRouter/Cerebras speaking the OpenAI-compatible
+chat/completions API, for benchmarking the chat pipeline without quota.
+
+Point the backend at it with:
+    OPENROUTER_API_URL=http://127.0.0.1:8765/v1/chat/completions
+    CEREBRAS_API_URL=http://127.0.0.1:8765/v1/chat/completions
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+SAMPLE_REPLY = (
+    "Great choice! 🎉 Our desserts are freshly baked every day. The Chocolate "
+    "Dreamcake is a customer favourite at Rs. 1999, and our brownies pair "
+    "perfectly with it. Would you like to order more items, or shall we "
+    "proceed to checkout?"
+)
+
+INTENT_RULES = [
+    ("checkout", ["checkout", "payment", "pay now", "proceed"]),
+    ("order", ["order", "buy", "add", "want", "i'll have"]),
+    ("list_products", ["show", "list", "menu", "what do you have"]),
+    ("faq", ["delivery", "hours", "refund", "cancel", "accept", "policy"]),
+    ("product_info", ["what's in", "ingredients", "vegan", "allergen"]),
+    ("greeting", ["hi", "hello", "hey"]),
+]
+
+
+def _mock_intent(text: str) -> dict:
+    lowered = text.lower()
+    intent = "general_chat"
+    for name, keywords in INTENT_RULES:
+        if any(kw in lowered for kw in keywords):
+            intent = name
+            break
+    return {
+        "intent": intent,
+        "confidence": "high" if intent != "general_chat" else "low",
+        "product_mentioned": None,
+        "quantity": 1,
+        "category_filter": None,
+        "reason": "Mock provider keyword classification",
+    }
+
+
+def _value_for_schema(schema: dict):
+    """Produce a minimal value that satisfies a JSON schema fragment"""
+    if "enum" in schema:
+        return schema["enum"][0]
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        schema_type = "null" if "null" in schema_type else schema_type[0]
+    if schema_type == "object":
+        return {
+            name: _value_for_schema(prop)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    return {
+        "string": "mock",
+        "integer": 1,
+        "number": 1.0,
+        "boolean": True,
+        "array": [],
+        "null": None,
+    }.get(schema_type)
+
+
+def _structured_reply(payload: dict) -> str:
+    json_schema = payload["response_format"].get("json_schema", {})
+    schema = json_schema.get("schema", {})
+    if "intent" in schema.get("properties", {}):
+        user_text = " ".join(
+            m.get("content", "") for m in payload.get("messages", []) if m.get("role") == "user"
+        )
+        # The intent prompt quotes the user message on its own line
+        for line in user_text.splitlines():
+            if line.startswith("**User Message:**"):
+                user_text = line
+                break
+        return json.dumps(_mock_intent(user_text))
+    return json.dumps(_value_for_schema(schema))
+
+
+def _tokenize(text: str) -> list:
+    """Split a reply into word-sized deltas, keeping the whitespace"""
+    pieces = []
+    current = ""
+    for char in text:
+        current += char
+        if char == " ":
+            pieces.append(current)
+            current = ""
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    options = {}
+    rng = random.Random()
+    rng_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        if self.options.get("verbose"):
+            super().log_message(format, *args)
+
+    def _roll(self, probability: float) -> bool:
+        with self.rng_lock:
+            return self.rng.random() < probability
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON"}})
+            return
+
+        if self._roll(self.options["rate_limit_rate"]):
+            self._send_json(429, {"error": {"message": "Rate limit exceeded (mock)"}}, {"Retry-After": "5"})
+            return
+        if self._roll(self.options["error_rate"]):
+            self._send_json(503, {"error": {"message": "Upstream unavailable (mock)"}})
+            return
+
+        time.sleep(self.options["ttft_ms"] / 1000)
+
+        if payload.get("response_format", {}).get("type") == "json_schema":
+            content = _structured_reply(payload)
+        else:
+            content = self.options["reply"]
+        pieces = _tokenize(content)
+        max_tokens = payload.get("max_tokens")
+        if max_tokens:
+            pieces = pieces[:max_tokens]
+
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        model = payload.get("model", "mock-model")
+        prompt_chars = sum(len(m.get("content") or "") for m in payload.get("messages", []))
+        usage = {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": len(pieces),
+            "total_tokens": prompt_chars // 4 + len(pieces),
+        }
+
+        if payload.get("stream"):
+            self._stream(completion_id, model, pieces, usage)
+        else:
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(pieces)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+    def _stream(self, completion_id: str, model: str, pieces: list, usage: dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_chunk(data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def write_event(body: dict):
+            write_chunk(f"data: {json.dumps(body)}\n\n".encode("utf-8"))
+
+        delay = 1 / self.options["tokens_per_second"] if self.options["tokens_per_second"] > 0 else 0
+        try:
+            write_chunk(b": MOCK PROCESSING\n\n")
+            for piece in pieces:
+                write_event({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                })
+                if delay:
+                    time.sleep(delay)
+            write_event({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            write_chunk(b"data: [DONE]\n\n")
+            write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled the stream
+            pass
+
+
+class Command(BaseCommand):
+    help = 'Run a local mock OpenAI-compatible LLM provider for offline chat benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--ttft-ms', type=float, default=300, help='Delay before the first token')
+        parser.add_argument('--tokens-per-second', type=float, default=50, help='Streaming speed (0 = as fast as possible)')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+        parser.add_argument('--reply', default=SAMPLE_REPLY, help='Text streamed for free-form completions')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for error injection')
+        parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    def handle(self, *args, **options):
+        MockLLMHandler.options = options
+        MockLLMHandler.rng = random.Random(options['seed'])
+
+        server = ThreadingHTTPServer((options['host'], options['port']), MockLLMHandler)
+        server.daemon_threads = True
+        url = f"http://{options['host']}:{server.server_port}/v1/chat/completions"
+
+        self.stdout.write(self.style.SUCCESS(f'🤖 Mock LLM provider listening on {url}'))
+        self.stdout.write(
+            f"   TTFT {options['ttft_ms']:.0f} ms, {options['tokens_per_second']:g} tok/s, "
+            f"503 rate {options['error_rate']:.0%}, 429 rate {options['rate_limit_rate']:.0%}"
+        )
+        self.stdout.write('   Set OPENROUTER_API_URL / CEREBRAS_API_URL to this URL. Ctrl+C to stop.')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write('\nStopping mock provider')
+        finally:
+            server.server_close()
@@ -0,0 +1,63 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from sweetapp.models import ChatHeavyHitter, ChatTurn
+
+
+class Command(BaseCommand):
+    help = 'Delete old chat turns and heavy-hitter rows so the chat log stays bounded'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'CHAT_LOG_RETENTION_DAYS', 90),
+            help='Delete turns older than this many days',
+        )
+        parser.add_argument(
+            '--max-rows', type=int, default=getattr(settings, 'CHAT_LOG_MAX_ROWS', 200000),
+            help='Keep at most this many of the newest turns (0 = no limit)',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows deleted per query')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def _delete_in_batches(self, queryset, batch_size):
+        """Delete by primary key batches to keep each transaction small"""
+        deleted = 0
+        while True:
+            ids = list(queryset.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            deleted += ChatTurn.objects.filter(id__in=ids).delete()[0]
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        expired = ChatTurn.objects.filter(created_at__lt=cutoff).order_by()
+
+        overflow = ChatTurn.objects.none()
+        if options['max_rows']:
+            # Everything older than the Nth newest turn
+            boundary = (
+                ChatTurn.objects.order_by('-created_at', '-id')
+                .values_list('created_at', flat=True)[options['max_rows'] - 1:options['max_rows']]
+            )
+            boundary = list(boundary)
+            if boundary:
+                overflow = ChatTurn.objects.filter(created_at__lt=boundary[0]).order_by()
+
+        if options['dry_run']:
+            self.stdout.write(
+                f"Would delete {expired.count()} turns older than {options['days']} days "
+                f"and {overflow.exclude(created_at__lt=cutoff).count()} beyond the {options['max_rows']} row cap"
+            )
+            return
+
+        deleted = self._delete_in_batches(expired, options['batch_size'])
+        deleted += self._delete_in_batches(overflow, options['batch_size'])
+        hitters_deleted = ChatHeavyHitter.objects.filter(day__lt=cutoff.date()).delete()[0]
+
+        remaining = ChatTurn.objects.count()
+        self.stdout.write(self.style.SUCCESS(
+            f'🧹 Deleted {deleted} chat turns ({remaining} remaining) and {hitters_deleted} heavy-hitter rows'
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from sweetapp.session_backend import SessionStore, sweep_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions from the database in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per query')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        model = SessionStore.get_model_class()
+        if options['dry_run']:
+            expired = model.objects.filter(expire_date__lt=timezone.now()).count()
+            self.stdout.write(f"Would delete {expired} expired sessions")
+            return
+
+        deleted = sweep_expired(options['batch_size'])
+        remaining = model.objects.count()
+        self.stdout.write(self.style.SUCCESS(
+            f'🧹 Deleted {deleted} expired sessions ({remaining} remaining)'
+        ))
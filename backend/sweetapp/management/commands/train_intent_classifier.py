@@ -0,0 +1,122 @@
+"""
+Train the local intent classifier head.
+
+Combines the hand-labeled seed examples with chat turns the remote
+classifier labeled, embeds them with the MiniLM model used for vector
+search and saves a linear head as a NumPy archive. With --eval a held-out
+split is scored first, including how many messages would be answered
+locally at the confidence threshold and how accurate those answers are.
+"""
+import random
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from sweetapp.intent_classifier import (
+    INTENT_LABELS,
+    LocalIntentClassifier,
+    seed_examples,
+    train_centroid,
+    train_logistic,
+)
+from sweetapp.models import ChatTurn
+from sweetapp.vector_db import get_vector_db
+
+
+def _logged_examples(days: int, limit: int) -> list:
+    """(text, label) pairs from turns classified by the remote model, newest label wins"""
+    turns = (
+        ChatTurn.objects.filter(
+            intent_source='ai',
+            intent__in=INTENT_LABELS,
+            created_at__gte=timezone.now() - timedelta(days=days),
+        )
+        .order_by('-created_at')
+        .values_list('message', 'intent')[:limit]
+    )
+    examples = {}
+    for message, intent in turns:
+        key = ' '.join(message.lower().split())
+        if key and key not in examples:
+            examples[key] = (message.strip(), intent)
+    return list(examples.values())
+
+
+class Command(BaseCommand):
+    help = 'Train the local embedding intent classifier from seed examples and logged remote classifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--head', choices=['logistic', 'centroid'], default='logistic')
+        parser.add_argument('--days', type=int, default=90, help='Use turns logged in the last N days')
+        parser.add_argument('--max-logged', type=int, default=20000, help='Most logged turns to train on')
+        parser.add_argument('--no-logged', action='store_true', help='Train on the seed examples only')
+        parser.add_argument('--eval', type=float, default=0.0, help='Fraction held out for evaluation (0 = skip)')
+        parser.add_argument(
+            '--threshold', type=float, default=getattr(settings, 'CHAT_INTENT_LOCAL_THRESHOLD', 0.8),
+            help='Confidence threshold to report coverage at',
+        )
+        parser.add_argument('--output', default='', help='Where to save the head (default: CHAT_INTENT_MODEL_PATH)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--dry-run', action='store_true', help='Evaluate without saving the head')
+
+    def _train(self, head, embeddings, labels):
+        return train_logistic(embeddings, labels) if head == 'logistic' else train_centroid(embeddings, labels)
+
+    def _evaluate(self, model, embeddings, labels, threshold):
+        probabilities = model.predict_proba(embeddings)
+        predicted = [model.labels[i] for i in probabilities.argmax(axis=1)]
+        confident = probabilities.max(axis=1) >= threshold
+        correct = np.array([p == t for p, t in zip(predicted, labels)])
+
+        self.stdout.write(f"\n{'intent':<16}{'precision':>10}{'recall':>9}{'support':>9}")
+        for label in INTENT_LABELS:
+            support = sum(1 for t in labels if t == label)
+            predicted_count = sum(1 for p in predicted if p == label)
+            hits = sum(1 for p, t in zip(predicted, labels) if p == t == label)
+            if not support and not predicted_count:
+                continue
+            precision = hits / predicted_count if predicted_count else 0.0
+            recall = hits / support if support else 0.0
+            self.stdout.write(f"{label:<16}{precision:>10.2f}{recall:>9.2f}{support:>9}")
+
+        self.stdout.write(f"\nAccuracy: {correct.mean():.1%} on {len(labels)} held-out examples")
+        if confident.any():
+            self.stdout.write(
+                f"At threshold {threshold:.2f}: {confident.mean():.1%} answered locally, "
+                f"{correct[confident].mean():.1%} of those correct"
+            )
+        else:
+            self.stdout.write(f"At threshold {threshold:.2f}: nothing answered locally")
+
+    def handle(self, *args, **options):
+        examples = seed_examples()
+        logged = [] if options['no_logged'] else _logged_examples(options['days'], options['max_logged'])
+        examples += logged
+        self.stdout.write(f"📚 {len(examples)} examples ({len(logged)} from logged turns)")
+
+        texts = [text for text, _label in examples]
+        labels = [label for _text, label in examples]
+        embedder = get_vector_db().embedder
+        embeddings = embedder.encode(texts, batch_size=64, normalize_embeddings=True, show_progress_bar=False)
+
+        if options['eval'] > 0:
+            order = list(range(len(examples)))
+            random.Random(options['seed']).shuffle(order)
+            held_out = set(order[:max(1, int(len(order) * options['eval']))])
+            train_idx = [i for i in range(len(examples)) if i not in held_out]
+            test_idx = sorted(held_out)
+            model = self._train(options['head'], embeddings[train_idx], [labels[i] for i in train_idx])
+            self._evaluate(model, embeddings[test_idx], [labels[i] for i in test_idx], options['threshold'])
+
+        if options['dry_run']:
+            return
+
+        model = self._train(options['head'], embeddings, labels)
+        path = LocalIntentClassifier(path=options['output'] or None).path
+        model.save(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Saved {model.kind} head ({len(model.labels)} intents) to {path}"
+        ))
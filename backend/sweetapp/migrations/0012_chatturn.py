@@ -0,0 +1,45 @@
+# Generated by Django 5.1.6 on 2026-10-19 07:47
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sweetapp', '0011_faqcategory_faqpage_faqitem_faqcategory_faq_page'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatTurn',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_key', models.CharField(blank=True, max_length=40)),
+                ('message', models.TextField()),
+                ('response', models.TextField(blank=True)),
+                ('intent', models.CharField(blank=True, max_length=30)),
+                ('confidence', models.CharField(blank=True, max_length=10)),
+                ('intent_fallback', models.BooleanField(default=False)),
+                ('action', models.CharField(blank=True, max_length=30)),
+                ('products', models.JSONField(blank=True, default=list)),
+                ('provider', models.CharField(blank=True, max_length=30)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('outcome', models.CharField(blank=True, max_length=30)),
+                ('response_time_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('timings', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='chat_turns', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Chat Turn',
+                'verbose_name_plural': 'Chat Turns',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='sweetapp_ch_created_24a68a_idx'), models.Index(fields=['intent', 'created_at'], name='sweetapp_ch_intent_73d9a5_idx'), models.Index(fields=['session_key', 'created_at'], name='sweetapp_ch_session_0c1137_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-19 07:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sweetapp', '0012_chatturn'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatHeavyHitter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('query', 'Query'), ('zero_result', 'Zero-result query'), ('product', 'Product'), ('intent', 'Intent')], max_length=20)),
+                ('key', models.CharField(max_length=200)),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Chat Heavy Hitter',
+                'verbose_name_plural': 'Chat Heavy Hitters',
+                'ordering': ['-day', '-count'],
+                'indexes': [models.Index(fields=['kind', 'day'], name='sweetapp_ch_kind_b3e744_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'key', 'day'), name='unique_chat_heavy_hitter')],
+            },
+        ),
+    ]
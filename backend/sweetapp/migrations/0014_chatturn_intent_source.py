@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 07:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sweetapp', '0013_chatheavyhitter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatturn',
+            name='intent_source',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.6 on 2026-10-19 08:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sweetapp', '0014_chatturn_intent_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('provider', models.CharField(max_length=30)),
+                ('model', models.CharField(max_length=100)),
+                ('key', models.CharField(max_length=16)),
+                ('purpose', models.CharField(choices=[('intent', 'Intent analysis'), ('reply', 'Chat reply')], max_length=10)),
+                ('intent', models.CharField(blank=True, max_length=30)),
+                ('calls', models.PositiveIntegerField(default=0)),
+                ('estimated_calls', models.PositiveIntegerField(default=0)),
+                ('prompt_tokens', models.PositiveBigIntegerField(default=0)),
+                ('completion_tokens', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Token Usage',
+                'verbose_name_plural': 'Token Usage',
+                'ordering': ['-day', 'provider', 'model'],
+                'indexes': [models.Index(fields=['day', 'key'], name='sweetapp_to_day_d55c63_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'provider', 'model', 'key', 'purpose', 'intent'), name='unique_token_usage')],
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 import uuid
 
 
@@ -559,3 +560,116 @@ class FAQItem(models.Model):
     
     def __str__(self):
         return self.question
+
+
+# Chat Assistant Log
+class ChatTurn(models.Model):
+    """One user message handled by the chat assistant (written in batches by chat_log)"""
+    session_key = models.CharField(max_length=40, blank=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='chat_turns')
+
+    message = models.TextField()
+    response = models.TextField(blank=True)
+
+    # Intent analysis
+    intent = models.CharField(max_length=30, blank=True)
+    confidence = models.CharField(max_length=10, blank=True)
+    intent_fallback = models.BooleanField(default=False)  # Keyword fallback instead of the AI classifier
+    intent_source = models.CharField(max_length=10, blank=True)  # ai, local or fallback
+    action = models.CharField(max_length=30, blank=True)  # add_to_cart, list, faq, checkout, product_info
+    products = models.JSONField(default=list, blank=True)  # Matched product names
+
+    # Generation
+    provider = models.CharField(max_length=30, blank=True)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    outcome = models.CharField(max_length=30, blank=True)  # completed, templated, aborted_*, cached, shared, provider_busy, budget_exhausted, error
+    response_time_ms = models.PositiveIntegerField(null=True, blank=True)
+    timings = models.JSONField(default=dict, blank=True)  # Stage durations in ms
+
+    # Set when the turn happens, not when the batch is flushed
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Chat Turn"
+        verbose_name_plural = "Chat Turns"
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['intent', 'created_at']),
+            models.Index(fields=['session_key', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.intent or 'chat'}: {self.message[:50]}"
+
+
+class ChatHeavyHitter(models.Model):
+    """Daily top-K counts merged from each worker's chat sketches (see chat_sketches)"""
+    KIND_CHOICES = [
+        ('query', 'Query'),
+        ('zero_result', 'Zero-result query'),
+        ('product', 'Product'),
+        ('intent', 'Intent'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    key = models.CharField(max_length=200)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day', '-count']
+        verbose_name = "Chat Heavy Hitter"
+        verbose_name_plural = "Chat Heavy Hitters"
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'key', 'day'], name='unique_chat_heavy_hitter'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.key} ({self.count} on {self.day})"
+
+
+class TokenUsage(models.Model):
+    """Daily provider token totals merged from each worker's token meter (see token_meter)"""
+    PURPOSE_CHOICES = [
+        ('intent', 'Intent analysis'),
+        ('reply', 'Chat reply'),
+    ]
+
+    day = models.DateField()
+    provider = models.CharField(max_length=30)
+    model = models.CharField(max_length=100)
+    key = models.CharField(max_length=16)  # API key fingerprint, never the key itself
+    purpose = models.CharField(max_length=10, choices=PURPOSE_CHOICES)
+    intent = models.CharField(max_length=30, blank=True)
+    calls = models.PositiveIntegerField(default=0)
+    estimated_calls = models.PositiveIntegerField(default=0)  # Counted locally; the provider sent no usage
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day', 'provider', 'model']
+        verbose_name = "Token Usage"
+        verbose_name_plural = "Token Usage"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'provider', 'model', 'key', 'purpose', 'intent'],
+                name='unique_token_usage',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'key']),
+        ]
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def __str__(self):
+        return f"{self.provider}/{self.model} {self.purpose} on {self.day}: {self.total_tokens} tokens"
@@ -0,0 +1,12 @@
+"""
+Order pricing rules for Sweet Dessert
+Delivery fee and tax used by order creation, payment intents and the chat
+cart quote, kept in one place so a quote always matches the charged total.
+"""
+
+from decimal import Decimal
+
+# Delivery is free for subtotals above this amount
+FREE_DELIVERY_THRESHOLD = Decimal("25")
+DELIVERY_FEE = Decimal("4.99")
+TAX_RATE = Decimal("0.08")
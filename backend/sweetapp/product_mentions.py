@@ -0,0 +1,260 @@
+"""
+Product mention detection for Sweet Dessert Chat Assistant
+Finds catalog product names in an LLM reply while it streams, so the chat
+view can send a product_mention event (id, price, image) right after the
+frame that completes a name and clients can render product cards without a
+second request. Names are matched with an Aho-Corasick automaton built once
+per catalog version; each reply gets a matcher that keeps its automaton state
+between chunks, so every character is examined once and the accumulated
+reply is never rescanned.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, DessertItem
+
+logger = logging.getLogger(__name__)
+
+# Shorter normalized names ("pie") match inside too much ordinary text
+MIN_NAME_LENGTH = 4
+
+
+def _normalize_char(char: str, after_space: bool) -> str:
+    """Lowercased letters and digits; any other run of characters becomes one space"""
+    if char.isalnum():
+        return char.lower()
+    return "" if after_space else " "
+
+
+def normalize_name(name: str) -> str:
+    """Name as the matcher sees text: lowercase words separated by single spaces"""
+    out = []
+    after_space = True
+    for char in name:
+        normalized = _normalize_char(char, after_space)
+        out.append(normalized)
+        if normalized:
+            after_space = normalized == " "
+    return "".join(out).strip()
+
+
+class MentionAutomaton:
+    """
+    Aho-Corasick automaton over space-delimited product names
+
+    Each pattern is " name " with both spaces, so a match always covers
+    whole words and completes on the character after the name.
+    """
+
+    def __init__(self, patterns: Dict[str, int], products: List[dict]):
+        """
+        Args:
+            patterns: Normalized name (or plural) -> index of its product
+            products: Product payloads sent in product_mention events
+        """
+        self.products = products
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # Longest pattern ending in each state: (product index, length) or None
+        self.output: List[Optional[tuple]] = [None]
+
+        for name, product in patterns.items():
+            pattern = f" {name} "
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(None)
+                state = next_state
+            self.output[state] = (product, len(pattern))
+
+        # Breadth-first failure links; a state inherits the longest output of its suffixes
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                if self.output[child] is None:
+                    self.output[child] = self.output[self.fail[child]]
+
+    def step(self, state: int, char: str) -> int:
+        while state and char not in self.goto[state]:
+            state = self.fail[state]
+        return self.goto[state].get(char, 0)
+
+
+class MentionMatcher:
+    """Matches one reply as it streams; feed() each chunk, then finish()"""
+
+    def __init__(self, automaton: MentionAutomaton):
+        self._automaton = automaton
+        # Start after a virtual space so a name at the very start matches
+        self._state = automaton.step(0, " ")
+        self._after_space = True
+        self._seen = set()
+
+    def feed(self, text: str) -> List[dict]:
+        """
+        Advance over a chunk of the reply
+
+        Returns:
+            Products whose name was completed in this chunk, each product
+            only the first time it is mentioned
+        """
+        found = []
+        automaton = self._automaton
+        state = self._state
+        after_space = self._after_space
+        for raw in text:
+            for char in _normalize_char(raw, after_space):
+                after_space = char == " "
+                state = automaton.step(state, char)
+                match = automaton.output[state]
+                if match is not None and match[0] not in self._seen:
+                    self._seen.add(match[0])
+                    found.append(automaton.products[match[0]])
+        self._state = state
+        self._after_space = after_space
+        return found
+
+    def finish(self) -> List[dict]:
+        """Complete a name the reply ends with"""
+        return self.feed(" ")
+
+
+class ProductMentionIndex:
+    """The automaton for the current catalog, rebuilt lazily when it changes"""
+
+    def __init__(self):
+        self.check_interval = getattr(settings, "CHAT_PRODUCT_MENTION_CHECK_SECONDS", 30)
+        self._lock = threading.Lock()
+        self._automaton: Optional[MentionAutomaton] = None
+        self._version: Optional[str] = None
+        self._stale = True
+        self._checked_at = 0.0
+        self.matchers = 0
+
+    def content_version(self) -> str:
+        """Fingerprint of the catalog: product count and last edit, plus the category rows"""
+        items = DessertItem.objects.aggregate(count=Count("id"), latest=Max("updated_at"))
+        categories = list(Category.objects.order_by("id").values_list("id", "name"))
+        raw = f"{items['count']}|{items['latest']}|{categories}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+    def invalidate(self):
+        """Rebuild before the next matcher (called when products are saved or deleted)"""
+        self._stale = True
+
+    def _ensure_current(self):
+        now = time.monotonic()
+        if not self._stale and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if not self._stale and now - self._checked_at < self.check_interval:
+                return
+            # Cleared before reading so a save during the rebuild triggers another one
+            self._stale = False
+            self._checked_at = now
+            try:
+                version = self.content_version()
+                if version != self._version:
+                    self._build(version)
+            except Exception as e:
+                logger.error(f"Error building product mention index: {e}")
+
+    def _build(self, version: str):
+        started = time.perf_counter()
+        rows = DessertItem.objects.filter(available=True).values_list(
+            "id", "name", "price", "image", "category__name"
+        )
+        products = []
+        patterns = {}
+        for product_id, name, price, image, category in rows:
+            normalized = normalize_name(name)
+            if len(normalized) < MIN_NAME_LENGTH:
+                continue
+            index = len(products)
+            products.append(
+                {
+                    "id": product_id,
+                    "name": name,
+                    "price": str(price),
+                    "category": category,
+                    "image": image,
+                }
+            )
+            # First product wins if two names normalize the same
+            patterns.setdefault(normalized, index)
+            if not normalized.endswith("s"):
+                patterns.setdefault(normalized + "s", index)
+
+        self._automaton = MentionAutomaton(patterns, products)
+        self._version = version
+        logger.info(
+            "Product mention index %s built: %d products, %d states in %.1f ms",
+            version,
+            len(products),
+            len(self._automaton.goto),
+            (time.perf_counter() - started) * 1000,
+        )
+
+    def matcher(self) -> Optional[MentionMatcher]:
+        """A matcher for one reply, or None if the catalog could not be loaded"""
+        self._ensure_current()
+        automaton = self._automaton
+        if automaton is None:
+            return None
+        self.matchers += 1
+        return MentionMatcher(automaton)
+
+    def stats(self) -> dict:
+        self._ensure_current()
+        automaton = self._automaton
+        return {
+            "version": self._version,
+            "products": len(automaton.products) if automaton is not None else 0,
+            "states": len(automaton.goto) if automaton is not None else 0,
+            "matchers": self.matchers,
+        }
+
+
+# Global instance shared by all requests in this process
+product_mentions = None
+_mentions_lock = threading.Lock()
+
+
+def get_product_mentions() -> ProductMentionIndex:
+    """Get or create the global product mention index instance"""
+    global product_mentions
+    if product_mentions is None:
+        with _mentions_lock:
+            if product_mentions is None:
+                product_mentions = ProductMentionIndex()
+    return product_mentions
+
+
+@receiver(post_save, sender=DessertItem)
+@receiver(post_delete, sender=DessertItem)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def _catalog_changed(sender, **kwargs):
+    if product_mentions is not None:
+        product_mentions.invalidate()
@@ -0,0 +1,216 @@
+"""
+Prompt Token Budgeting for Sweet Dessert Chat Assistant
+Counts tokens locally and packs retrieved context, FAQs and conversation
+history into a fixed prompt budget, dropping or trimming the least relevant
+and oldest material first.
+"""
+
+import logging
+import re
+import threading
+from collections import Counter
+from typing import Callable, Dict, NamedTuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# GPT-style pre-tokenization: contractions, words, numbers, punctuation runs, whitespace
+_PRETOKEN_RE = re.compile(
+    r"'(?:s|t|re|ve|m|ll|d)|\s?[^\W\d_]+|\s?\d{1,3}|\s?[^\s\w]+|\s+(?!\S)|\s+",
+    re.UNICODE,
+)
+
+# Average characters per BPE piece for long words
+_CHARS_PER_PIECE = 4
+
+# Per-message overhead of the chat completion format (role, separators)
+MESSAGE_OVERHEAD = 4
+
+# Don't bother keeping a trimmed item smaller than this
+MIN_TRIMMED_TOKENS = 24
+
+# Share of the space left after instructions and the user message
+SECTION_SHARES = {"context": 0.5, "faq": 0.2, "history": 0.3}
+
+# Packing counters for chat_stats, shared by all requests in this process
+_stats_lock = threading.Lock()
+_stats = Counter()
+_last_token_counts: Dict[str, int] = {}
+
+
+def _piece_count(pretoken: str) -> int:
+    stripped = pretoken.strip()
+    if not stripped:
+        return 1 if pretoken else 0
+    if not stripped.isascii():
+        # Emojis and non-Latin text tokenize at roughly one piece per character
+        return len(stripped)
+    return max(1, -(-len(stripped) // _CHARS_PER_PIECE))
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate the number of LLM tokens in a text
+
+    Uses a GPT-style pre-tokenizer and splits long words into ~4 character
+    pieces, which tracks BPE tokenizers closely enough for budgeting.
+    """
+    if not text:
+        return 0
+    return sum(_piece_count(m.group(0)) for m in _PRETOKEN_RE.finditer(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = "...") -> str:
+    """Cut text down to at most max_tokens, on a pre-token boundary"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    limit = max_tokens - count_tokens(suffix)
+    used = 0
+    end = 0
+    for match in _PRETOKEN_RE.finditer(text):
+        cost = _piece_count(match.group(0))
+        if used + cost > limit:
+            break
+        used += cost
+        end = match.end()
+    return text[:end].rstrip() + suffix
+
+
+class PackedPrompt(NamedTuple):
+    """Result of fitting prompt sections into the token budget"""
+
+    context_chunks: list
+    faq_context: list
+    history: list
+    token_counts: Dict[str, int]
+
+
+def _pack_items(items: list, budget: int, cost: Callable, trim: Callable) -> tuple:
+    """Greedily keep items (best first) while they fit; trim the first that doesn't"""
+    kept = []
+    used = 0
+    for item in items:
+        item_cost = cost(item)
+        if used + item_cost <= budget:
+            kept.append(item)
+            used += item_cost
+            continue
+        remaining = budget - used
+        if remaining >= MIN_TRIMMED_TOKENS:
+            trimmed = trim(item, remaining)
+            kept.append(trimmed)
+            used += cost(trimmed)
+        break
+    return kept, used
+
+
+def pack_prompt(
+    instructions: str,
+    message: str,
+    context_chunks: list = None,
+    faq_context: list = None,
+    history: list = None,
+    format_chunk: Callable = None,
+    format_faq: Callable = None,
+    total_budget: int = None,
+) -> PackedPrompt:
+    """
+    Fit retrieved context, FAQs and history into a total prompt token budget
+
+    Args:
+        instructions: The fixed system prompt text (without dynamic sections)
+        message: Current user message (always kept)
+        context_chunks: Vector search results, most relevant first
+        faq_context: FAQ dicts, highest score first
+        history: Conversation turns, oldest first
+        format_chunk: Renders a chunk the way the system prompt does
+        format_faq: Renders an FAQ the way the system prompt does
+        total_budget: Override for settings.CHAT_PROMPT_TOKEN_BUDGET
+
+    Returns:
+        PackedPrompt with the kept (possibly trimmed) items and token counts
+    """
+    if total_budget is None:
+        total_budget = getattr(settings, "CHAT_PROMPT_TOKEN_BUDGET", 3000)
+    format_chunk = format_chunk or (lambda chunk: chunk.get("text", ""))
+    format_faq = format_faq or (lambda faq: f"Q: {faq['question']}\nA: {faq['answer']}")
+
+    instruction_tokens = count_tokens(instructions) + MESSAGE_OVERHEAD
+    message_tokens = count_tokens(message) + MESSAGE_OVERHEAD
+    available = max(0, total_budget - instruction_tokens - message_tokens)
+
+    # Retrieved context: keep in relevance order, trim the chunk text of the last one
+    context_budget = int(available * SECTION_SHARES["context"])
+    chunks = sorted(context_chunks or [], key=lambda c: c.get("distance", 0))
+
+    def trim_chunk(chunk, budget):
+        overhead = count_tokens(format_chunk(dict(chunk, text="")))
+        return dict(chunk, text=truncate_to_tokens(chunk.get("text", ""), budget - overhead, ""))
+
+    kept_chunks, context_used = _pack_items(
+        chunks, context_budget, lambda c: count_tokens(format_chunk(c)), trim_chunk
+    )
+
+    # FAQs: unused context space flows down
+    faq_budget = int(available * SECTION_SHARES["faq"]) + (context_budget - context_used)
+    faqs = sorted(faq_context or [], key=lambda f: f.get("score", 0), reverse=True)
+
+    def trim_faq(faq, budget):
+        overhead = count_tokens(format_faq(dict(faq, answer="")))
+        return dict(faq, answer=truncate_to_tokens(faq["answer"], budget - overhead))
+
+    kept_faqs, faq_used = _pack_items(
+        faqs, faq_budget, lambda f: count_tokens(format_faq(f)), trim_faq
+    )
+
+    # History gets whatever is left, newest turns first
+    history_budget = available - context_used - faq_used
+
+    def trim_turn(turn, budget):
+        return dict(turn, content=truncate_to_tokens(turn["content"], budget - MESSAGE_OVERHEAD))
+
+    kept_turns, history_used = _pack_items(
+        list(reversed(history or [])),
+        history_budget,
+        lambda t: count_tokens(t.get("content", "")) + MESSAGE_OVERHEAD,
+        trim_turn,
+    )
+    kept_turns.reverse()
+
+    token_counts = {
+        "instructions": instruction_tokens,
+        "context": context_used,
+        "faq": faq_used,
+        "history": history_used,
+        "message": message_tokens,
+        "total": instruction_tokens + context_used + faq_used + history_used + message_tokens,
+        "budget": total_budget,
+    }
+    dropped = {
+        "context": len(chunks) - len(kept_chunks),
+        "faq": len(faqs) - len(kept_faqs),
+        "history": len(history or []) - len(kept_turns),
+    }
+    logger.info("Prompt packed: %s tokens (%s), dropped %s", token_counts["total"], token_counts, dropped)
+    _record_packing(token_counts, dropped)
+
+    return PackedPrompt(kept_chunks, kept_faqs, kept_turns, token_counts)
+
+
+def _record_packing(token_counts: Dict[str, int], dropped: Dict[str, int]):
+    global _last_token_counts
+    with _stats_lock:
+        _stats["prompts"] += 1
+        _stats["truncated"] += int(any(dropped.values()))
+        for section, count in dropped.items():
+            _stats[f"dropped_{section}"] += count
+        _last_token_counts = dict(token_counts)
+
+
+def prompt_budget_stats() -> dict:
+    """Prompts packed, how many lost material to the budget, and the last one's section sizes"""
+    with _stats_lock:
+        return {**_stats, "last_token_counts": dict(_last_token_counts)}
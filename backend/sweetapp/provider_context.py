@@ -0,0 +1,105 @@
+"""
+Request-scoped provider context for Sweet Dessert Chat Assistant
+Holds the caller's API key, provider, model and deadline in a ContextVar so
+concurrent requests on threaded or async workers never see each other's
+settings. Threads started for a request copy the context when they are
+created, and streamed responses are iterated inside the request's context.
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Iterator, Optional
+
+
+@dataclass(frozen=True)
+class ProviderContext:
+    """
+    Provider settings for the request being served
+
+    Attributes:
+        api_key: Key supplied by the client ("" means use server-side keys)
+        provider: Provider chosen for this request (openrouter/cerebras)
+        model: Chat model chosen for the provider, one of its configured models
+        pinned: Keep the chosen provider first instead of ranking by stats
+        deadline: time.monotonic() value by which the request must finish
+    """
+
+    api_key: str = ""
+    provider: str = "openrouter"
+    model: Optional[str] = None
+    pinned: bool = False
+    deadline: Optional[float] = None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline (None when there is no deadline)"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def timeout(self, default: float) -> float:
+        """A request timeout that never runs past the deadline"""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        # Keep a small floor so an expiring request still fails with a clean timeout
+        return max(0.5, min(default, remaining))
+
+
+_provider_context = contextvars.ContextVar("provider_context", default=ProviderContext())
+
+
+def current_provider_context() -> ProviderContext:
+    """Provider context of the request running in this thread or task"""
+    return _provider_context.get()
+
+
+def set_provider_context(**fields) -> contextvars.Token:
+    """Replace fields of the current context; returns a token for reset"""
+    return _provider_context.set(replace(_provider_context.get(), **fields))
+
+
+def reset_provider_context(token: contextvars.Token):
+    _provider_context.reset(token)
+
+
+@contextmanager
+def provider_context(**fields):
+    """Run a block with some provider context fields replaced"""
+    token = set_provider_context(**fields)
+    try:
+        yield _provider_context.get()
+    finally:
+        _provider_context.reset(token)
+
+
+def iterate_in_context(iterator, context: contextvars.Context = None) -> Iterator:
+    """
+    Advance an iterator inside a fixed context
+
+    A streamed response body runs after the view returned, possibly on
+    another thread (ASGI); running every step in the view's context keeps
+    the request's provider settings visible to the generator.
+
+    Args:
+        iterator: Generator to drive (its close() is forwarded too)
+        context: Context to run in (default: a copy of the caller's)
+    """
+    # Captured now, not on the first next(), which happens after the view returned
+    context = context or contextvars.copy_context()
+
+    def steps():
+        try:
+            while True:
+                try:
+                    item = context.run(next, iterator)
+                except StopIteration:
+                    return
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                context.run(close)
+
+    return steps()
@@ -0,0 +1,272 @@
+"""
+Provider Rate Limiting and Circuit Breaking for Sweet Dessert Chat Assistant
+Keeps a token bucket and a circuit breaker per provider and API key so that a
+rate-limited or failing provider is skipped instead of hammered.
+"""
+# cSpell:ignore cerebras
+
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderUnavailable(Exception):
+    """Raised when every candidate provider is rate limited or has an open breaker"""
+
+    def __init__(self, message: str = "No AI provider available", retry_after: float = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Short, non-reversible identifier for an API key"""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:8]
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def peek(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def wait_time(self, tokens: float = 1) -> float:
+        self._refill()
+        if self.tokens >= tokens or self.rate <= 0:
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, half-opens after a cooldown to let one probe through"""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.probe_started_at = 0.0
+
+    def retry_in(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.time())
+
+    def allows(self) -> bool:
+        if self.state == OPEN and self.retry_in() <= 0:
+            self.state = HALF_OPEN
+            self.probe_in_flight = False
+        if self.state == OPEN:
+            return False
+        if self.state == HALF_OPEN:
+            # A probe that never reported back (e.g. a cancelled hedge) expires
+            stale = time.time() - self.probe_started_at > self.cooldown
+            return not self.probe_in_flight or stale
+        return True
+
+    def on_attempt(self):
+        if self.state == HALF_OPEN:
+            self.probe_in_flight = True
+            self.probe_started_at = time.time()
+
+    def on_success(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+    def on_failure(self):
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.threshold:
+            self.state = OPEN
+            self.opened_at = time.time()
+
+    def open_until(self, until: float):
+        """Adopt an open state published by another worker"""
+        if until > time.time() and self.state != OPEN:
+            self.state = OPEN
+            self.opened_at = until - self.cooldown
+
+
+class ProviderGuard:
+    """Process-wide registry of buckets and breakers, optionally shared through the cache"""
+
+    def __init__(self):
+        self._buckets: Dict[tuple, TokenBucket] = {}
+        self._breakers: Dict[tuple, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._local_cache_warned = False
+
+    @property
+    def rate(self) -> float:
+        return getattr(settings, "CHAT_PROVIDER_RATE_PER_MINUTE", 20) / 60.0
+
+    @property
+    def burst(self) -> float:
+        return getattr(settings, "CHAT_PROVIDER_BURST", 5)
+
+    @property
+    def shared(self) -> bool:
+        """Whether limits are shared; never through a per-process LocMemCache"""
+        if not getattr(settings, "CHAT_PROVIDER_LIMITS_SHARED", False):
+            return False
+        if isinstance(self.cache, LocMemCache):
+            if not self._local_cache_warned:
+                self._local_cache_warned = True
+                logger.warning(
+                    "CHAT_PROVIDER_LIMITS_SHARED ignored: cache %r is process-local; "
+                    "point CHAT_PROVIDER_LIMITS_CACHE at a file or Redis cache",
+                    getattr(settings, "CHAT_PROVIDER_LIMITS_CACHE", "sessions"),
+                )
+            return False
+        return True
+
+    @property
+    def cache(self):
+        """Cache every worker sees, holding the shared counters and breaker state"""
+        return caches[getattr(settings, "CHAT_PROVIDER_LIMITS_CACHE", "sessions")]
+
+    def _key(self, provider: str, api_key: str) -> tuple:
+        return (provider, key_fingerprint(api_key))
+
+    def _bucket(self, key: tuple) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _breaker(self, key: tuple) -> CircuitBreaker:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker(
+                getattr(settings, "CHAT_BREAKER_THRESHOLD", 3),
+                getattr(settings, "CHAT_BREAKER_COOLDOWN", 30),
+            )
+        if self.shared:
+            until = self.cache.get(f"chat:breaker:{key[0]}:{key[1]}")
+            if until:
+                breaker.open_until(until)
+        return breaker
+
+    def _shared_acquire(self, key: tuple) -> bool:
+        """Fixed one-minute window counter shared by all workers through the cache"""
+        window = int(time.time() // 60)
+        cache_key = f"chat:bucket:{key[0]}:{key[1]}:{window}"
+        limit = getattr(settings, "CHAT_PROVIDER_RATE_PER_MINUTE", 20)
+        cache = self.cache
+        cache.add(cache_key, 0, timeout=120)
+        try:
+            return cache.incr(cache_key) <= limit
+        except ValueError:
+            return True
+
+    def is_available(self, provider: str, api_key: str) -> bool:
+        """Non-consuming check used when ranking candidates"""
+        key = self._key(provider, api_key)
+        with self._lock:
+            return self._breaker(key).allows() and self._bucket(key).peek() >= 1
+
+    def headroom(self, provider: str, api_key: str) -> float:
+        """Tokens left in the bucket, or 0 while the breaker is open"""
+        key = self._key(provider, api_key)
+        with self._lock:
+            if not self._breaker(key).allows():
+                return 0.0
+            return self._bucket(key).peek()
+
+    def acquire(self, provider: str, api_key: str) -> bool:
+        """Take a token and register the attempt; False if the call must be skipped"""
+        key = self._key(provider, api_key)
+        with self._lock:
+            breaker = self._breaker(key)
+            if not breaker.allows() or not self._bucket(key).try_acquire():
+                return False
+            breaker.on_attempt()
+        if self.shared and not self._shared_acquire(key):
+            return False
+        return True
+
+    def record_success(self, provider: str, api_key: str):
+        key = self._key(provider, api_key)
+        with self._lock:
+            self._breaker(key).on_success()
+
+    def record_failure(self, provider: str, api_key: str):
+        key = self._key(provider, api_key)
+        with self._lock:
+            breaker = self._breaker(key)
+            was_open = breaker.state == OPEN
+            breaker.on_failure()
+            opened = breaker.state == OPEN and not was_open
+            until = breaker.opened_at + breaker.cooldown
+        if opened:
+            logger.warning("Circuit breaker opened for %s (key %s)", key[0], key[1])
+            if self.shared:
+                self.cache.set(f"chat:breaker:{key[0]}:{key[1]}", until, timeout=int(breaker.cooldown) + 1)
+
+    def retry_after(self, provider: str, api_key: str) -> float:
+        """Seconds until this provider/key is expected to accept a call again"""
+        key = self._key(provider, api_key)
+        with self._lock:
+            return max(self._breaker(key).retry_in(), self._bucket(key).wait_time())
+
+    def snapshot(self) -> Dict:
+        """Breaker state and bucket level per provider/key for diagnostics"""
+        with self._lock:
+            keys = set(self._buckets) | set(self._breakers)
+            result = {}
+            for key in sorted(keys):
+                breaker = self._breaker(key)
+                breaker.allows()  # advance open -> half_open when the cooldown elapsed
+                result[f"{key[0]}:{key[1]}"] = {
+                    "breaker_state": breaker.state,
+                    "consecutive_failures": breaker.consecutive_failures,
+                    "retry_in_s": round(breaker.retry_in(), 1),
+                    "bucket_tokens": round(self._bucket(key).peek(), 2),
+                    "bucket_capacity": self.burst,
+                }
+            return result
+
+
+# Global instance shared by all requests in this process
+provider_guard = None
+
+
+def get_provider_guard() -> ProviderGuard:
+    """Get or create the global provider guard instance"""
+    global provider_guard
+    if provider_guard is None:
+        provider_guard = ProviderGuard()
+    return provider_guard
@@ -0,0 +1,254 @@
+"""
+Provider configuration registry for Sweet Dessert Chat Assistant
+Loads provider URLs, models, timeouts and API keys from backend/.env and the
+process environment once, caches them as an immutable snapshot and swaps in a
+fresh snapshot when the .env file changes. Providers may have several keys;
+each request picks one by round-robin or by the most rate-limit headroom.
+"""
+# cSpell:ignore OPENROUTER cerebras
+
+import itertools
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+
+from .provider_guard import get_provider_guard, key_fingerprint
+
+logger = logging.getLogger(__name__)
+
+ENV_PATH = Path(__file__).resolve().parent.parent / ".env"
+
+# Built-in defaults; each can be overridden with <PROVIDER>_API_URL, _MODEL,
+# _INTENT_MODEL and _TIMEOUT in .env or the environment. <PROVIDER>_CHAT_MODELS
+# lists further chat models a client may choose (comma separated). Without a _TIMEOUT
+# the caller's timeout applies (8 s for intent calls, 30 s for replies)
+PROVIDER_DEFAULTS = {
+    "openrouter": {
+        "url": "https://openrouter.ai/api/v1/chat/completions",
+        "chat_model": "stepfun/step-3.5-flash:free",
+        # Model that supports structured outputs, used for intent detection
+        "intent_model": "stepfun/step-3.5-flash:free",
+        "timeout": None,
+    },
+    "cerebras": {
+        "url": "https://api.cerebras.ai/v1/chat/completions",
+        "chat_model": "qwen-3-235b-a22b-instruct-2507",
+        # Structured intent output is currently configured for OpenRouter only
+        "intent_model": None,
+        "timeout": None,
+    },
+}
+
+KEY_STRATEGIES = ("round_robin", "least_used")
+
+
+class ProviderConfig(NamedTuple):
+    """Everything needed to call one provider"""
+
+    name: str
+    url: str
+    chat_model: str
+    chat_models: Tuple[str, ...]  # Models a client may choose, chat_model first
+    intent_model: Optional[str]
+    timeout: Optional[float]  # None: use the caller's timeout
+    keys: Tuple[str, ...]
+
+
+def _unquote(value: str) -> str:
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    return value
+
+
+def read_env_file(path: Path) -> Dict[str, str]:
+    """Parse KEY=value lines of a .env file (comments and blank lines ignored)"""
+    values = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#") or "=" not in line:
+                    continue
+                name, value = line.split("=", 1)
+                values[name.strip()] = _unquote(value)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Error reading {path}: {e}")
+    return values
+
+
+def _split_keys(*values: str) -> Tuple[str, ...]:
+    keys = []
+    for value in values:
+        for key in (value or "").split(","):
+            key = key.strip()
+            if key and key not in keys:
+                keys.append(key)
+    return tuple(keys)
+
+
+class ProviderRegistry:
+    """
+    Cached provider configuration with hot reload and multi-key selection
+
+    The .env file wins over the process environment, as before. Its mtime is
+    checked at most every CHAT_PROVIDER_RELOAD_SECONDS, so requests never read
+    the file; editing (or touching) it publishes a new snapshot atomically.
+    """
+
+    def __init__(self, env_path: Path = ENV_PATH):
+        self.env_path = Path(env_path)
+        self.check_interval = getattr(settings, "CHAT_PROVIDER_RELOAD_SECONDS", 5)
+        self.strategy = getattr(settings, "CHAT_PROVIDER_KEY_STRATEGY", "round_robin")
+        if self.strategy not in KEY_STRATEGIES:
+            logger.warning("Unknown CHAT_PROVIDER_KEY_STRATEGY %r, using round_robin", self.strategy)
+            self.strategy = "round_robin"
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, str], itertools.count] = {}
+        self._picks: Dict[Tuple[str, str], int] = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._providers: Dict[str, ProviderConfig] = {}
+        self.reload()
+
+    def _env_mtime(self) -> Optional[float]:
+        try:
+            return self.env_path.stat().st_mtime
+        except OSError:
+            return None
+
+    def _build(self, values: Dict[str, str]) -> Dict[str, ProviderConfig]:
+        providers = {}
+        for name, defaults in PROVIDER_DEFAULTS.items():
+            prefix = name.upper()
+            timeout = defaults["timeout"]
+            if values.get(f"{prefix}_TIMEOUT"):
+                try:
+                    timeout = float(values[f"{prefix}_TIMEOUT"]) or None
+                except ValueError:
+                    logger.warning("Ignoring invalid %s_TIMEOUT %r", prefix, values[f"{prefix}_TIMEOUT"])
+            chat_model = values.get(f"{prefix}_MODEL") or defaults["chat_model"]
+            providers[name] = ProviderConfig(
+                name=name,
+                url=values.get(f"{prefix}_API_URL")
+                or getattr(settings, f"{prefix}_API_URL", defaults["url"]),
+                chat_model=chat_model,
+                chat_models=_split_keys(chat_model, values.get(f"{prefix}_CHAT_MODELS")),
+                intent_model=values.get(f"{prefix}_INTENT_MODEL") or defaults["intent_model"],
+                timeout=timeout,
+                keys=_split_keys(values.get(f"{prefix}_API_KEY"), values.get(f"{prefix}_API_KEYS")),
+            )
+        return providers
+
+    def reload(self):
+        """Re-read .env and the environment and publish a new snapshot"""
+        mtime = self._env_mtime()
+        values = {**os.environ, **read_env_file(self.env_path)}
+        providers = self._build(values)
+        with self._lock:
+            self._providers = providers
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+        logger.info(
+            "Provider registry loaded: %s",
+            ", ".join(f"{name} ({len(cfg.keys)} key(s))" for name, cfg in providers.items()),
+        )
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        if self._env_mtime() != self._mtime:
+            self.reload()
+
+    def get(self, provider: str) -> Optional[ProviderConfig]:
+        self._maybe_reload()
+        return self._providers.get(provider)
+
+    def providers(self) -> List[ProviderConfig]:
+        self._maybe_reload()
+        return list(self._providers.values())
+
+    def configured(self) -> bool:
+        """True if any provider has at least one server-side key"""
+        return any(cfg.keys for cfg in self.providers())
+
+    def ordered_keys(self, provider: str, purpose: str = "chat") -> List[str]:
+        """
+        Server-side keys of a provider, the selected key first
+
+        The remaining keys follow as failover candidates, so a rate-limited
+        key falls through to the next key's quota. Round-robin rotates per
+        purpose so chat and intent calls each spread over every key.
+        """
+        cfg = self.get(provider)
+        if cfg is None or not cfg.keys:
+            return []
+        keys = list(cfg.keys)
+        if len(keys) == 1:
+            return keys
+
+        if self.strategy == "least_used":
+            guard = get_provider_guard()
+            with self._lock:
+                # Most rate-limit headroom first; ties go to the key picked least often
+                keys.sort(key=lambda k: (-guard.headroom(provider, k), self._picks.get((provider, k), 0)))
+                chosen = keys[0]
+                self._picks[(provider, chosen)] = self._picks.get((provider, chosen), 0) + 1
+            return keys
+
+        with self._lock:
+            counter = self._counters.setdefault((provider, purpose), itertools.count())
+            start = next(counter) % len(keys)
+        return keys[start:] + keys[:start]
+
+    def has_keys(self, provider: str) -> bool:
+        cfg = self.get(provider)
+        return bool(cfg and cfg.keys)
+
+    def is_server_key(self, provider: str, api_key: str) -> bool:
+        cfg = self.get(provider)
+        return bool(cfg and api_key in cfg.keys)
+
+    def default_key(self, provider: str) -> str:
+        """A configured key for the provider ("" if none); selection happens per call in ordered_keys"""
+        cfg = self.get(provider)
+        return cfg.keys[0] if cfg and cfg.keys else ""
+
+    def describe(self) -> Dict:
+        """Provider settings for diagnostics, with key fingerprints instead of keys"""
+        return {
+            cfg.name: {
+                "url": cfg.url,
+                "chat_model": cfg.chat_model,
+                "chat_models": list(cfg.chat_models),
+                "intent_model": cfg.intent_model,
+                "timeout": cfg.timeout,
+                "keys": [key_fingerprint(key) for key in cfg.keys],
+                "key_strategy": self.strategy,
+            }
+            for cfg in self.providers()
+        }
+
+
+# Global instance shared by all requests in this process
+provider_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_provider_registry() -> ProviderRegistry:
+    """Get or create the global provider registry instance"""
+    global provider_registry
+    if provider_registry is None:
+        with _registry_lock:
+            if provider_registry is None:
+                provider_registry = ProviderRegistry()
+    return provider_registry
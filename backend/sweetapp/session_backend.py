@@ -0,0 +1,116 @@
+"""
+Session engine for Sweet Dessert Chat Assistant
+Sessions are read from and written to the SESSION_CACHE_ALIAS cache on every
+request, and written through to the django_session table only when their
+data changed or the last database write is older than SESSION_WRITE_INTERVAL.
+With SESSION_SAVE_EVERY_REQUEST most requests only refresh an expiry date, so
+this keeps them off SQLite's single write lock. Expired rows are removed in
+small batches by sweep_expired() (`manage.py sweep_sessions`).
+"""
+
+import hashlib
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "sweetapp.session"
+
+
+class SessionStore(CachedDBStore):
+    """
+    Cached database sessions with coalesced database writes
+
+    Next to each session the cache holds a digest of the data last written
+    to the database and when that write happened. A save whose data matches
+    the digest and falls inside the write interval changes nothing: the
+    cached copy is still current and its expiry, like the row's, is at most
+    one interval behind a sliding SESSION_COOKIE_AGE.
+    """
+
+    cache_key_prefix = KEY_PREFIX
+
+    @property
+    def write_interval(self) -> int:
+        return getattr(settings, "SESSION_WRITE_INTERVAL", 300)
+
+    def _meta_key(self, session_key: str) -> str:
+        return f"{self.cache_key_prefix}{session_key}:db"
+
+    def _digest(self, data: dict) -> str:
+        return hashlib.sha1(self.serializer().dumps(data)).hexdigest()
+
+    def _is_unchanged(self, data: dict) -> bool:
+        try:
+            meta = self._cache.get(self._meta_key(self.session_key))
+        except Exception:
+            return False
+        if not meta:
+            return False
+        digest, written_at = meta
+        return digest == self._digest(data) and time.time() - written_at < self.write_interval
+
+    def _remember_write(self, data: dict):
+        try:
+            self._cache.set(
+                self._meta_key(self.session_key),
+                (self._digest(data), time.time()),
+                self.get_expiry_age(),
+            )
+        except Exception:
+            logger.exception("Error saving session write marker to cache (%s)", self._cache)
+
+    def save(self, must_create=False):
+        if must_create or self.session_key is None:
+            super().save(must_create)
+            if self.session_key is not None:
+                self._remember_write(self._get_session(no_load=must_create))
+            return
+
+        data = self._get_session()
+        if self._is_unchanged(data):
+            return
+        super().save(must_create)
+        self._remember_write(data)
+
+    async def asave(self, must_create=False):
+        await sync_to_async(self.save)(must_create)
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            session_key = self.session_key
+        super().delete(session_key)
+        if session_key is not None:
+            self._cache.delete(self._meta_key(session_key))
+
+    async def adelete(self, session_key=None):
+        await sync_to_async(self.delete)(session_key)
+
+    @classmethod
+    def clear_expired(cls):
+        sweep_expired()
+
+
+def sweep_expired(batch_size: int = 1000) -> int:
+    """
+    Delete expired sessions from the database in batches
+
+    Each batch is its own short DELETE so the sweep never holds the write
+    lock long enough to stall requests that are saving sessions.
+
+    Returns:
+        Number of session rows deleted
+    """
+    model = SessionStore.get_model_class()
+    expired = model.objects.filter(expire_date__lt=timezone.now()).order_by()
+    deleted = 0
+    while True:
+        keys = list(expired.values_list("session_key", flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += model.objects.filter(session_key__in=keys).delete()[0]
@@ -0,0 +1,274 @@
+"""
+Single-flight coalescing for Sweet Dessert Chat Assistant
+When many people send the same message at once, identical work (vector
+search, intent classification, the LLM reply for an identical prompt) is done
+once: the first caller for a key computes it and concurrent callers with the
+same key wait for and share its result. Streamed replies pass straight
+through to the first caller; callers that join read the same token stream from
+the start while a single upstream request is open. Nothing is kept after the work finishes; this is not a cache.
+"""
+
+import logging
+import threading
+from typing import Callable, Dict, Hashable, Iterator, List, Optional
+
+from django.db import connections
+
+from .provider_context import current_provider_context, iterate_in_context
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Case- and whitespace-insensitive form of a message, for flight keys"""
+    return " ".join((text or "").lower().split())
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class StreamTee:
+    """
+    One upstream stream read by any number of callers
+
+    The leader iterates the upstream itself and every chunk is kept in a list;
+    callers that join yield the list from the start and then wait for more.
+    A producer thread is only started if the leader leaves while others are
+    still reading. When the last reader leaves, the upstream is aborted.
+
+    Attributes:
+        abort_event: Passed to the upstream; set when nobody reads any more
+        turn_log: Filled by the upstream (provider, tokens, reply, outcome)
+    """
+
+    def __init__(self):
+        self.abort_event = threading.Event()
+        self.turn_log: dict = {"outcome": "error"}
+        self._chunks: List[str] = []
+        self._cond = threading.Condition()
+        self.done = False
+        self.readers = 0
+
+    def lead(
+        self,
+        events: Iterator[str],
+        stop_event: threading.Event = None,
+        on_done: Callable = None,
+    ) -> Iterator[str]:
+        """
+        Pass the upstream through to the leader, keeping chunks for joiners
+
+        Args:
+            events: The upstream generator
+            stop_event: The leader's own cancel flag
+            on_done: Called once the upstream has ended
+        """
+        with self._cond:
+            self.readers += 1
+        finished = False
+        try:
+            for chunk in events:
+                with self._cond:
+                    self._chunks.append(chunk)
+                    self._cond.notify_all()
+                yield chunk
+                if stop_event is not None and stop_event.is_set():
+                    return
+            finished = True
+        except Exception as e:
+            logger.error(f"Error in shared chat stream: {e}", exc_info=True)
+            finished = True
+        finally:
+            with self._cond:
+                self.readers -= 1
+                hand_off = not finished and self.readers > 0
+
+            if hand_off:
+                # Joined callers are still reading; finish the upstream for them
+                def produce():
+                    try:
+                        self.produce(events)
+                    finally:
+                        if on_done is not None:
+                            on_done()
+
+                threading.Thread(target=produce, name="chat-stream-tee", daemon=True).start()
+            else:
+                if not finished:
+                    # Nobody else reads; stop paying for the generation
+                    self.abort_event.set()
+                close = getattr(events, "close", None)
+                if close is not None:
+                    close()
+                with self._cond:
+                    self.done = True
+                    self._cond.notify_all()
+                if on_done is not None:
+                    on_done()
+
+    def produce(self, events: Iterator[str]):
+        try:
+            for chunk in events:
+                with self._cond:
+                    self._chunks.append(chunk)
+                    self._cond.notify_all()
+                if self.abort_event.is_set():
+                    break
+        except Exception as e:
+            logger.error(f"Error in shared chat stream: {e}", exc_info=True)
+        finally:
+            close = getattr(events, "close", None)
+            if close is not None:
+                close()
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+            connections.close_all()
+
+    def read(self, stop_event: threading.Event = None) -> Iterator[str]:
+        """
+        All chunks from the first, until the upstream ends
+
+        Args:
+            stop_event: The reader's own cancel flag (its client went away)
+        """
+        with self._cond:
+            self.readers += 1
+        index = 0
+        try:
+            while stop_event is None or not stop_event.is_set():
+                with self._cond:
+                    if index >= len(self._chunks):
+                        if self.done:
+                            return
+                        self._cond.wait(0.5)
+                        continue
+                    chunk = self._chunks[index]
+                index += 1
+                yield chunk
+        finally:
+            with self._cond:
+                self.readers -= 1
+                if self.readers == 0 and not self.done:
+                    # Last reader gone; stop paying for the generation
+                    self.abort_event.set()
+
+
+class SingleFlight:
+    """Groups of in-flight calls and streams, keyed by normalized inputs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._streams: Dict[Hashable, StreamTee] = {}
+        self.stats_counts = {"calls": 0, "shared_calls": 0, "streams": 0, "shared_streams": 0}
+
+    def do(self, key: Hashable, fn: Callable):
+        """
+        Run fn once for all concurrent callers with the same key
+
+        A caller that joins waits no longer than its request deadline and
+        then runs fn itself.
+
+        Returns:
+            fn's result (the same object for every caller sharing the flight)
+        """
+        with self._lock:
+            self.stats_counts["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.stats_counts["shared_calls"] += 1
+
+        if not leader:
+            if call.done.wait(current_provider_context().remaining()):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            return fn()
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stream(
+        self,
+        key: Hashable,
+        start: Callable[[threading.Event, dict], Iterator[str]],
+        stop_event: threading.Event = None,
+        turn_log: dict = None,
+    ) -> Iterator[str]:
+        """
+        Stream a reply, joining an identical one already in flight
+
+        Args:
+            key: Flight key (e.g. a hash of the whole prompt and provider)
+            start: Builds the upstream generator from an abort flag and a log dict
+            stop_event: The caller's cancel flag
+            turn_log: Receives the shared log; callers that joined get
+                outcome "shared" and no token counts, since they spent none
+
+        Yields:
+            The upstream's SSE chunks, from the first one
+        """
+        with self._lock:
+            self.stats_counts["streams"] += 1
+            tee = self._streams.get(key)
+            leader = tee is None
+            if leader:
+                tee = self._streams[key] = StreamTee()
+            else:
+                self.stats_counts["shared_streams"] += 1
+
+        if leader:
+            # Built here so the upstream runs in the leader's request context
+            events = iterate_in_context(start(tee.abort_event, tee.turn_log))
+
+            def forget():
+                with self._lock:
+                    if self._streams.get(key) is tee:
+                        del self._streams[key]
+
+            chunks = tee.lead(events, stop_event, forget)
+        else:
+            chunks = tee.read(stop_event)
+
+        try:
+            yield from chunks
+        finally:
+            if turn_log is not None:
+                turn_log.update(tee.turn_log)
+                if not leader:
+                    turn_log.update(outcome="shared", prompt_tokens=0, completion_tokens=0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats_counts, in_flight=len(self._calls) + len(self._streams))
+
+
+# Global instance shared by all requests in this process
+single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Get or create the global single-flight instance"""
+    global single_flight
+    if single_flight is None:
+        with _single_flight_lock:
+            if single_flight is None:
+                single_flight = SingleFlight()
+    return single_flight
@@ -0,0 +1,157 @@
+"""
+Server-Sent Events helpers for Sweet Dessert Chat Assistant
+Incremental byte-level parser for upstream provider streams and a frame
+coalescer for the downstream stream sent to the browser.
+"""
+
+import json
+import time
+from typing import Iterator, List, NamedTuple, Optional
+
+
+class SSEEvent(NamedTuple):
+    """One dispatched Server-Sent Event"""
+
+    data: str
+    event: Optional[str] = None
+    id: Optional[str] = None
+
+
+class SSEParser:
+    """
+    Incremental SSE parser over raw bytes
+
+    Bytes are appended to a single bytearray and lines are located with
+    bytearray.find from a moving read offset, so the unread remainder is never
+    copied per line. Consumed bytes are discarded in one step once they make
+    up most of the buffer. Lines are decoded only when complete, so multi-byte
+    UTF-8 characters split across network chunks are handled correctly.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offset = 0
+        self._data: List[str] = []
+        self._event = None
+        self._id = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """Consume a chunk of bytes and return the events completed by it"""
+        events = []
+        if not chunk:
+            return events
+
+        buffer = self._buffer
+        buffer += chunk
+
+        while True:
+            line_end = buffer.find(b"\n", self._offset)
+            if line_end == -1:
+                break
+
+            end = line_end
+            if end > self._offset and buffer[end - 1] == 0x0D:  # strip \r of \r\n
+                end -= 1
+            line = buffer[self._offset:end]
+            self._offset = line_end + 1
+
+            event = self._process_line(line)
+            if event is not None:
+                events.append(event)
+
+        # Compact once the consumed prefix dominates the buffer
+        if self._offset and self._offset * 2 >= len(buffer):
+            del buffer[: self._offset]
+            self._offset = 0
+
+        return events
+
+    def _process_line(self, line) -> Optional[SSEEvent]:
+        if not line:
+            return self._dispatch()
+        if line[:1] == b":":
+            return None  # comment / keep-alive
+
+        field, sep, value = line.partition(b":")
+        if sep and value[:1] == b" ":
+            value = value[1:]
+
+        if field == b"data":
+            self._data.append(value.decode("utf-8", errors="replace"))
+        elif field == b"event":
+            self._event = value.decode("utf-8", errors="replace")
+        elif field == b"id":
+            self._id = value.decode("utf-8", errors="replace")
+        return None
+
+    def _dispatch(self) -> Optional[SSEEvent]:
+        if not self._data:
+            self._event = None
+            return None
+        event = SSEEvent("\n".join(self._data), self._event, self._id)
+        self._data = []
+        self._event = None
+        return event
+
+    def close(self) -> List[SSEEvent]:
+        """Flush a trailing event that was not terminated by a blank line"""
+        if self._offset < len(self._buffer):
+            tail = bytes(self._buffer[self._offset:])
+            self._buffer.clear()
+            self._offset = 0
+            self._process_line(tail.rstrip(b"\r"))
+        event = self._dispatch()
+        return [event] if event is not None else []
+
+
+def iter_sse_events(byte_chunks) -> Iterator[SSEEvent]:
+    """Parse an iterable of byte chunks into SSE events"""
+    parser = SSEParser()
+    for chunk in byte_chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def format_sse(payload, event_id: str = None) -> str:
+    """Format a downstream SSE frame; dict payloads are JSON encoded"""
+    data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}data: {data}\n\n"
+
+
+class ContentCoalescer:
+    """
+    Merges token deltas into fewer downstream content frames
+
+    A frame is emitted once `interval` seconds have passed since the last
+    frame or `max_chars` characters are pending, whichever comes first. With
+    interval 0 every delta becomes its own frame (no coalescing).
+    """
+
+    def __init__(self, interval: float = 0.0, max_chars: int = 64):
+        self.interval = interval
+        self.max_chars = max_chars
+        self._pending: List[str] = []
+        self._pending_chars = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, content: str) -> Optional[str]:
+        """Queue a delta; returns merged content when a frame is due"""
+        if self.interval <= 0:
+            return content
+        self._pending.append(content)
+        self._pending_chars += len(content)
+        now = time.monotonic()
+        if self._pending_chars >= self.max_chars or now - self._last_flush >= self.interval:
+            return self.flush(now)
+        return None
+
+    def flush(self, now: float = None) -> Optional[str]:
+        """Return and clear whatever is pending"""
+        if not self._pending:
+            return None
+        merged = "".join(self._pending)
+        self._pending = []
+        self._pending_chars = 0
+        self._last_flush = now if now is not None else time.monotonic()
+        return merged
@@ -0,0 +1,234 @@
+"""
+Resumable chat streams for Sweet Dessert Chat Assistant
+A chat reply is generated by a producer thread into a bounded replay buffer
+instead of straight into the response. Every frame gets an SSE id of the form
+"<stream id>:<sequence>", so a client whose connection dropped can reconnect
+with Last-Event-ID and receive only the frames it missed, from a generation
+that kept running or has just finished, without a second intent call, LLM
+call or cart change. Buffers live in this worker's memory for a short TTL.
+While a reply generates with no reader attached it holds an admission slot,
+and the frames it produces are counted as unattended.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Iterator, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections
+
+from .admission import get_admission_controller
+from .chat_metrics import record_unattended_frames
+
+logger = logging.getLogger(__name__)
+
+DONE_FRAME = "data: [DONE]\n\n"
+
+
+def parse_event_id(value: str) -> Optional[Tuple[str, int]]:
+    """Split a Last-Event-ID value into (stream id, sequence)"""
+    stream_id, _, seq = (value or "").strip().rpartition(":")
+    if not stream_id or not seq.isdigit():
+        return None
+    return stream_id, int(seq)
+
+
+class ReplayStream:
+    """
+    Frames of one chat reply, readable from any position still buffered
+
+    Attributes:
+        stream_id: Random id, the first half of every event id
+        owner: Session key allowed to resume the stream
+        abort_event: Cancels the upstream LLM stream of the turn
+    """
+
+    def __init__(self, stream_id: str, owner: str, abort_event: threading.Event, max_frames: int):
+        self.stream_id = stream_id
+        self.owner = owner
+        self.abort_event = abort_event
+        self._frames = deque(maxlen=max_frames)
+        self._next_seq = 0
+        self._cond = threading.Condition()
+        self.done = False
+        self.readers = 0
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self._detached_at = time.monotonic()
+        # True while generating with no reader; the stream then holds an admission slot
+        self._holds_slot = False
+        self.unattended_frames = 0
+
+    @property
+    def first_seq(self) -> int:
+        return self._next_seq - len(self._frames)
+
+    def append(self, chunk: str):
+        with self._cond:
+            if self._holds_slot:
+                self.unattended_frames += 1
+            seq = self._next_seq
+            self._frames.append(f"id: {self.stream_id}:{seq}\n{chunk}")
+            self._next_seq += 1
+            self._cond.notify_all()
+
+    def finish(self):
+        with self._cond:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._release_slot()
+            self._cond.notify_all()
+        if self.unattended_frames:
+            record_unattended_frames(self.unattended_frames)
+
+    def _release_slot(self):
+        """Give back the detached slot (lock held)"""
+        if self._holds_slot:
+            self._holds_slot = False
+            get_admission_controller().release_detached_chat()
+
+    def unattended_for(self) -> float:
+        """Seconds since the last reader detached (0 while someone is reading)"""
+        with self._cond:
+            return 0.0 if self.readers else time.monotonic() - self._detached_at
+
+    def can_resume_from(self, seq: int) -> bool:
+        with self._cond:
+            return self.first_seq <= seq <= self._next_seq
+
+    def read(self, start: int, detach_event: threading.Event) -> Iterator[str]:
+        """
+        Frames from sequence `start` on, waiting for new ones until the stream ends
+
+        Args:
+            start: First sequence number to send
+            detach_event: Set by the transport when its client is gone
+        """
+        with self._cond:
+            self.readers += 1
+            # The new reader's request holds its own slot
+            self._release_slot()
+        seq = start
+        try:
+            while not detach_event.is_set():
+                with self._cond:
+                    if seq < self.first_seq:
+                        # Fell behind the bounded buffer; nothing sensible to send
+                        return
+                    if seq >= self._next_seq:
+                        if self.done:
+                            return
+                        self._cond.wait(0.5)
+                        continue
+                    frame = self._frames[seq - self.first_seq]
+                seq += 1
+                yield frame
+        finally:
+            with self._cond:
+                self.readers -= 1
+                self._detached_at = time.monotonic()
+                if not self.readers and not self.done and not self._holds_slot:
+                    self._holds_slot = True
+                    get_admission_controller().hold_detached_chat()
+
+
+class StreamReplayRegistry:
+    """Replay buffers of recent chat streams in this worker"""
+
+    def __init__(self):
+        self.ttl = getattr(settings, "CHAT_STREAM_REPLAY_TTL", 120)
+        self.max_frames = getattr(settings, "CHAT_STREAM_REPLAY_MAX_FRAMES", 4000)
+        self.grace = getattr(settings, "CHAT_STREAM_RESUME_GRACE", 20)
+        self._streams: Dict[str, ReplayStream] = {}
+        self._lock = threading.Lock()
+        self.resumed = 0
+        self.abandoned = 0
+
+    def _prune(self):
+        now = time.monotonic()
+        expired = [
+            stream_id
+            for stream_id, stream in self._streams.items()
+            if stream.finished_at is not None and now - stream.finished_at > self.ttl
+        ]
+        for stream_id in expired:
+            del self._streams[stream_id]
+
+    def start(self, events: Iterator[str], owner: str, abort_event: threading.Event) -> ReplayStream:
+        """
+        Start generating a reply into a new replay buffer
+
+        Args:
+            events: SSE frames of the turn (already bound to the request's context)
+            owner: Session key allowed to resume it
+            abort_event: The turn's upstream cancel flag
+
+        Returns:
+            The stream; read(0, ...) gives the live frames with ids
+        """
+        stream = ReplayStream(uuid.uuid4().hex[:16], owner, abort_event, self.max_frames)
+        with self._lock:
+            self._prune()
+            self._streams[stream.stream_id] = stream
+        threading.Thread(
+            target=self._produce, args=(stream, events), name="chat-stream-producer", daemon=True
+        ).start()
+        return stream
+
+    def _produce(self, stream: ReplayStream, events: Iterator[str]):
+        try:
+            for chunk in events:
+                stream.append(chunk)
+                if stream.unattended_for() > self.grace:
+                    # Nobody came back for it; stop paying for the generation
+                    logger.info("Abandoning chat stream %s with no reader", stream.stream_id)
+                    self.abandoned += 1
+                    stream.abort_event.set()
+                    break
+        except Exception as e:
+            logger.error(f"Error producing chat stream {stream.stream_id}: {e}", exc_info=True)
+            stream.append(DONE_FRAME)
+        finally:
+            close = getattr(events, "close", None)
+            if close is not None:
+                close()
+            stream.finish()
+            # Template replies query the catalog from this thread
+            connections.close_all()
+
+    def get(self, stream_id: str, owner: str) -> Optional[ReplayStream]:
+        """A buffered stream, only for the session that started it"""
+        with self._lock:
+            stream = self._streams.get(stream_id)
+        if stream is None or not owner or stream.owner != owner:
+            return None
+        self.resumed += 1
+        return stream
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._prune()
+            return {
+                "buffered": len(self._streams),
+                "running": sum(1 for s in self._streams.values() if not s.done),
+                "resumed": self.resumed,
+                "abandoned": self.abandoned,
+            }
+
+
+# Global instance shared by all requests in this process
+stream_replay = None
+_replay_lock = threading.Lock()
+
+
+def get_stream_replay() -> StreamReplayRegistry:
+    """Get or create the global replay registry instance"""
+    global stream_replay
+    if stream_replay is None:
+        with _replay_lock:
+            if stream_replay is None:
+                stream_replay = StreamReplayRegistry()
+    return stream_replay
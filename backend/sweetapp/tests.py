@@ -1,3 +1,635 @@
-from django.test import TestCase
+"""
+Tests for the Sweet Dessert Chat Assistant building blocks
+Run with `python manage.py test sweetapp`.
+"""
 
-# Create your tests here.
+import json
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.signed_cookies import SessionStore as CookieSessionStore
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .admission import AdmissionController, AdmissionRejected
+from .chat_cart import SessionCart
+from .chat_sketches import CountMinSketch, HeavyHitters, SpaceSaving, normalize_query
+from .chat_templates import render_cart_update, render_product_info, render_product_list
+from .models import Category, DessertItem, TokenUsage
+from .product_mentions import MentionAutomaton, MentionMatcher
+from .prompt_budget import MESSAGE_OVERHEAD, count_tokens, pack_prompt, truncate_to_tokens
+from .provider_guard import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, TokenBucket, key_fingerprint
+from .session_backend import SessionStore
+from .single_flight import SingleFlight
+from .sse import ContentCoalescer, SSEParser
+from .token_meter import ECONOMY, EXHAUSTED, NORMAL, TokenMeter
+
+
+def create_product(name, price, **fields):
+    category, _ = Category.objects.get_or_create(name="Cakes", slug="cakes")
+    slug = name.lower().replace(" ", "-")
+    defaults = {"description": f"{name} description", "image": f"/images/{slug}.jpg", "preparation_time": 20}
+    defaults.update(fields)
+    return DessertItem.objects.create(name=name, slug=slug, price=Decimal(price), category=category, **defaults)
+
+
+class SSEParserTests(TestCase):
+    def test_events_split_across_chunks(self):
+        parser = SSEParser()
+        self.assertEqual(parser.feed(b"data: hel"), [])
+        events = parser.feed(b"lo\r\n\r\ndata: a\ndata: b\n\n")
+        self.assertEqual([event.data for event in events], ["hello", "a\nb"])
+
+    def test_multibyte_character_split_between_chunks(self):
+        parser = SSEParser()
+        encoded = "data: crème brûlée\n\n".encode("utf-8")
+        split = encoded.index("è".encode("utf-8")) + 1
+        self.assertEqual(parser.feed(encoded[:split]), [])
+        self.assertEqual(parser.feed(encoded[split:])[0].data, "crème brûlée")
+
+    def test_comments_event_and_id_fields(self):
+        parser = SSEParser()
+        events = parser.feed(b": keep-alive\n\nevent: update\nid: 7\ndata: {}\n\n")
+        self.assertEqual(len(events), 1)
+        self.assertEqual((events[0].event, events[0].id, events[0].data), ("update", "7", "{}"))
+
+    def test_close_flushes_unterminated_event(self):
+        parser = SSEParser()
+        parser.feed(b"data: [DONE]")
+        self.assertEqual([event.data for event in parser.close()], ["[DONE]"])
+        self.assertEqual(parser.close(), [])
+
+
+class ContentCoalescerTests(TestCase):
+    def test_no_interval_passes_every_delta_through(self):
+        coalescer = ContentCoalescer(interval=0)
+        self.assertEqual(coalescer.add("a"), "a")
+        self.assertIsNone(coalescer.flush())
+
+    def test_merges_until_max_chars(self):
+        coalescer = ContentCoalescer(interval=60, max_chars=5)
+        self.assertIsNone(coalescer.add("ab"))
+        self.assertIsNone(coalescer.add("cd"))
+        self.assertEqual(coalescer.add("ef"), "abcdef")
+        self.assertIsNone(coalescer.flush())
+
+    def test_flush_returns_pending(self):
+        coalescer = ContentCoalescer(interval=60, max_chars=100)
+        coalescer.add("tail")
+        self.assertEqual(coalescer.flush(), "tail")
+
+
+class PromptBudgetTests(TestCase):
+    def test_count_tokens(self):
+        self.assertEqual(count_tokens(""), 0)
+        self.assertEqual(count_tokens("hello world"), 4)
+        self.assertEqual(count_tokens("I'm here"), 3)
+        # Non-Latin text counts one token per character
+        self.assertEqual(count_tokens("🍰🍰"), 2)
+
+    def test_truncate_to_tokens(self):
+        text = "one two three four five six seven eight"
+        truncated = truncate_to_tokens(text, 5)
+        self.assertTrue(truncated.endswith("..."))
+        self.assertLessEqual(count_tokens(truncated), 5)
+        self.assertEqual(truncate_to_tokens(text, 100), text)
+        self.assertEqual(truncate_to_tokens(text, 0), "")
+
+    def test_everything_fits(self):
+        history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+        packed = pack_prompt(
+            "instructions",
+            "message",
+            context_chunks=[{"text": "chunk", "distance": 0.1}],
+            faq_context=[{"question": "q", "answer": "a", "score": 1}],
+            history=history,
+            total_budget=1000,
+        )
+        self.assertEqual(len(packed.context_chunks), 1)
+        self.assertEqual(len(packed.faq_context), 1)
+        self.assertEqual(packed.history, history)
+        self.assertLessEqual(packed.token_counts["total"], 1000)
+
+    def test_most_relevant_context_and_newest_history_are_kept(self):
+        chunks = [
+            {"text": "far " * 200, "distance": 0.9},
+            {"text": "near", "distance": 0.1},
+        ]
+        history = [{"role": "user", "content": f"turn {i} " + "word " * 30} for i in range(20)]
+        packed = pack_prompt("instructions", "message", context_chunks=chunks, history=history, total_budget=300)
+        self.assertEqual(packed.context_chunks[0]["text"], "near")
+        self.assertLess(len(packed.history), len(history))
+        self.assertTrue(packed.history[-1]["content"].startswith("turn 19"))
+        self.assertLessEqual(packed.token_counts["total"], 300)
+
+    def test_message_is_always_counted(self):
+        packed = pack_prompt("", "a long message " * 50, history=[{"role": "user", "content": "x"}], total_budget=10)
+        self.assertEqual(packed.history, [])
+        self.assertEqual(packed.token_counts["message"], count_tokens("a long message " * 50) + MESSAGE_OVERHEAD)
+
+
+class TokenBucketTests(TestCase):
+    def test_refills_at_rate_up_to_capacity(self):
+        with mock.patch("sweetapp.provider_guard.time.monotonic", return_value=100.0) as monotonic:
+            bucket = TokenBucket(rate=2, capacity=3)
+            for _ in range(3):
+                self.assertTrue(bucket.try_acquire())
+            self.assertFalse(bucket.try_acquire())
+            self.assertAlmostEqual(bucket.wait_time(), 0.5)
+
+            monotonic.return_value = 100.5
+            self.assertTrue(bucket.try_acquire())
+
+            monotonic.return_value = 200.0
+            self.assertEqual(bucket.peek(), 3)
+
+
+class CircuitBreakerTests(TestCase):
+    def test_opens_after_threshold_and_half_opens_after_cooldown(self):
+        with mock.patch("sweetapp.provider_guard.time.time", return_value=1000.0) as now:
+            breaker = CircuitBreaker(threshold=2, cooldown=30)
+            breaker.on_failure()
+            self.assertTrue(breaker.allows())
+            breaker.on_failure()
+            self.assertEqual(breaker.state, OPEN)
+            self.assertFalse(breaker.allows())
+
+            now.return_value = 1031.0
+            self.assertTrue(breaker.allows())
+            self.assertEqual(breaker.state, HALF_OPEN)
+            breaker.on_success()
+            self.assertEqual(breaker.state, CLOSED)
+
+    def test_half_open_probe_expires(self):
+        with mock.patch("sweetapp.provider_guard.time.time", return_value=1000.0) as now:
+            breaker = CircuitBreaker(threshold=1, cooldown=30)
+            breaker.on_failure()
+            now.return_value = 1031.0
+            self.assertTrue(breaker.allows())
+            breaker.on_attempt()
+            # Only one probe at a time
+            self.assertFalse(breaker.allows())
+
+            # A probe that never reported back stops blocking after a cooldown
+            now.return_value = 1062.0
+            self.assertTrue(breaker.allows())
+
+    def test_failed_probe_reopens(self):
+        with mock.patch("sweetapp.provider_guard.time.time", return_value=1000.0) as now:
+            breaker = CircuitBreaker(threshold=3, cooldown=30)
+            breaker.state = OPEN
+            breaker.opened_at = 900.0
+            self.assertTrue(breaker.allows())
+            breaker.on_attempt()
+            breaker.on_failure()
+            self.assertEqual(breaker.state, OPEN)
+            self.assertEqual(breaker.retry_in(), 30)
+            now.return_value = 1010.0
+            self.assertFalse(breaker.allows())
+
+
+class SketchTests(TestCase):
+    def test_count_min_never_undercounts(self):
+        sketch = CountMinSketch(width=16, depth=3)
+        for i in range(200):
+            sketch.add(f"key {i % 40}")
+        sketch.add("hot", 50)
+        self.assertGreaterEqual(sketch.estimate("hot"), 50)
+        for i in range(40):
+            self.assertGreaterEqual(sketch.estimate(f"key {i}"), 5)
+        self.assertEqual(sketch.total, 250)
+
+    def test_space_saving_keeps_frequent_keys(self):
+        counter = SpaceSaving(capacity=4)
+        for i in range(100):
+            counter.add("frequent")
+            counter.add(f"rare {i}")
+        self.assertEqual(len(counter.counters), 4)
+        key, count, error = counter.top(1)[0]
+        self.assertEqual(key, "frequent")
+        self.assertGreaterEqual(count, 100)
+        self.assertLessEqual(count - error, 100)
+
+    def test_heavy_hitters_tighten_counts(self):
+        hitters = HeavyHitters(capacity=2, width=1024, depth=4)
+        for _ in range(10):
+            hitters.add("cake")
+        for _ in range(5):
+            hitters.add("pie")
+        hitters.add("tart")
+        top = hitters.top()
+        self.assertEqual(top[0], ("cake", 10))
+        self.assertEqual(len(top), 2)
+        self.assertEqual(hitters.estimate("pie"), 5)
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("  Chocolate   CAKE?! "), "chocolate cake")
+
+
+class SessionCartTests(TestCase):
+    def setUp(self):
+        self.cake = create_product("Chocolate Dream Cake", "20.00")
+        self.cupcake = create_product("Vanilla Cupcake", "10.00")
+        self.session = CookieSessionStore()
+
+    def test_quote_with_delivery_fee(self):
+        cart = SessionCart(self.session)
+        cart.add(self.cupcake.id)
+        quote = cart.quote()
+        self.assertEqual(quote["subtotal"], "10.00")
+        self.assertEqual(quote["delivery_fee"], "4.99")
+        self.assertEqual(quote["tax"], "0.80")
+        self.assertEqual(quote["total"], "15.79")
+
+    def test_quote_free_delivery_and_takeaway(self):
+        cart = SessionCart(self.session)
+        cart.add(self.cake.id)
+        cart.add(self.cupcake.id)
+        quote = cart.quote()
+        self.assertEqual(quote["delivery_fee"], "0.00")
+        self.assertEqual(quote["total"], "32.40")
+
+        cart.remove(next(iter(cart._items)))
+        self.assertEqual(cart.quote("takeaway")["delivery_fee"], "0.00")
+
+    def test_customized_lines_are_separate(self):
+        cart = SessionCart(self.session)
+        plain, _ = cart.add(self.cake.id, 2)
+        custom, _ = cart.add(self.cake.id, 1, {"message": "Happy birthday"})
+        self.assertNotEqual(plain, custom)
+        self.assertEqual(cart.add(self.cake.id)[1], 3)
+        self.assertEqual(len(cart), 2)
+        self.assertEqual(cart.item_count, 4)
+
+    def test_unavailable_lines_are_flagged_not_charged(self):
+        cart = SessionCart(self.session)
+        cart.add(self.cake.id)
+        cart.add(self.cupcake.id)
+        DessertItem.objects.filter(pk=self.cake.pk).update(available=False)
+        quote = cart.quote("takeaway")
+        self.assertEqual(quote["subtotal"], "10.00")
+        self.assertEqual(len(quote["unavailable"]), 1)
+
+    def test_legacy_cart_is_converted(self):
+        self.session["cart"] = [
+            {"name": "vanilla cupcake", "price": "N/A", "quantity": 2},
+            {"id": self.cake.id, "name": "x", "quantity": 1},
+        ]
+        cart = SessionCart(self.session)
+        self.assertEqual(cart.item_count, 3)
+        self.assertEqual({line["name"] for line in cart.lines()}, {"Vanilla Cupcake", "Chocolate Dream Cake"})
+
+
+class AddToCartViewTests(TestCase):
+    def setUp(self):
+        self.cake = create_product("Chocolate Dream Cake", "20.00")
+        self.factory = RequestFactory()
+
+    def post(self, body):
+        # Imported here: the chat views load the vector database client
+        from .chat_views import add_to_cart
+
+        request = self.factory.post("/api/chat/add-to-cart/", body, content_type="application/json")
+        request.user = AnonymousUser()
+        return SessionMiddleware(add_to_cart)(request)
+
+    def test_rejects_invalid_bodies(self):
+        for body in ("[1, 2]", "not json"):
+            self.assertEqual(self.post(body).status_code, 400)
+        self.assertEqual(self.post(json.dumps({"product_id": "abc"})).status_code, 400)
+        self.assertEqual(self.post(json.dumps({"product_id": self.cake.id, "quantity": "x"})).status_code, 400)
+        response = self.post(json.dumps({"product_id": self.cake.id, "customizations": "extra cream"}))
+        self.assertEqual(response.status_code, 400)
+
+    def test_adds_product(self):
+        response = self.post(json.dumps({"product_id": self.cake.id, "quantity": 2}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.post(json.dumps({"product_id": 999999})).status_code, 404)
+
+
+@override_settings(
+    ADMISSION_SLOTS=2, ADMISSION_RESERVED_SLOTS=1, CHAT_ADMISSION_QUEUE=1, CHAT_ADMISSION_QUEUE_SECONDS=0.2
+)
+class AdmissionControllerTests(TestCase):
+    def test_queue_full(self):
+        controller = AdmissionController()
+        controller.acquire_chat()
+        queued = threading.Thread(target=lambda: self._acquire_or_none(controller))
+        queued.start()
+        while not controller._waiters:
+            time.sleep(0.01)
+        with self.assertRaises(AdmissionRejected) as rejected:
+            controller.acquire_chat()
+        self.assertEqual(rejected.exception.reason, "queue_full")
+        self.assertEqual(controller.shed["queue_full"], 1)
+
+        # Releasing hands the slot to the queued request
+        controller.release_chat(1.0)
+        queued.join()
+        self.assertEqual(self.result, 0)
+        self.assertEqual(controller.stats()["chat_in_flight"], 1)
+
+    def _acquire_or_none(self, controller):
+        try:
+            controller.acquire_chat()
+            self.result = 0
+        except AdmissionRejected as rejected:
+            self.result = rejected.reason
+
+    def test_queue_timeout(self):
+        controller = AdmissionController()
+        controller.acquire_chat()
+        with self.assertRaises(AdmissionRejected) as rejected:
+            controller.acquire_chat()
+        self.assertEqual(rejected.exception.reason, "queue_timeout")
+        self.assertEqual(controller.shed["queue_timeout"], 1)
+        self.assertGreaterEqual(rejected.exception.retry_after, 1)
+        self.assertEqual(controller.stats()["chat_queued"], 0)
+
+    def test_priority_requests_shrink_chat_share(self):
+        controller = AdmissionController()
+        controller.acquire_priority()
+        controller.acquire_chat()
+        self.assertEqual(controller.stats()["chat_in_flight"], 1)
+        with self.assertRaises(AdmissionRejected):
+            controller.acquire_chat()
+        controller.release_priority()
+        controller.release_chat()
+        self.assertEqual(controller.stats()["chat_in_flight"], 0)
+
+
+class SingleFlightTests(TestCase):
+    def test_concurrent_calls_share_one_result(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return ["result"]
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do("key", slow)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(flight.do("key", slow)))
+        follower.start()
+        while flight.stats_counts["shared_calls"] == 0:
+            time.sleep(0.01)
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(calls), 1)
+        self.assertIs(results[0], results[1])
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_errors_reach_every_caller(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            flight.do("key", fail)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_stream_without_followers_needs_no_thread(self):
+        flight = SingleFlight()
+
+        def start(abort_event, turn_log):
+            turn_log["outcome"] = "success"
+            return iter(["a", "b"])
+
+        threads = threading.active_count()
+        turn_log = {}
+        self.assertEqual(list(flight.stream("key", start, turn_log=turn_log)), ["a", "b"])
+        self.assertEqual(threading.active_count(), threads)
+        self.assertEqual(turn_log["outcome"], "success")
+
+    def test_follower_reads_stream_from_the_start(self):
+        flight = SingleFlight()
+        upstream_calls = []
+
+        def start(abort_event, turn_log):
+            upstream_calls.append(1)
+
+            def events():
+                for chunk in ("a", "b", "c"):
+                    yield chunk
+                turn_log["outcome"] = "success"
+
+            return events()
+
+        leader = flight.stream("key", start)
+        self.assertEqual(next(leader), "a")
+        follower_log = {}
+        follower = flight.stream("key", start, turn_log=follower_log)
+        self.assertEqual(next(follower), "a")
+        # The leader leaves early; the follower still gets the whole reply
+        leader.close()
+        self.assertEqual(list(follower), ["b", "c"])
+        self.assertEqual(len(upstream_calls), 1)
+        self.assertEqual(follower_log["outcome"], "shared")
+
+    def test_last_reader_leaving_aborts_upstream(self):
+        flight = SingleFlight()
+        aborts = []
+
+        def start(abort_event, turn_log):
+            aborts.append(abort_event)
+            return iter(["a", "b"])
+
+        stream = flight.stream("key", start)
+        next(stream)
+        stream.close()
+        self.assertTrue(aborts[0].is_set())
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+
+@override_settings(
+    CHAT_TOKEN_BUDGET_DAILY=1000, CHAT_TOKEN_BUDGET_ECONOMY_AT=0.8, CHAT_TOKEN_USAGE_MERGE_SECONDS=3600
+)
+class TokenMeterTests(TestCase):
+    def test_budget_modes(self):
+        meter = TokenMeter()
+        self.assertEqual(meter.mode("key1"), NORMAL)
+        meter.record("openrouter", "model", "key1", "reply", 500, 300)
+        self.assertEqual(meter.mode("key1"), ECONOMY)
+        meter.record("openrouter", "model", "key1", "reply", 100, 100)
+        self.assertEqual(meter.mode("key1"), EXHAUSTED)
+        self.assertEqual(meter.mode("key2"), NORMAL)
+
+    def test_within_budget_drops_exhausted_keys(self):
+        meter = TokenMeter()
+        spent = mock.Mock(api_key="spent")
+        fresh = mock.Mock(api_key="fresh")
+        meter.record("openrouter", "model", key_fingerprint("spent"), "reply", 1000, 0)
+        self.assertEqual(meter.within_budget([spent, fresh]), ([fresh], NORMAL))
+        self.assertEqual(meter.within_budget([spent]), ([], EXHAUSTED))
+
+    def test_merge_writes_rows_and_keeps_totals(self):
+        meter = TokenMeter()
+        meter.record("openrouter", "model", "key1", "reply", 100, 50)
+        meter.record("openrouter", "model", "key1", "intent", 20, 5)
+        meter.merge()
+        self.assertEqual(TokenUsage.objects.count(), 2)
+        self.assertEqual(meter.used_today("key1"), 175)
+
+        meter.record("openrouter", "model", "key1", "reply", 10, 0)
+        meter.merge()
+        self.assertEqual(TokenUsage.objects.get(purpose="reply").calls, 2)
+        self.assertEqual(meter.used_today("key1"), 185)
+
+    def test_failed_merge_keeps_unwritten_usage(self):
+        meter = TokenMeter()
+        meter.record("openrouter", "model", "key1", "reply", 100, 50)
+        meter.record("openrouter", "model", "key1", "intent", 20, 5)
+        increment = meter._increment
+        written = []
+
+        def fail_second(combination, counters):
+            if written:
+                raise RuntimeError("database locked")
+            written.append(combination)
+            increment(combination, counters)
+
+        with mock.patch.object(meter, "_increment", side_effect=fail_second):
+            meter.merge()
+        self.assertEqual(TokenUsage.objects.count(), 1)
+        # Nothing is lost or counted twice against the budget
+        self.assertEqual(meter.used_today("key1"), 175)
+
+        meter.merge()
+        self.assertEqual(TokenUsage.objects.count(), 2)
+        self.assertEqual(meter.used_today("key1"), 175)
+
+
+class MentionMatcherTests(TestCase):
+    def setUp(self):
+        products = [{"id": 1, "name": "Chocolate Cake"}, {"id": 2, "name": "Lemon Tart"}]
+        self.automaton = MentionAutomaton(
+            {"chocolate cake": 0, "chocolate cakes": 0, "lemon tart": 1}, products
+        )
+
+    def test_name_split_across_chunks(self):
+        matcher = MentionMatcher(self.automaton)
+        self.assertEqual(matcher.feed("Try our choc"), [])
+        self.assertEqual(matcher.feed("olate ca"), [])
+        self.assertEqual(matcher.feed("ke, it's"), [{"id": 1, "name": "Chocolate Cake"}])
+
+    def test_each_product_reported_once(self):
+        matcher = MentionMatcher(self.automaton)
+        found = matcher.feed("Chocolate cake or chocolate cakes? Chocolate Cake! ")
+        self.assertEqual([product["id"] for product in found], [1])
+
+    def test_name_at_end_of_reply(self):
+        matcher = MentionMatcher(self.automaton)
+        self.assertEqual(matcher.feed("You'll love the Lemon\nTart"), [])
+        self.assertEqual([product["id"] for product in matcher.finish()], [2])
+
+    def test_only_whole_words_match(self):
+        matcher = MentionMatcher(self.automaton)
+        self.assertEqual(matcher.feed("lemon tartlets "), [])
+        self.assertEqual(matcher.finish(), [])
+
+
+class ChatTemplateTests(TestCase):
+    def setUp(self):
+        self.cake = create_product(
+            "Chocolate Dream Cake",
+            "1500.00",
+            allergens=["Wheat", "milk"],
+            dietary_info=["vegetarian"],
+            ingredients=["cocoa", "flour"],
+            preparation_time=45,
+        )
+
+    def test_price_and_preparation(self):
+        self.assertEqual(
+            render_product_info(self.cake.id, "How much is it?"), "**Chocolate Dream Cake** costs Rs. 1,500."
+        )
+        self.assertIn("45 minutes", render_product_info(self.cake.id, "how long does it take to make"))
+
+    def test_allergen_synonyms(self):
+        self.assertIn("contains Wheat", render_product_info(self.cake.id, "Does it have gluten?"))
+        self.assertIn("contains milk", render_product_info(self.cake.id, "is there dairy in it"))
+        self.assertIn("not nuts", render_product_info(self.cake.id, "any nuts?"))
+        self.assertEqual(
+            render_product_info(self.cake.id, "is it gluten-free?"),
+            "No, **Chocolate Dream Cake** contains Wheat.",
+        )
+
+    def test_unknown_allergen_is_never_answered_no(self):
+        tart = create_product("Sesame Tart", "800.00", allergens=["sesame"])
+        self.assertIsNone(render_product_info(tart.id, "does it contain nuts?"))
+
+    def test_missing_details_fall_back(self):
+        plain = create_product("Plain Bun", "100.00")
+        self.assertIsNone(render_product_info(plain.id, "what are the ingredients?"))
+        self.assertIsNone(render_product_info(999999, "price?"))
+
+    def test_list_and_cart_update(self):
+        products = [{"name": "Chocolate Dream Cake", "price": "1500.00"}, {"name": "Lemon Tart", "price": 799.5}]
+        rendered = render_product_list(products, "Cakes")
+        self.assertIn("Here are our cakes:", rendered)
+        self.assertIn("2. **Lemon Tart** — Rs. 799.50", rendered)
+        self.assertIsNone(render_product_list([]))
+
+        cart = [{"name": "Chocolate Dream Cake", "price": "1500.00", "quantity": 2}]
+        reply = render_cart_update(products[0], 2, cart)
+        self.assertIn("2 items, Rs. 3,000 in total", reply)
+
+
+@override_settings(SESSION_WRITE_INTERVAL=300)
+class SessionStoreTests(TestCase):
+    def assertSessionWritten(self, session):
+        with CaptureQueriesContext(connection) as queries:
+            session.save()
+        self.assertTrue(any(query["sql"].startswith("UPDATE") for query in queries.captured_queries))
+
+    def test_unchanged_save_skips_database(self):
+        session = SessionStore()
+        session["cart"] = {"v": 2, "items": {}}
+        session.create()
+
+        session = SessionStore(session.session_key)
+        session.load()
+        with self.assertNumQueries(0):
+            session.save()
+
+    def test_changed_data_is_written(self):
+        session = SessionStore()
+        session["step"] = 1
+        session.create()
+
+        session = SessionStore(session.session_key)
+        session["step"] = 2
+        self.assertSessionWritten(session)
+        self.assertEqual(SessionStore.get_model_class().objects.get().get_decoded()["step"], 2)
+
+    def test_old_write_is_refreshed(self):
+        session = SessionStore()
+        session["step"] = 1
+        session.create()
+
+        session = SessionStore(session.session_key)
+        session.load()
+        with mock.patch("sweetapp.session_backend.time.time", return_value=time.time() + 301):
+            self.assertSessionWritten(session)
+
+    def test_delete_forgets_write_marker(self):
+        session = SessionStore()
+        session["step"] = 1
+        session.create()
+        key = session.session_key
+        session.delete()
+        self.assertIsNone(session._cache.get(session._meta_key(key)))
+        self.assertFalse(SessionStore().exists(key))
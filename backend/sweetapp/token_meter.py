@@ -0,0 +1,333 @@
+"""
+Token usage metering for Sweet Dessert Chat Assistant
+Records the prompt and completion tokens of every provider call (intent
+analysis and chat replies), taken from the provider's usage object or counted
+locally when a provider sends none. Each worker sums calls per day, provider,
+model, API key fingerprint, purpose and intent in memory and periodically
+merges them into the TokenUsage table, one row per combination and day.
+
+The daily totals per key drive the token budget: above
+CHAT_TOKEN_BUDGET_ECONOMY_AT of CHAT_TOKEN_BUDGET_DAILY a key runs in economy
+mode (local intent classification, shorter replies); at the budget it is
+exhausted and no longer used for provider calls until the next day.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import TokenUsage
+from .provider_guard import key_fingerprint
+
+logger = logging.getLogger(__name__)
+
+NORMAL = "normal"
+ECONOMY = "economy"
+EXHAUSTED = "exhausted"
+
+# Order of the per-combination counters
+_CALLS, _ESTIMATED, _PROMPT, _COMPLETION = range(4)
+
+
+def usage_tokens(usage: dict) -> Tuple[int, int]:
+    """(prompt, completion) tokens from an OpenAI-compatible usage object, 0 when missing"""
+    usage = usage or {}
+    return int(usage.get("prompt_tokens") or 0), int(usage.get("completion_tokens") or 0)
+
+
+class TokenMeter:
+    """
+    Per-worker token totals merged into TokenUsage, with daily budgets per key
+
+    A key's spend for budgeting is today's merged table total (re-read at
+    every merge, so it includes other workers) plus this worker's unmerged
+    calls. Other workers' calls therefore count after at most one merge
+    interval.
+    """
+
+    def __init__(self):
+        self.daily_budget = getattr(settings, "CHAT_TOKEN_BUDGET_DAILY", 0)
+        self.economy_at = getattr(settings, "CHAT_TOKEN_BUDGET_ECONOMY_AT", 0.8)
+        self.merge_interval = getattr(settings, "CHAT_TOKEN_USAGE_MERGE_SECONDS", 60)
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._last_merge = time.monotonic()
+        # (day, provider, model, key, purpose, intent) -> [calls, estimated, prompt, completion]
+        self._pending: Dict[tuple, List[int]] = defaultdict(lambda: [0, 0, 0, 0])
+        self._pending_by_key: Counter = Counter()  # (day, key) -> unmerged tokens
+        self._merged_day = None
+        self._merged_by_key: Dict[str, int] = {}
+        self.degraded_calls = Counter()
+
+    def record(
+        self,
+        provider: str,
+        model: str,
+        key: str,
+        purpose: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        intent: str = "",
+        estimated: bool = False,
+    ):
+        """
+        Count one provider call; may start a background merge
+
+        Args:
+            provider: Provider name (openrouter/cerebras)
+            model: Model that answered
+            key: API key fingerprint (provider_guard.key_fingerprint)
+            purpose: "intent" or "reply"
+            prompt_tokens: Prompt tokens billed (or counted locally)
+            completion_tokens: Completion tokens billed (or counted locally)
+            intent: Intent of the chat turn
+            estimated: True when the counts are local, not the provider's
+        """
+        if not provider or not key:
+            return
+        day = timezone.localdate()
+        with self._lock:
+            counters = self._pending[(day, provider, model or "", key, purpose, (intent or "")[:30])]
+            counters[_CALLS] += 1
+            counters[_ESTIMATED] += int(estimated)
+            counters[_PROMPT] += prompt_tokens
+            counters[_COMPLETION] += completion_tokens
+            self._pending_by_key[(day, key)] += prompt_tokens + completion_tokens
+        self._maybe_merge()
+
+    def _maybe_merge(self):
+        with self._lock:
+            merge_due = time.monotonic() - self._last_merge >= self.merge_interval
+            if merge_due:
+                self._last_merge = time.monotonic()
+        if merge_due:
+            threading.Thread(target=self.merge, daemon=True, name="token-usage-merge").start()
+
+    def used_today(self, key: str) -> int:
+        """Tokens spent today with a key, across workers (as of the last merge)"""
+        today = timezone.localdate()
+        if self._merged_day != today:
+            # First check of the day in this worker; one small query
+            self._load_totals(today)
+        with self._lock:
+            return self._merged_by_key.get(key, 0) + self._pending_by_key.get((today, key), 0)
+
+    def mode(self, key: str) -> str:
+        """
+        Budget mode of an API key fingerprint
+
+        Returns:
+            NORMAL, ECONOMY (past the economy threshold) or EXHAUSTED
+            (daily budget spent); always NORMAL without a budget
+        """
+        if not self.daily_budget or not key:
+            return NORMAL
+        self._maybe_merge()
+        try:
+            used = self.used_today(key)
+        except Exception as e:
+            logger.error("Failed to read token usage: %s", e)
+            return NORMAL
+        if used >= self.daily_budget:
+            return EXHAUSTED
+        if used >= self.daily_budget * self.economy_at:
+            return ECONOMY
+        return NORMAL
+
+    def within_budget(self, targets: list) -> Tuple[list, str]:
+        """
+        Drop provider targets whose key has spent its daily budget
+
+        Args:
+            targets: ProviderTargets, best first
+
+        Returns:
+            (remaining targets, budget mode of the first one); the mode is
+            EXHAUSTED when no target is left
+        """
+        if not self.daily_budget:
+            return targets, NORMAL
+        modes = [(target, self.mode(key_fingerprint(target.api_key))) for target in targets]
+        remaining = [target for target, mode in modes if mode != EXHAUSTED]
+        if not remaining:
+            return [], EXHAUSTED
+        return remaining, next(mode for _target, mode in modes if mode != EXHAUSTED)
+
+    def note_degraded(self, purpose: str, mode: str):
+        """Count a call that was shortened or skipped because of the budget"""
+        with self._lock:
+            self.degraded_calls[f"{purpose}_{mode}"] += 1
+
+    def _load_totals(self, day: date, merged_by_key: Counter = None):
+        """
+        Re-read a day's per-key totals from the table
+
+        Args:
+            merged_by_key: Unmerged counts just written to the table; taken
+                off the pending totals together with the swap so they are
+                never counted twice or missed
+        """
+        totals = {
+            row["key"]: (row["prompt"] or 0) + (row["completion"] or 0)
+            for row in TokenUsage.objects.filter(day=day)
+            .values("key")
+            .annotate(prompt=Sum("prompt_tokens"), completion=Sum("completion_tokens"))
+        }
+        with self._lock:
+            self._merged_by_key = totals
+            self._merged_day = day
+            if merged_by_key:
+                self._pending_by_key.subtract(merged_by_key)
+                self._pending_by_key = +self._pending_by_key
+
+    def merge(self):
+        """Add unmerged counts to the table rows and re-read today's per-key totals"""
+        if not self._merge_lock.acquire(blocking=False):
+            return  # another merge is running
+        try:
+            with self._lock:
+                pending, self._pending = self._pending, defaultdict(lambda: [0, 0, 0, 0])
+                self._last_merge = time.monotonic()
+            written = Counter()
+            unwritten = dict(pending)
+            try:
+                for combination, counters in pending.items():
+                    self._increment(combination, counters)
+                    del unwritten[combination]
+                    day, _provider, _model, key, _purpose, _intent = combination
+                    written[(day, key)] += counters[_PROMPT] + counters[_COMPLETION]
+            except Exception as e:
+                logger.error("Failed to merge token usage: %s", e)
+                with self._lock:
+                    # Retried at the next merge; meanwhile still counted against the budget as pending
+                    for combination, counters in unwritten.items():
+                        requeued = self._pending[combination]
+                        for index, value in enumerate(counters):
+                            requeued[index] += value
+            try:
+                self._load_totals(timezone.localdate(), written)
+            except Exception as e:
+                logger.error("Failed to read token usage: %s", e)
+                with self._lock:
+                    # Move what was written to the merged totals until the next read
+                    for (day, key), tokens in written.items():
+                        if day == self._merged_day:
+                            self._merged_by_key[key] = self._merged_by_key.get(key, 0) + tokens
+                    self._pending_by_key.subtract(written)
+                    self._pending_by_key = +self._pending_by_key
+        finally:
+            close_old_connections()
+            self._merge_lock.release()
+
+    def _increment(self, combination: tuple, counters: List[int]):
+        day, provider, model, key, purpose, intent = combination
+        rows = TokenUsage.objects.filter(
+            day=day, provider=provider, model=model, key=key, purpose=purpose, intent=intent
+        )
+        increments = {
+            "calls": F("calls") + counters[_CALLS],
+            "estimated_calls": F("estimated_calls") + counters[_ESTIMATED],
+            "prompt_tokens": F("prompt_tokens") + counters[_PROMPT],
+            "completion_tokens": F("completion_tokens") + counters[_COMPLETION],
+        }
+        if rows.update(**increments):
+            return
+        try:
+            with transaction.atomic():
+                TokenUsage.objects.create(
+                    day=day,
+                    provider=provider,
+                    model=model,
+                    key=key,
+                    purpose=purpose,
+                    intent=intent,
+                    calls=counters[_CALLS],
+                    estimated_calls=counters[_ESTIMATED],
+                    prompt_tokens=counters[_PROMPT],
+                    completion_tokens=counters[_COMPLETION],
+                )
+        except IntegrityError:
+            # Another worker created the row first
+            rows.update(**increments)
+
+    def report(self, since: date = None) -> dict:
+        """
+        Token totals from the table plus this worker's unmerged calls
+
+        Args:
+            since: First day to include (default: today)
+
+        Returns:
+            Totals overall and by provider/model, purpose, intent and key, and
+            today's spend and budget mode of each of those keys
+        """
+        since = since or timezone.localdate()
+        groups = {"by_model": {}, "by_purpose": {}, "by_intent": {}, "by_key": {}}
+        total = {"calls": 0, "estimated_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+        def add(provider, model, key, purpose, intent, calls, estimated, prompt, completion):
+            for group, name in (
+                ("by_model", f"{provider}:{model}"),
+                ("by_purpose", purpose),
+                ("by_intent", intent or "-"),
+                ("by_key", key),
+            ):
+                entry = groups[group].setdefault(name, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+                entry["calls"] += calls
+                entry["prompt_tokens"] += prompt
+                entry["completion_tokens"] += completion
+            total["calls"] += calls
+            total["estimated_calls"] += estimated
+            total["prompt_tokens"] += prompt
+            total["completion_tokens"] += completion
+
+        rows = TokenUsage.objects.filter(day__gte=since).values_list(
+            "provider", "model", "key", "purpose", "intent",
+            "calls", "estimated_calls", "prompt_tokens", "completion_tokens",
+        )
+        for row in rows:
+            add(*row)
+        with self._lock:
+            pending = [(combination, list(counters)) for combination, counters in self._pending.items()]
+            degraded = dict(self.degraded_calls)
+        for (day, *names), counters in pending:
+            if day >= since:
+                add(*names, *counters)
+
+        budgets = {}
+        if self.daily_budget:
+            budgets = {
+                key: {"used": self.used_today(key), "mode": self.mode(key)}
+                for key in groups["by_key"]
+            }
+        return {
+            "since": since.isoformat(),
+            "total": total,
+            **groups,
+            "daily_budget": self.daily_budget,
+            "budgets": budgets,
+            "degraded_calls": degraded,
+        }
+
+
+# Global instance shared by all requests in this process
+token_meter = None
+_meter_lock = threading.Lock()
+
+
+def get_token_meter() -> TokenMeter:
+    """Get or create the global token meter instance"""
+    global token_meter
+    if token_meter is None:
+        with _meter_lock:
+            if token_meter is None:
+                token_meter = TokenMeter()
+    return token_meter
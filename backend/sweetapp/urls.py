@@ -102,6 +102,7 @@ urlpatterns = [
     path('chat/stream/', chat_views.chat_stream, name='chat_stream'),
     path('chat/add-to-cart/', chat_views.add_to_cart, name='chat_add_to_cart'),
     path('chat/cart/', chat_views.get_cart, name='chat_get_cart'),
+    path('chat/cart/quote/', chat_views.cart_quote, name='chat_cart_quote'),
     path('chat/clear-cart/', chat_views.clear_cart, name='chat_clear_cart'),
     path('chat/stats/', chat_views.chat_stats, name='chat_stats'),
     path('chat/analytics/', chat_views.chat_analytics, name='chat_analytics'),
@@ -5,6 +5,8 @@ Handles PDF processing, ChromaDB storage, and semantic search
 
 # cSpell:ignore hnsw embedder metadatas
 import os
+import threading
+from collections import OrderedDict
 import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
@@ -15,6 +17,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Recent query embeddings kept so the search and the intent classifier share one encode
+QUERY_EMBEDDING_CACHE_SIZE = 256
+
 
 class DessertVectorDB:
     """Manages vector database operations for dessert product search"""
@@ -63,6 +68,32 @@ class DessertVectorDB:
                 metadata={"hnsw:space": "cosine"}
             )
             logger.info("Created new desserts collection")
+        
+        self._query_embeddings = OrderedDict()
+        self._query_embeddings_lock = threading.Lock()
+    
+    def embed_query(self, query: str):
+        """
+        Embed a query with the MiniLM model, reusing recent results
+        
+        Args:
+            query: Text to embed
+            
+        Returns:
+            1-D numpy array (384 floats, unit length)
+        """
+        with self._query_embeddings_lock:
+            embedding = self._query_embeddings.get(query)
+            if embedding is not None:
+                self._query_embeddings.move_to_end(query)
+                return embedding
+        
+        embedding = self.embedder.encode([query], normalize_embeddings=True)[0]
+        with self._query_embeddings_lock:
+            self._query_embeddings[query] = embedding
+            while len(self._query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+                self._query_embeddings.popitem(last=False)
+        return embedding
     
     def extract_product_chunks(self, pdf_path: str) -> List[Dict[str, str]]:
         """
@@ -270,7 +301,7 @@ class DessertVectorDB:
         
         try:
             # Generate query embedding
-            query_embedding = self.embedder.encode([query]).tolist()
+            query_embedding = [self.embed_query(query).tolist()]
             
             # Search in ChromaDB
             results = self.collection.query(
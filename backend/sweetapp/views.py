@@ -18,6 +18,7 @@ from .models import (
     OurStoryPage, StoryTimeline, StoryImpact,
     FAQPage, FAQCategory, FAQItem
 )
+from .pricing import DELIVERY_FEE, FREE_DELIVERY_THRESHOLD, TAX_RATE
 from .serializers import (
     CategorySerializer, DessertItemSerializer, OrderSerializer,
     ContactSubmissionSerializer, CustomerTestimonialSerializer, ChefRecommendationSerializer,
@@ -52,8 +53,8 @@ def create_payment_intent(request):
             item_total = Decimal(str(item['price'])) * item['quantity']
             subtotal += item_total
         
-        delivery_fee = Decimal('0.00') if subtotal > 25 else Decimal('4.99')
-        tax = subtotal * Decimal('0.08')  # 8% tax
+        delivery_fee = Decimal('0.00') if subtotal > FREE_DELIVERY_THRESHOLD else DELIVERY_FEE
+        tax = subtotal * TAX_RATE
         total = subtotal + delivery_fee + tax
         
         # Convert to cents for Stripe
@@ -580,7 +581,7 @@ def create_takeaway_order(request):
         
         # No delivery fee for takeaway orders
         delivery_fee = Decimal('0.00')
-        tax = subtotal * Decimal('0.08')  # 8% tax
+        tax = subtotal * TAX_RATE
         total = subtotal + delivery_fee + tax
         
         # Create takeaway order
@@ -655,7 +656,7 @@ def create_takeaway_payment_intent(request):
             subtotal += item_total
         
         delivery_fee = Decimal('0.00')  # Free for takeaway
-        tax = subtotal * Decimal('0.08')
+        tax = subtotal * TAX_RATE
         total = subtotal + delivery_fee + tax
         
         # Convert to cents for Stripe
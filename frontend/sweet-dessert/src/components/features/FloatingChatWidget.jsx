@@ -25,6 +25,8 @@ const FloatingChatWidget = () => {
   const [isTyping, setIsTyping] = useState(false);
   const [hasUnread, setHasUnread] = useState(false);
   const messagesEndRef = useRef(null);
+  // Server-side conversation: after the first reply only the new message is sent
+  const conversationRef = useRef({ id: null, lastTurnId: null, resendHistory: false });
   const { addItem } = useCart();
 
   const scrollToBottom = () => {
@@ -83,18 +85,29 @@ const FloatingChatWidget = () => {
     try {
       const apiKey = localStorage.getItem('openrouter_api_key') || undefined;
       const apiProvider = localStorage.getItem('chat_api_provider') || 'openrouter';
-
-      const response = await fetch(`${API_BASE_URL}/chat/stream/`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        credentials: 'include',
-        body: JSON.stringify({
-          message: userMessage,
-          history: historyPayload,
-          api_provider: apiProvider,
-          api_key: apiKey,
-        }),
-      });
+      const conversation = conversationRef.current;
+      const sendHistory = !conversation.id || conversation.resendHistory;
+
+      const send = withHistory =>
+        fetch(`${API_BASE_URL}/chat/stream/`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          credentials: 'include',
+          body: JSON.stringify({
+            message: userMessage,
+            conversation_id: conversation.id || undefined,
+            last_turn_id: conversation.lastTurnId ?? undefined,
+            history: withHistory ? historyPayload : undefined,
+            api_provider: apiProvider,
+            api_key: apiKey,
+          }),
+        });
+
+      let response = await send(sendHistory);
+      if (response.status === 409 && !sendHistory) {
+        // The server lost this conversation; resend it with the full history
+        response = await send(true);
+      }
 
       if (!response.ok) throw new Error('Failed to send message');
 
@@ -189,6 +202,15 @@ const FloatingChatWidget = () => {
               continue;
             }
 
+            if (parsed.type === 'conversation') {
+              conversationRef.current = {
+                id: parsed.conversation_id,
+                lastTurnId: parsed.last_turn_id,
+                resendHistory: Boolean(parsed.reset),
+              };
+              continue;
+            }
+
             // Ignore product_list in widget — keep it compact
             if (parsed.type === 'product_list') continue;
 
@@ -28,6 +28,8 @@ import remarkGfm from "remark-gfm"
 
 const API_BASE_URL = "http://localhost:8000/api"
 const CHAT_STORAGE_KEY = "sweet-dessert-chat-history"
+const CHAT_CONVERSATION_KEY = "sweet-dessert-chat-conversation"
+const EMPTY_CONVERSATION = {id: null, lastTurnId: null, resendHistory: false}
 const DEFAULT_WELCOME_MESSAGE = {
   id: 1,
   type: "assistant",
@@ -52,6 +54,15 @@ const loadPersistedMessages = () => {
   }
 }
 
+const loadPersistedConversation = () => {
+  try {
+    const parsed = JSON.parse(localStorage.getItem(CHAT_CONVERSATION_KEY))
+    return parsed?.id ? parsed : EMPTY_CONVERSATION
+  } catch {
+    return EMPTY_CONVERSATION
+  }
+}
+
 const ChatAssistantPage = () => {
   const [messages, setMessages] = useState(() => loadPersistedMessages())
   const [inputMessage, setInputMessage] = useState("")
@@ -70,6 +81,8 @@ const ChatAssistantPage = () => {
   const messagesEndRef = useRef(null)
   const messagesContainerRef = useRef(null)
   const eventSourceRef = useRef(null)
+  // Server-side conversation: after the first reply only the new message is sent
+  const conversationRef = useRef(loadPersistedConversation())
   const {addItem} = useCart()
   const {user} = useAuth() // eslint-disable-line no-unused-vars
   const navigate = useNavigate()
@@ -199,20 +212,32 @@ const ChatAssistantPage = () => {
     ])
 
     try {
+      const conversation = conversationRef.current
+      const sendHistory = !conversation.id || conversation.resendHistory
+
       // Send message to backend with API key
-      const response = await fetch(`${API_BASE_URL}/chat/stream/`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        credentials: "include",
-        body: JSON.stringify({
-          message: userMessage,
-          history: historyPayload,
-          api_provider: apiProvider,
-          api_key: apiKey || undefined, // Send API key if available
-        }),
-      })
+      const send = withHistory =>
+        fetch(`${API_BASE_URL}/chat/stream/`, {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+          },
+          credentials: "include",
+          body: JSON.stringify({
+            message: userMessage,
+            conversation_id: conversation.id || undefined,
+            last_turn_id: conversation.lastTurnId ?? undefined,
+            history: withHistory ? historyPayload : undefined,
+            api_provider: apiProvider,
+            api_key: apiKey || undefined, // Send API key if available
+          }),
+        })
+
+      let response = await send(sendHistory)
+      if (response.status === 409 && !sendHistory) {
+        // The server lost this conversation; resend it with the full history
+        response = await send(true)
+      }
 
       if (!response.ok) {
         throw new Error("Failed to send message")
@@ -276,6 +301,19 @@ const ChatAssistantPage = () => {
             try {
               const parsed = JSON.parse(data)
 
+              if (parsed.type === "conversation") {
+                conversationRef.current = {
+                  id: parsed.conversation_id,
+                  lastTurnId: parsed.last_turn_id,
+                  resendHistory: Boolean(parsed.reset),
+                }
+                localStorage.setItem(
+                  CHAT_CONVERSATION_KEY,
+                  JSON.stringify(conversationRef.current)
+                )
+                continue
+              }
+
               // Handle auth required
               if (parsed.type === "auth_required") {
                 setIsTyping(false)
@@ -458,6 +496,8 @@ const ChatAssistantPage = () => {
     ])
     setChatSessionCart([])
     localStorage.removeItem(CHAT_STORAGE_KEY)
+    conversationRef.current = EMPTY_CONVERSATION
+    localStorage.removeItem(CHAT_CONVERSATION_KEY)
     toast.success("Chat history cleared")
   }
 